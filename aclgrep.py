@@ -6,8 +6,9 @@
    Licensed under the MIT License (MIT), see LICENSE file for details
 '''
 
-import socket, struct, sys, re, fileinput
-from optparse import OptionParser
+# modules which only some of the modes need are imported where they are used, so starting the
+# script for a quick grep does not pay for them, see the startup benchmark
+import os, sys, re, gc, time, mmap, array, atexit, bisect, collections
 
 
 PORT_NAMES = {
@@ -87,15 +88,967 @@ PORT_NAMES = {
     "xdmcp": "177"
 }
 
+# the names of PORT_NAMES the ASA only knows for one of the protocols, all others are valid for both
+TCP_PORT_NAMES = frozenset(("aol", "bgp", "chargen", "citrix-ica", "cmd", "ctiqbe", "daytime", "drip", "exec", "finger",
+                            "ftp", "ftp-data", "gopher", "h323", "hostname", "https", "ident", "imap4", "irc", "klogin",
+                            "kshell", "ldap", "ldaps", "login", "lotusnotes", "lpd", "netbios-ssn", "nntp", "onep-plain",
+                            "onep-tls", "pcanywhere-data", "pop2", "pop3", "pptp", "smtp", "sqlnet", "ssh", "telnet",
+                            "uucp", "whois", "www"))
+UDP_PORT_NAMES = frozenset(("biff", "bootpc", "bootps", "dnsix", "isakmp", "mobile-ip", "nameserver", "netbios-dgm",
+                            "netbios-ns", "non500-isakmp", "ntp", "pcanywhere-status", "radius", "radius-acct", "rip",
+                            "secureid-udp", "snmp", "snmptrap", "syslog", "tftp", "time", "who", "xdmcp"))
+
+# protocol ids used in the parsed rules, "ip" covers all of them
+PROTOCOL_NUMBERS = {
+    "ip": 0,
+    "ipv6": 0,
+    "icmp": 1,
+    "tcp": 6,
+    "udp": 17,
+    "icmp6": 58
+}
+
+# Addresses of both families share one integer representation: IPv4 addresses are plain 32 bit
+# values, IPv6 addresses have this bit set on top of their 128 bits. The bit is also set in the
+# masks of all nets, so "address & mask == net" never matches a net of the other family.
+IPV6_BIT = 1 << 128
+IPV6_ALL = IPV6_BIT - 1
+
+# number of bits of the common address space, an IPv4 net of length n is a prefix of length 97 + n
+ADDRESS_WIDTH = 129
+
+class AnyMarker:
+    """Marker for nets given as "any", "any4" or "any6". There is only a single instance of each
+       which also survives pickling, so they can always be checked with "is". The net and mask
+       tell which addresses are covered."""
+    __slots__ = ("name", "net", "mask")
+    is_any = True
+
+    def __init__(self, name, net, mask):
+        self.name = name
+        self.net = net
+        self.mask = mask
+
+    def __reduce__(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+    def contains(self, ip):
+        return ip & self.mask == self.net
+
+ANY = AnyMarker("ANY", 0, 0)
+ANY4 = AnyMarker("ANY4", 0, IPV6_BIT)
+ANY6 = AnyMarker("ANY6", IPV6_BIT, IPV6_BIT)
+
+ANY_NETS = {"any": ANY, "any4": ANY4, "any6": ANY6}
+
+class AddressSet:
+    """The addresses of an object group as sorted and merged ranges (low, high) of the common
+       representation, so checking an address is a single bisect however large the group is."""
+    __slots__ = ("lows", "highs")
+    is_any = False
+
+    def __init__(self, ranges):
+        ranges = merge_intervals(ranges)
+        self.lows = [r[0] for r in ranges]
+        self.highs = [r[1] for r in ranges]
+
+    def __eq__(self, other):
+        return isinstance(other, AddressSet) and self.lows == other.lows and self.highs == other.highs
+
+    def __hash__(self):
+        return hash(tuple(self.lows))
+
+    def ranges(self):
+        return list(zip(self.lows, self.highs))
+
+    def contains(self, ip):
+        i = bisect.bisect_right(self.lows, ip) - 1
+        return i >= 0 and ip <= self.highs[i]
+
+# a pair (net address, subnetmask) which never matches, used for nets which could not be parsed
+NEVER = (-1, 0)
+
+MAX_PORT = 0xffff
+
+def ip_to_bits(address):
+    '''Turns an IP address in dot notation into a single long value, IPv6 addresses are
+       handed over to ip6_to_bits.'''
+    if ":" in address:
+        return ip6_to_bits(address)
+    try:
+        a, b, c, d = [int(x) for x in address.split(".")]
+    except ValueError:
+        raise ValueError("Invalid IP address")
+
+    if 0 <= a <= 255 and 0 <= b <= 255 and 0 <= c <= 255 and 0 <= d <= 255:
+        return (a << 24) | (b << 16) | (c << 8) | d
+    raise ValueError("Invalid IP address")
+
+def ip6_to_bits(address):
+    '''Turns an IPv6 address into a single long value with IPV6_BIT set.'''
+    try:
+        import ipaddress
+        return IPV6_BIT | int(ipaddress.IPv6Address(address))
+    except ValueError:
+        raise ValueError("Invalid IP address")
+
+def ip_in_net(ip, net):
+    '''Checks if an IP adress is contained in a network described by a pair (net address, subnetmask).
+       All values are given as longs.'''
+    return (net[0] & net[1] == ip & net[1])
+
+def ip_and_mask_to_pair(pattern):
+    '''Takes a mask pattern and creates a pair (net address, subnetmask) from it.
+       Detects automatically if the mask is a subnetmask or a wildcard mask. A mask whose bits are not
+       set continuously in either is a wildcard mask of IOS (like 0.0.255.0), its set bits may have any
+       value, so the subnetmask of the pair is not contiguous then.'''
+    parts = re.split(r"[^0-9.]", pattern)
+    net = ip_to_bits(parts[0])
+    net_or_wildcard = ip_to_bits(parts[1])
+
+    # special case full bits -> subnet mask
+    if 0xffffffff == net_or_wildcard:
+        return (net, 0xffffffff)
+
+    # check if the mask is really a mask (only set bits from the right or left)
+    if net_or_wildcard & (net_or_wildcard + 1) != 0:
+        mask = 0xffffffff ^ net_or_wildcard
+        if mask & (mask + 1) == 0:
+            return (net, net_or_wildcard)
+        # a non-contiguous wildcard mask
+        return (net & mask, mask)
+
+    return (net, 0xffffffff ^ net_or_wildcard)
+
+def ip_and_cidr_to_pair(pattern):
+    '''Takes a CIDR pattern and creates a pair (net address, subnetmask) from it.'''
+    parts = pattern.split("/")
+    net = ip_to_bits(parts[0])
+    wildcard = (1 << (32-int(parts[1])))-1
+    return (net, 0xffffffff ^ wildcard)
+
+def net_string_to_pair(pattern):
+    if pattern.find("/") == -1:
+        return ip_and_mask_to_pair(pattern)
+    else:
+        return ip_and_cidr_to_pair(pattern)
+
+def ip6_and_prefix_to_pair(pattern):
+    '''Takes an IPv6 prefix like 2001:db8::/32 and creates a pair (net address, subnetmask) from it,
+       both with IPV6_BIT set. An address without prefix length is a single host.'''
+    parts = pattern.split("/")
+    net = ip6_to_bits(parts[0])
+    length = int(parts[1]) if len(parts) > 1 else 128
+    if not 0 <= length <= 128:
+        raise ValueError("Invalid prefix length")
+    mask = IPV6_BIT | (IPV6_ALL ^ ((1 << (128 - length)) - 1))
+    return (net & mask, mask)
+
+def net_string_to_prefix(pattern):
+    '''Takes a net of either family and creates the masked pair (net address, subnetmask) of the
+       common representation, see IPV6_BIT.'''
+    if ":" in pattern:
+        return ip6_and_prefix_to_pair(pattern)
+    net, mask = net_string_to_pair(pattern)
+    return (net & mask, IPV6_BIT | mask)
+
+def prefix_range(net, mask):
+    '''Returns the lowest and the highest address of a net in the common representation. With a
+       non-contiguous mask not all addresses in between are part of the net.'''
+    if not mask & IPV6_BIT:
+        # plain "any" covers both families
+        return (0, IPV6_BIT | IPV6_ALL)
+    return (net, net | ((IPV6_ALL if net & IPV6_BIT else 0xffffffff) & ~mask))
+
+def range_to_prefixes(low, high):
+    '''Splits a range of addresses into the fewest prefixes (net, length) of the common address space.'''
+    while low <= high:
+        aligned = (low & -low).bit_length() - 1 if low else ADDRESS_WIDTH
+        size = min(aligned, (high - low + 1).bit_length() - 1)
+        yield (low, ADDRESS_WIDTH - size)
+        low += 1 << size
+
+def is_prefix(net, mask):
+    '''Checks if the mask of a net is contiguous, i.e. if the net is a prefix.'''
+    all_bits = IPV6_ALL if net & IPV6_BIT else 0xffffffff
+    wildcard = all_bits & ~mask
+    return wildcard & (wildcard + 1) == 0
+
+def prefix_length(net, mask):
+    '''Returns the length of a net in the common address space, IPv4 nets are below 96 zero bits
+       there. For a non-contiguous mask it is the length of the longest prefix containing the net.'''
+    if net & IPV6_BIT:
+        return 129 - ((IPV6_ALL & ~mask).bit_length())
+    return 129 - ((0xffffffff & ~mask).bit_length())
+
+def prefix_pair(net, length):
+    '''Turns a prefix (net, length) of the common address space into a masked pair (net address, subnetmask).'''
+    if net & IPV6_BIT:
+        return (net, IPV6_BIT | (IPV6_ALL ^ ((1 << (129 - length)) - 1)))
+    return (net, IPV6_BIT | (0xffffffff ^ ((1 << (129 - length)) - 1)))
+
+def net_string_to_range(pattern):
+    '''Takes a net of a query, an address, a net of either family with a prefix length or a contiguous
+       mask, or a range of addresses "low-high", and returns (low, high, pairs): the lowest and highest
+       address in the common representation and the fewest masked pairs (net address, subnetmask)
+       covering exactly these addresses.'''
+    pattern = pattern.strip()
+    if "-" in pattern:
+        low, high = [ip_to_bits(address.strip()) for address in pattern.split("-", 1)]
+        if low > high or (low ^ high) & IPV6_BIT:
+            raise ValueError("Invalid address range")
+    else:
+        if " " not in pattern and "/" not in pattern:
+            pattern += "/128" if ":" in pattern else "/32"
+        try:
+            net, mask = net_string_to_prefix(pattern)
+        except IndexError:
+            raise ValueError("Invalid net")
+        if not is_prefix(net, mask):
+            raise ValueError("Invalid net, the mask is not contiguous")
+        low, high = prefix_range(net, mask)
+    return (low, high, tuple(prefix_pair(*prefix) for prefix in range_to_prefixes(low, high)))
+
+def net_ranges(net):
+    '''Returns the addresses of a net (a pair, an AddressSet or one of the "any" markers) as a sorted
+       list of ranges (low, high) in the common representation. A pair with a non-contiguous mask gives
+       the range from its lowest to its highest address, which includes addresses outside of it.'''
+    if isinstance(net, AddressSet):
+        return net.ranges()
+    if isinstance(net, AnyMarker):
+        return [prefix_range(net.net, net.mask)]
+    return [prefix_range(*net)]
+
+def ranges_cover(outer, lows, inner):
+    '''Checks if all ranges of inner are inside the merged ranges of outer, lows are their low ends.'''
+    for low, high in inner:
+        i = bisect.bisect_right(lows, low) - 1
+        if i < 0 or high > outer[i][1]:
+            return False
+    return True
+
+def port_string_to_intervals(pattern):
+    '''Takes a port description as found by the parser and turns it into a sorted tuple of
+       port intervals (low, high). Empty intervals are left out, an empty tuple never matches.'''
+    parts = pattern.split()
+    operator = parts[0]
+
+    if operator == "eq":
+        intervals = [(int(p), int(p)) for p in parts[1:] if p.isdigit()]
+    elif operator == "neq":
+        if not parts[1].isdigit():
+            return ((0, MAX_PORT),)
+        port = int(parts[1])
+        intervals = [(0, port - 1), (port + 1, MAX_PORT)]
+    elif operator == "gt":
+        intervals = [(int(parts[1]) + 1, MAX_PORT)]
+    elif operator == "lt":
+        intervals = [(0, int(parts[1]) - 1)]
+    elif operator == "range":
+        intervals = [(int(parts[1]), int(parts[2]))]
+    else:
+        return ()
+    return merge_intervals(i for i in intervals if i[0] <= i[1])
+
+def merge_intervals(intervals):
+    '''Sorts the intervals (low, high) and merges overlapping and adjacent ones.'''
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return tuple(merged)
+
+def cap_intervals(intervals, limit):
+    '''Returns the sorted and merged intervals with the smallest gaps between them closed, so at most
+       limit intervals remain. They cover everything the given ones cover, and a bit more.'''
+    intervals = merge_intervals(intervals)
+    if len(intervals) <= limit:
+        return intervals
+    gaps = sorted(range(1, len(intervals)), key = lambda i: intervals[i][0] - intervals[i - 1][1])
+    closed = set(gaps[:len(intervals) - limit])
+    capped = []
+    for i, interval in enumerate(intervals):
+        if i in closed:
+            capped[-1] = (capped[-1][0], interval[1])
+        else:
+            capped.append(interval)
+    return tuple(capped)
+
+def port_in_intervals(port, intervals):
+    '''Checks if a port is contained in one of the intervals. They are sorted and merged
+       (see merge_intervals), so the large sets of port groups are searched with bisect.'''
+    if len(intervals) > 4:
+        i = bisect.bisect_right(intervals, (port, MAX_PORT + 1))
+        return i > 0 and port <= intervals[i - 1][1]
+    for low, high in intervals:
+        if low <= port <= high:
+            return True
+    return False
+
+def port_string_to_int(port, protocol = None):
+    '''Turns a port number or a named port of the protocol into an int.'''
+    port = ACLParser.services.get(port, protocol) or port
+    if not port.isdigit() or int(port) > MAX_PORT:
+        raise ValueError("Invalid port")
+    return int(port)
+
+
+class PortNames:
+    """The numbers of the named ports, in a table for tcp and one for udp, as the same name may stand for
+       different ports of the protocols. Each table also holds the names only the other protocol knows,
+       and a third one the names of both (tcp first) for rules of other or several protocols (ip,
+       tcp-udp, service groups), so resolving a name is a single dictionary lookup.
+
+       The built-in tables hold the names of the ASA (PORT_NAMES). The names of a services file in the
+       format of /etc/services are added to them with load, where they replace built-in names."""
+
+    def __init__(self, tcp, udp):
+        self.tcp = tcp
+        self.udp = udp
+        # the names of tcp win in the table of both
+        both = dict(udp)
+        both.update(tcp)
+        udp_table = dict(both)
+        udp_table.update(udp)
+        self.both = both
+        # protocol name or number -> table
+        self.tables = {"tcp": both, "6": both, "udp": udp_table, "17": udp_table}
+
+    def __getstate__(self):
+        return (self.tcp, self.udp)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @classmethod
+    def builtin(cls, tcp = (), udp = ()):
+        '''Returns the tables of the names of the ASA, with the given names added.'''
+        tcp_names = dict((name, port) for name, port in PORT_NAMES.items() if name not in UDP_PORT_NAMES)
+        udp_names = dict((name, port) for name, port in PORT_NAMES.items() if name not in TCP_PORT_NAMES)
+        tcp_names.update(tcp)
+        udp_names.update(udp)
+        return cls(tcp_names, udp_names)
+
+    @classmethod
+    def load(cls, path):
+        '''Returns the built-in tables with the names of the services file added. The file is small
+           and read again each time, nothing is cached.'''
+        with open(path, encoding = "utf-8", errors = "replace") as f:
+            return cls.builtin(*read_services(f))
+
+    def get(self, name, protocol = None):
+        '''Returns the port number of the named port as a string, None if the name is unknown.'''
+        return self.tables.get(protocol, self.both).get(name)
+
+    def fingerprint(self):
+        '''Returns a hash of the tables which stays the same across processes.'''
+        import hashlib
+        content = repr((sorted(self.tcp.items()), sorted(self.udp.items())))
+        return hashlib.sha1(content.encode()).hexdigest()
+
+def read_services(lines):
+    '''Returns the tcp and the udp names of the lines of a services file, "name port/protocol aliases"
+       with comments after "#". Entries of other protocols are ignored, the first entry of a name wins.'''
+    tables = {"tcp": {}, "udp": {}}
+    for line in lines:
+        words = line.split("#", 1)[0].split()
+        if len(words) < 2:
+            continue
+        port, _, protocol = words[1].partition("/")
+        table = tables.get(protocol)
+        if table is None or not port.isdigit() or int(port) > MAX_PORT:
+            continue
+        for name in words[:1] + words[2:]:
+            table.setdefault(name, port)
+    return tables["tcp"], tables["udp"]
+
+
+class ACLRule(collections.namedtuple("ACLRule", ("protocol", "source_net", "source_ports", "destination_net", "destination_ports", "action"))):
+    """The parsed numeric form of a single ACL line, an immutable record which can be kept, compared and
+       sorted (see also RuleTable for storing many of them).
+       Nets are pairs (net address, subnetmask) of either family with the net address already
+       masked (see IPV6_BIT), ANY, ANY4, ANY6, an AddressSet or None,
+       ports are tuples of intervals (low, high) or None if any port is allowed. The action is
+       "permit", "deny" or None for lines which are no rules."""
+    __slots__ = ()
+
+    def __new__(cls, protocol, source_net, source_ports, destination_net, destination_ports, action = None):
+        return tuple.__new__(cls, (protocol, source_net, source_ports, destination_net, destination_ports, action))
+
+
+class ACLObjects:
+    """The names, objects and object groups defined in a configuration (ASA style).
+       The definitions are collected in a pass over the whole file first (see read), as they are
+       referenced by name in the ACL lines. Each group is flattened only once on first use,
+       including nested groups, and cached:
+
+        - network objects and groups become an AddressSet,
+        - service groups with port-objects become a sorted tuple of port intervals,
+        - service objects, service groups with service-objects and protocol groups become a triple
+          (protocol, source ports, destination ports). If the members have different protocols,
+          the result covers all protocols (0), and the ports of all members are merged.
+
+       The name of the dialect of the configuration (see detect_dialect) is taken from its first lines."""
+
+    # header -> kind of the definition
+    NETWORK, PORTS, SERVICE = range(3)
+    headers = {
+        ("object", "network"): NETWORK,
+        ("object", "service"): SERVICE,
+        ("object-group", "network"): NETWORK,
+        ("object-group", "service"): SERVICE,
+        ("object-group", "protocol"): SERVICE,
+    }
+
+    # the name of the ACLDialect of the lines read, None if none was recognized
+    dialect = None
+
+    def __init__(self):
+        # name -> address
+        self.names = {}
+        # name -> (kind, lists of the words of the member lines)
+        self.definitions = {}
+        # name of a service group with port-objects -> its protocol
+        self.protocols = {}
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.names) + len(self.definitions)
+
+    def fingerprint(self):
+        '''Returns a hash of all definitions which stays the same across processes.'''
+        import hashlib
+        content = repr((self.dialect, sorted(self.names.items()), sorted(self.definitions.items()), sorted(self.protocols.items())))
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def read(self, lines):
+        '''Collects all definitions from the lines and detects their dialect, everything else is ignored.'''
+        import itertools
+        self.cache.clear()
+        lines = iter(lines)
+        head = list(itertools.islice(lines, DETECT_LINES))
+        self.dialect = detect_dialect(head)
+        members = None
+        for line in itertools.chain(head, lines):
+            if line[:1].isspace():
+                if members is not None:
+                    words = line.split()
+                    if words:
+                        members.append(words)
+                continue
+
+            members = None
+            if not line.startswith(("object", "name ")):
+                continue
+            words = line.split()
+            if words[0] == "name" and len(words) > 2:
+                self.names[words[2]] = words[1]
+                continue
+
+            kind = self.headers.get(tuple(words[:2]))
+            if kind is None or len(words) < 3:
+                continue
+            # a service group with a protocol contains port-objects
+            if kind == self.SERVICE and words[0] == "object-group" and len(words) > 3:
+                kind = self.PORTS
+                self.protocols[words[2]] = words[3]
+            members = []
+            self.definitions[words[2]] = (kind, members)
+
+    def kind(self, name):
+        '''Returns the kind of the named object or group, None if it is not defined.'''
+        definition = self.definitions.get(name)
+        return definition and definition[0]
+
+    def resolve(self, name, seen = ()):
+        '''Returns the flattened form of the named object or group, see the class description.'''
+        result = self.cache.get(name)
+        if result is None:
+            kind, members = self.definitions.get(name, (None, []))
+            seen = seen + (name,)
+            if kind == self.NETWORK:
+                result = AddressSet(r for words in members for r in self.address_ranges(words, seen))
+            elif kind == self.PORTS:
+                protocol = self.protocols.get(name)
+                result = merge_intervals(i for words in members for i in self.port_intervals(words, seen, protocol))
+            else:
+                result = self.merge_services([self.service(words, seen) for words in members])
+            self.cache[name] = result
+        return result
+
+    def reference(self, name, seen, kind):
+        '''Resolves a nested group, references to undefined groups or in cycles resolve to nothing.'''
+        if name in seen or self.kind(name) != kind:
+            return None
+        return self.resolve(name, seen)
+
+    def address(self, address):
+        return self.names.get(address, address)
+
+    def address_ranges(self, words, seen):
+        '''Returns the ranges of a member of a network object or group.'''
+        if words[0] == "network-object":
+            words = words[1:]
+        elif words[0] == "subnet":
+            words = words[1:]
+        elif words[0] == "group-object":
+            words = ["object"] + words[1:]
+        elif words[0] not in ("host", "range"):
+            # descriptions, fqdn, nat and so on
+            return []
+
+        try:
+            if len(words) == 2 and words[0] == "object":
+                group = self.reference(words[1], seen, self.NETWORK)
+                return group.ranges() if group else []
+            if len(words) == 2 and words[0] == "host":
+                address = self.address(words[1])
+                return [prefix_range(*net_string_to_prefix(address + ("/128" if ":" in address else "/32")))]
+            if len(words) == 3 and words[0] == "range":
+                return [(ip_to_bits(self.address(words[1])), ip_to_bits(self.address(words[2])))]
+            if len(words) == 2:
+                return [prefix_range(*net_string_to_prefix(self.address(words[0]) + " " + words[1]))]
+            if len(words) == 1:
+                address = self.address(words[0])
+                if "/" not in address:
+                    address += "/128" if ":" in address else "/32"
+                return [prefix_range(*net_string_to_prefix(address))]
+        except ValueError:
+            pass
+        return []
+
+    def port_intervals(self, words, seen, protocol):
+        '''Returns the port intervals of a member of a service group of the protocol with port-objects.'''
+        if words[0] == "group-object" and len(words) == 2:
+            return self.reference(words[1], seen, self.PORTS) or ()
+        if words[0] == "port-object" and len(words) > 2:
+            services = ACLParser.services
+            try:
+                return port_string_to_intervals(" ".join([words[1]] + [services.get(w, protocol) or w for w in words[2:]]))
+            except (ValueError, IndexError):
+                pass
+        return ()
+
+    def service(self, words, seen):
+        '''Returns (protocol, source ports, destination ports) of a member of a service object or group,
+           None for members which are no services.'''
+        if words[0] == "group-object" or (words[0] == "service-object" and words[1:2] == ["object"]):
+            return self.reference(words[-1], seen, self.SERVICE)
+        if words[0] not in ("service", "service-object", "protocol-object") or len(words) < 2:
+            return None
+
+        protocol = words[1]
+        protocol = int(protocol) if protocol.isdigit() else PROTOCOL_NUMBERS.get(protocol, 0 if protocol == "tcp-udp" else -1)
+        ports = {"source": None, "destination": None}
+        direction = "destination"
+        i = 2
+        while i < len(words):
+            word = words[i]
+            i += 1
+            if word in ports:
+                direction = word
+            elif word in ("eq", "neq", "lt", "gt", "range"):
+                count = 2 if word == "range" else 1
+                values = [ACLParser.services.get(w, words[1]) or w for w in words[i:i + count]]
+                i += count
+                try:
+                    intervals = port_string_to_intervals(" ".join([word] + values))
+                except (ValueError, IndexError):
+                    intervals = ()
+                ports[direction] = intervals
+        return (protocol, ports["source"], ports["destination"])
+
+    def merge_services(self, services):
+        '''Merges the services of a group into a single one.'''
+        services = [s for s in services if s is not None]
+        if not services:
+            return (-1, (), ())
+        protocols = set(s[0] for s in services)
+        protocol = protocols.pop() if len(protocols) == 1 else 0
+        merged = []
+        for index in (1, 2):
+            if any(s[index] is None for s in services):
+                merged.append(None)
+            else:
+                merged.append(merge_intervals(i for s in services for i in s[index]))
+        return (protocol, merged[0], merged[1])
+
+
 class ACLParser:
     """Helper class to parse an ACL file line by line.
        This will find out protocol, networks and ports for each line and keeps track
-       of the name of the current ACL rule."""
+       of the name of the current ACL rule.
+
+       Each line is tokenized exactly once into a stream of typed tokens (protocol, host,
+       net + mask, CIDR, IPv6 prefix, port operator, any, named port) and source and destination
+       are assigned from that stream. Named ports are resolved while tokenizing, names, objects and
+       object groups with the ACLObjects given to use_objects.
+
+       The lines of a known dialect (see ACLDialect) are parsed by its grammar instead, only the lines
+       it does not know are tokenized. The dialect of each file is detected by ACLObjects.read."""
     source_net = None
     source_port = None
     destination_net = None
     destination_port = None
     protocol = None
+    action = None
+
+    # the name of the current ACL, taken from "access-list NAME ..." lines and ACL headers
+    acl_name = None
+
+    # the names, objects and object groups the lines may refer to, see use_objects
+    objects = None
+
+    # the ACLDialect of the current file, None for the tokenizer only, see use_dialect
+    dialect = None
+
+    # the named ports of all parsers, the built-in ones unless a services file is used (see PortNames.load)
+    services = PortNames.builtin()
+
+    # token types of the keywords, everything else is either an address or ignored
+    HOST, WILDCARD, PROTOCOL, RANGE, EQ, COMPARE, ACTION, REMARK, OBJECT = range(9)
+    keywords = {
+        "permit": ACTION,
+        "deny": ACTION,
+        "remark": REMARK,
+        "host": HOST,
+        "any": WILDCARD,
+        "any4": WILDCARD,
+        "any6": WILDCARD,
+        "icmp": PROTOCOL,
+        "icmp6": PROTOCOL,
+        "ip": PROTOCOL,
+        "ipv6": PROTOCOL,
+        "tcp": PROTOCOL,
+        "udp": PROTOCOL,
+        "range": RANGE,
+        "eq": EQ,
+        "neq": EQ,
+        "gt": COMPARE,
+        "lt": COMPARE,
+        "object": OBJECT,
+        "object-group": OBJECT,
+    }
+
+    # a single address, optionally followed by a prefix length or a mask
+    address_pattern = r"(\d+\.\d+\.\d+\.\d+)(?:/(\d+(?:\.\d+\.\d+\.\d+)?))?$"
+
+    # an IPv6 address, optionally followed by a prefix length. It has a "::" or at least six colons,
+    # so times like 12:30:00 are no addresses.
+    address6_pattern = r"((?=[^/]*::|(?:[^:/]*:){6})[0-9A-Fa-f:.]+)(?:/(\d+))?$"
+
+    # upper limit for the number of cached net and port conversions
+    cache_size = 65536
+
+    def __init__(self):
+        self.address = re.compile(self.address_pattern).match
+        self.address6 = re.compile(self.address6_pattern).match
+        self.net_cache = {}
+        self.port_cache = {}
+
+    def use_objects(self, objects):
+        """Sets the ACLObjects the following lines may refer to by name."""
+        if objects is not self.objects:
+            self.objects = objects
+            self.net_cache.clear()
+            self.port_cache.clear()
+            self.use_dialect(objects.dialect if objects is not None else None)
+
+    def use_dialect(self, name):
+        """Parses the following lines with the dialect of the name (see DIALECTS), None for the tokenizer
+           only. It starts with the state of a new file, outside of any ACL."""
+        dialect = DIALECTS.get(name)
+        self.dialect = dialect(self) if dialect else None
+        self.acl_name = None
+
+    def reset_transients(self):
+        self.source_net = None
+        self.source_port = None
+        self.destination_net = None
+        self.destination_port = None
+        self.protocol = None
+        self.action = None
+
+    def track_acl(self, line):
+        """Updates the name of the current ACL from the line and returns it. The name is taken from
+           lines like "access-list NAME ...", "ip access-list extended NAME" or the headers of
+           "show access-list" like "Extended IP access list NAME". The dialect may know other names."""
+        if self.dialect is not None:
+            name = self.dialect.track_acl(line)
+            if name is not None:
+                self.acl_name = name
+                return name
+        if line.startswith("access-list"):
+            words = line.split(None, 2)
+            if len(words) > 1:
+                self.acl_name = words[1].rstrip(";")
+        elif line.startswith(("ip access-list", "ipv6 access-list")):
+            words = line.split()[2:]
+            if words and words[0] in ("extended", "standard"):
+                words = words[1:]
+            if words:
+                self.acl_name = words[0]
+        elif " access list " in line and not line[:1].isspace():
+            self.acl_name = line.split()[-1]
+        return self.acl_name
+
+    def resolve_port(self, value, protocol = None):
+        """Returns the port number for a number or a port name of the protocol as a string or None if unknown."""
+        if value.isdigit():
+            return value
+        return self.services.get(value, protocol)
+
+    def tokenize(self, words, ipv6 = True):
+        """Walks the words of a line once and returns the net hits, the port hits, the protocol hits
+           and the action. Each hit is a pair (index of the word following the token, text) in the
+           order of appearance. IPv6 addresses are only looked for if ipv6 is set."""
+        nets = []
+        ports = []
+        protocols = []
+        action = None
+
+        count = len(words)
+        address = self.address
+        address6 = self.address6 if ipv6 else None
+        keywords = self.keywords
+        objects = self.objects
+        names = objects.names if objects else None
+        i = 0
+        while i < count:
+            word = words[i]
+            i += 1
+
+            if word[0].isdigit():
+                m = address(word)
+                if not m:
+                    if address6 and address6(word):
+                        nets.append((i, word))
+                    continue
+                if m.group(2):
+                    # CIDR or net/mask
+                    nets.append((i, word))
+                elif i < count:
+                    # net and mask (or wildcard) as two words, a lone address is no token
+                    m = address(words[i])
+                    if m and not m.group(2):
+                        nets.append((i + 1, word + " " + words[i]))
+                        i += 1
+                continue
+
+            kind = keywords.get(word)
+            if kind is None:
+                if address6 and address6(word):
+                    nets.append((i, word))
+                elif names and word in names and i < count:
+                    # a named net with its mask
+                    m = address(words[i])
+                    if m and not m.group(2):
+                        nets.append((i + 1, names[word] + " " + words[i]))
+                        i += 1
+                continue
+
+            if kind == self.WILDCARD:
+                nets.append((i, word))
+                ports.append((i, "any"))
+            elif kind == self.PROTOCOL:
+                protocols.append(word)
+            elif kind == self.ACTION:
+                if action is None:
+                    action = word
+            elif kind == self.REMARK:
+                # a comment, there will be no action
+                if action is None:
+                    action = False
+            elif i == count:
+                # all other keywords need an argument
+                break
+            elif kind == self.HOST:
+                host = names.get(words[i], words[i]) if names else words[i]
+                m = address(host)
+                if m and not m.group(2):
+                    nets.append((i + 1, host + "/32"))
+                    i += 1
+                elif ":" in host:
+                    m = self.address6(host)
+                    if m and not m.group(2):
+                        nets.append((i + 1, host + "/128"))
+                        i += 1
+            elif kind == self.OBJECT:
+                name = words[i]
+                i += 1
+                kind = objects.kind(name) if objects else None
+                if kind == ACLObjects.NETWORK:
+                    nets.append((i, word + " " + name))
+                elif kind == ACLObjects.PORTS:
+                    ports.append((i, word + " " + name))
+                elif kind == ACLObjects.SERVICE:
+                    protocols.append(word + " " + name)
+            elif kind == self.EQ:
+                # names are looked up for the protocol of the rule
+                protocol = protocols[-1] if protocols else None
+                values = [self.resolve_port(words[i], protocol) or words[i]]
+                i += 1
+                # only plain and named ports may follow, anything else starts the next token
+                while i < count:
+                    value = self.resolve_port(words[i], protocol)
+                    if not value:
+                        break
+                    values.append(value)
+                    i += 1
+                ports.append((i, word + " " + " ".join(values)))
+            elif kind == self.COMPARE:
+                value = self.resolve_port(words[i], protocols[-1] if protocols else None)
+                if value:
+                    i += 1
+                    ports.append((i, word + " " + value))
+            elif kind == self.RANGE and i + 1 < count:
+                protocol = protocols[-1] if protocols else None
+                low = self.resolve_port(words[i], protocol)
+                high = self.resolve_port(words[i + 1], protocol)
+                if low and high:
+                    i += 2
+                    ports.append((i, "range %s %s" % (low, high)))
+
+        return nets, ports, protocols, action or None
+
+    def assign_source_dest(self, hits, count):
+        """Take the first and last one to weed out the invalid hits."""
+        result = [None, None]
+        if len(hits) > 0:
+            result[0] = hits[0][1]
+        if len(hits) > 1:
+            result[1] = hits[-1][1]
+
+        # if there is only one hit, we must decide whether it is source or destination
+        # This should only happen for ports, so let's see if it is at the end of the line
+        # (should be destination then)
+        if len(hits) == 1 and hits[0][0] == count:
+            result[1] = result[0]
+            result[0] = None
+        return result
+
+    def next_line(self, line):
+        self.track_acl(line)
+        self.parse_line(line)
+
+    def parse_line(self, line):
+        """Finds protocol, networks, ports and the action of the line without looking at the ACL name."""
+        self.reset_transients()
+
+        words = line.split()
+        if self.dialect is not None and words:
+            fields = self.dialect.parse(words)
+            if fields is not None:
+                (self.protocol, self.source_net, self.source_port, self.destination_net, self.destination_port, self.action) = fields
+                return
+        if words[1:2] == ["access-list"] and words[0] in ("ip", "ipv6"):
+            # the header of a named ACL, "ip" is no protocol here
+            return
+
+        nets, ports, protocols, action = self.tokenize(words, ":" in line)
+        if not action and words[:1] == ["access-list"]:
+            # a header or a remark of a numbered ACL, no rule
+            self.action = action
+            return
+        self.action = action
+        (self.source_net, self.destination_net) = self.assign_source_dest(nets, len(words))
+        (self.source_port, self.destination_port) = self.assign_source_dest(ports, len(words))
+        if len(protocols) == 1:
+            self.protocol = protocols[0]
+
+    def net_value(self, net):
+        """Converts a net found by next_line into its numeric form, see ACLRule."""
+        if net is None:
+            return None
+
+        pair = self.net_cache.get(net)
+        if pair is None:
+            pair = ANY_NETS.get(net)
+            if pair is None and net.startswith("object"):
+                pair = self.objects.resolve(net.split()[1])
+            elif pair is None and "," in net:
+                # a list of nets of a dialect
+                pairs = [self.net_value(part) for part in net.split(",")]
+                pair = AddressSet(r for part in pairs if part != NEVER for r in net_ranges(part))
+            if pair is None:
+                try:
+                    pair = net_string_to_prefix(net)
+                except ValueError:
+                    # some trouble when parsing stuff, let's assume this never matches
+                    pair = NEVER
+            if len(self.net_cache) >= self.cache_size:
+                self.net_cache.clear()
+            self.net_cache[net] = pair
+        return pair
+
+    def port_value(self, port):
+        """Converts a port description found by next_line into its numeric form, see ACLRule."""
+        if port is None or port == "any":
+            return None
+
+        intervals = self.port_cache.get(port)
+        if intervals is None:
+            if port.startswith("object"):
+                intervals = self.objects.resolve(port.split()[1])
+            elif "," in port:
+                # a list of ports of a dialect
+                intervals = merge_intervals(i for part in port.split(",") for i in self.port_value(part))
+            else:
+                try:
+                    intervals = port_string_to_intervals(port)
+                except ValueError:
+                    intervals = ()
+            if len(self.port_cache) >= self.cache_size:
+                self.port_cache.clear()
+            self.port_cache[port] = intervals
+        return intervals
+
+    def parse_rule(self, line):
+        """Parses the line and returns the result as an ACLRule."""
+        self.next_line(line)
+        return self.current_rule()
+
+    def parse_rules(self, lines, table = None):
+        """Parses the lines and appends their results to a RuleTable, a new one if none is given.
+           Returns the table."""
+        if table is None:
+            table = RuleTable()
+        append = table.append
+        for line in lines:
+            self.next_line(line)
+            append(self.current_rule())
+        return table
+
+    def current_rule(self):
+        """Returns the result of the last parsed line as an ACLRule."""
+        protocol = PROTOCOL_NUMBERS.get(self.protocol)
+        source_ports = self.port_value(self.source_port)
+        destination_ports = self.port_value(self.destination_port)
+        if protocol is None and self.protocol and self.protocol.isdigit():
+            protocol = int(self.protocol)
+        elif protocol is None and self.protocol:
+            # a service object or group, which brings its own ports
+            protocol, service_source, service_destination = self.objects.resolve(self.protocol.split()[1])
+            if source_ports is None:
+                source_ports = service_source
+            if destination_ports is None:
+                destination_ports = service_destination
+
+        return ACLRule(protocol,
+                       self.net_value(self.source_net), source_ports,
+                       self.net_value(self.destination_net), destination_ports,
+                       self.action)
+
+
+class RegexACLParser(ACLParser):
+    """The original parser which runs every single pattern over the whole line after replacing
+       the named ports. It is kept for reference and to compare the results of the tokenizer."""
 
     # Add special patterns to detect IP networks and hosts here
     # Make sure they start with the most specific, as they are tried in order
@@ -121,21 +1074,27 @@ class ACLParser:
         r"\s(icmp|ip|tcp|udp)\s"
     ]
 
+    action_pattern = r"\b(permit|deny|remark)\b"
+
     def __init__(self):
-        # compile all patterns to regexes
-        self.net_patterns = [re.compile(p) for p in self.net_patterns]
-        self.port_patterns = [re.compile(p) for p in self.port_patterns]
-        self.protocol_patterns = [re.compile(p) for p in self.protocol_patterns]
+        ACLParser.__init__(self)
 
-        # prepare port name map regex (see https://www.safaribooksonline.com/library/view/python-cookbook-2nd/0596007973/ch01s19.html)
-        self.port_names = re.compile("\\b" + "\\b|\\b".join(map(re.escape, PORT_NAMES)) + "\\b")
+        # compile all patterns to regexes, only once for each class and shared by its instances
+        cls = type(self)
+        if "compiled" not in cls.__dict__:
+            cls.compiled = (
+                [re.compile(p) for p in cls.net_patterns],
+                [re.compile(p) for p in cls.port_patterns],
+                [re.compile(p) for p in cls.protocol_patterns],
+                re.compile(cls.action_pattern),
+                # prepare port name map regex (see https://www.safaribooksonline.com/library/view/python-cookbook-2nd/0596007973/ch01s19.html)
+                re.compile("\\b" + "\\b|\\b".join(map(re.escape, PORT_NAMES)) + "\\b"),
+            )
+        (self.net_patterns, self.port_patterns, self.protocol_patterns, self.action_pattern, self.port_names) = cls.compiled
 
-    def reset_transients(self):
-        self.source_net = None
-        self.source_port = None
-        self.destination_net = None
-        self.destination_port = None
-        self.protocol = None
+    def replace_port_names(self, line):
+        """Transform named ports to numbers (see https://www.safaribooksonline.com/library/view/python-cookbook-2nd/0596007973/ch01s19.html)"""
+        return self.port_names.sub(lambda match: PORT_NAMES[match.group(0)], line)
 
     def match_patterns(self, line, patterns):
         """We might get invalid matches, e.g. "source_mask destination_net. This gets sorted out by taking
@@ -169,11 +1128,14 @@ class ACLParser:
                 result[0] = None
         return result
 
-    def next_line(self, line):
+    def parse_line(self, line):
         self.reset_transients()
 
-        # transform named ports to numbers (see https://www.safaribooksonline.com/library/view/python-cookbook-2nd/0596007973/ch01s19.html)
-        line = self.port_names.sub(lambda match: PORT_NAMES[match.group(0)], line)
+        m = self.action_pattern.search(line)
+        if m and m.group(1) != "remark":
+            self.action = m.group(1)
+
+        line = self.replace_port_names(line)
 
         # first look for all net matches
         hits = self.match_patterns(line, self.net_patterns)
@@ -194,188 +1156,2972 @@ class ACLParser:
         if len(hits) == 1:
             self.protocol = hits.popitem()[1]
 
-class ACLGrepper:
-    '''The main class which handles the grep process as a whole.'''
-    splitter = re.compile(r"[^0-9.]")
+# the number of lines at the start of a file its dialect is detected from, see detect_dialect
+DETECT_LINES = 1000
 
-    parser = ACLParser()
+# a line without any of the fields, for lines of a dialect which are no rules
+NO_FIELDS = (None, None, None, None, None, None)
 
-    source_ip_string = None
-    source_ip_address = None
-    source_port = None
+class ACLDialect:
+    """The grammar of the ACL lines of a platform. A dialect knows where each field of its rules is, so
+       its parse finds them in one pass over the words without guessing, and returns the fields as the
+       tokenizer of ACLParser writes them: (protocol, source net, source port, destination net,
+       destination port, action). Lines it does not know are left to the tokenizer by returning None.
+       A parser creates a new instance of the dialect for each file, see ACLParser.use_dialect."""
+    name = None
 
-    destination_ip_string = None
-    destination_ip_address = None
-    destination_port = None
+    # the rules leave out the nets and the protocol they do not restrict, so the byte prefilter must
+    # not require them, see line_prefilter
+    implicit_any = False
 
-    protocol = None
-    match_any = False
+    # a rule spans several lines, so all lines of a file have to be read in order, see track_acl
+    stateful = False
 
+    def __init__(self, parser):
+        self.parser = parser
 
-    def __init__(self, sip = None, sport = None, dip = None, dport = None, protocol = None, match_any = None):
-        self.source_ip_string = sip
-        if sip:
-            self.source_ip_address = self.ip_to_bits(sip)
-        self.source_port = sport
+    @classmethod
+    def detect(cls, line):
+        '''Checks if the line is typical for the dialect, see detect_dialect.'''
+        return False
 
-        self.destination_ip_string = dip
-        if dip:
-            self.destination_ip_address = self.ip_to_bits(dip)
-        self.destination_port = dport
+    def track_acl(self, line):
+        '''Returns the name of the ACL the line starts or belongs to, None leaves it to the parser.'''
+        return None
 
-        self.protocol = protocol
-        self.match_any = match_any
+    def parse(self, words):
+        '''Returns the fields of the line split into words, or None if the tokenizer should find them.'''
+        return None
 
-    def ip_to_bits(self, address):
-        '''Turns an IP address in dot notation into a single long value.'''
+    def exact(self, words):
+        '''Checks if the rule of the line parsed last applies to all packets its fields describe, see
+           ACLShadowAnalyzer.exact. None leaves it to the tokenizer.'''
+        return None
 
-        # Fixup IP addresses with leading zeros
-        fixed_address = ".".join([str(int(x)) for x in address.split(".")])
 
-        try:
-            return struct.unpack("!L", socket.inet_aton(fixed_address))[0]
-        except socket.error:
-            raise ValueError("Invalid IP address")
+class CiscoDialect(ACLDialect):
+    """The grammar shared by the ACLs of the Cisco platforms: action, protocol, source net, source ports,
+       destination net and destination ports, in this order, followed by options like log."""
+    actions = ("permit", "deny")
+    port_operators = frozenset(("eq", "neq", "gt", "lt", "range", "object", "object-group"))
 
-    def ip_in_net(self, ip, net):
-        '''Checks if an IP adress is contained in a network described by a pair (net address, subnetmask).
-           All values are given as longs.'''
-        return (net[0] & net[1] == ip & net[1])
+    def net(self, words, i):
+        '''Returns the net starting at words[i] and the index after it, (None, i) if there is none.'''
+        parser = self.parser
+        word = words[i]
+        if word in ANY_NETS:
+            return word, i + 1
+        count = len(words)
+        objects = parser.objects
+        if word == "host":
+            if i + 1 < count:
+                host = words[i + 1]
+                if objects is not None:
+                    host = objects.names.get(host, host)
+                m = parser.address(host)
+                if m and not m.group(2):
+                    return host + "/32", i + 2
+                if ":" in host:
+                    m = parser.address6(host)
+                    if m and not m.group(2):
+                        return host + "/128", i + 2
+            return None, i
+        if word in ("object", "object-group"):
+            if i + 1 < count and objects is not None and objects.kind(words[i + 1]) == ACLObjects.NETWORK:
+                return word + " " + words[i + 1], i + 2
+            return None, i
+        if word[0].isdigit():
+            m = parser.address(word)
+            if m:
+                if m.group(2):
+                    return word, i + 1
+                if i + 1 < count:
+                    m = parser.address(words[i + 1])
+                    if m and not m.group(2):
+                        return word + " " + words[i + 1], i + 2
+                return None, i
+        if ":" in word and parser.address6(word):
+            return word, i + 1
+        if objects is not None and word in objects.names and i + 1 < count:
+            m = parser.address(words[i + 1])
+            if m and not m.group(2):
+                return objects.names[word] + " " + words[i + 1], i + 2
+        return None, i
 
-    def ip_and_mask_to_pair(self, pattern):
-        '''Takes a mask pattern and creates a pair (net address, subnetmask) from it.
-           Detects automatically if the mask is a subnetmask or a wildcard mask, assuming the bits are
-           set continuously in either.'''
-        parts = re.split(self.splitter, pattern)
-        net = self.ip_to_bits(parts[0])
-        net_or_wildcard = self.ip_to_bits(parts[1])
-
-        # special case full bits -> subnet mask
-        if 0xffffffff == net_or_wildcard:
-            return (net, 0xffffffff)
-
-        # check if the mask is really a mask (only set bits from the right or left)
-        if net_or_wildcard & (net_or_wildcard + 1) != 0:
-            net_or_wildcard = 0xffffffff ^ net_or_wildcard
-            if net_or_wildcard & (net_or_wildcard + 1) != 0:
-                # it's not, never match
-                return (0, 0xffffffff)
-
-        return (net, 0xffffffff ^ net_or_wildcard)
+    def port(self, words, i, protocol = None):
+        '''Returns the ports of the protocol starting at words[i] and the index after them, (None, i) if
+           there are none.'''
+        word = words[i]
+        count = len(words)
+        if word not in self.port_operators or i + 1 == count:
+            return None, i
+        resolve_port = self.parser.resolve_port
+        if word == "eq" or word == "neq":
+            values = [resolve_port(words[i + 1], protocol) or words[i + 1]]
+            i += 2
+            while i < count:
+                value = resolve_port(words[i], protocol)
+                if not value:
+                    break
+                values.append(value)
+                i += 1
+            return word + " " + " ".join(values), i
+        if word == "gt" or word == "lt":
+            value = resolve_port(words[i + 1], protocol)
+            if value:
+                return word + " " + value, i + 2
+        elif word == "range":
+            if i + 2 < count:
+                low = resolve_port(words[i + 1], protocol)
+                high = resolve_port(words[i + 2], protocol)
+                if low and high:
+                    return "range %s %s" % (low, high), i + 3
+        elif word in ("object", "object-group"):
+            objects = self.parser.objects
+            if objects is not None and objects.kind(words[i + 1]) == ACLObjects.PORTS:
+                return word + " " + words[i + 1], i + 2
+        return None, i
 
-    def ip_and_cidr_to_pair(self, pattern):
-        '''Takes a CIDR pattern and creates a pair (net address, subnetmask) from it.'''
-        parts = pattern.split("/")
-        net = self.ip_to_bits(parts[0])
-        wildcard = (1 << (32-int(parts[1])))-1
-        return (net, 0xffffffff ^ wildcard)
+    def extended(self, words, i):
+        '''Returns the fields of an extended rule whose action is words[i].'''
+        count = len(words)
+        if i + 3 >= count:
+            return None
+        action = words[i]
+        protocol = words[i + 1]
+        i += 2
+        if protocol in ("object", "object-group"):
+            objects = self.parser.objects
+            if objects is None or objects.kind(words[i]) != ACLObjects.SERVICE:
+                return None
+            protocol += " " + words[i]
+            i += 1
+        elif protocol not in PROTOCOL_NUMBERS and not protocol.isdigit():
+            # a protocol without ports and without a number of its own, like gre or esp
+            protocol = None
 
-    def net_string_to_pair(self, pattern):
-        if pattern.find("/") == -1:
-            return self.ip_and_mask_to_pair(pattern)
-        else:
-            return self.ip_and_cidr_to_pair(pattern)
+        source, i = self.net(words, i)
+        if source is None or i == count:
+            return None
+        source_port, i = self.port(words, i, protocol)
+        if i == count:
+            return None
+        destination, i = self.net(words, i)
+        if destination is None:
+            return None
+        destination_port = None
+        if i < count:
+            destination_port, i = self.port(words, i, protocol)
+        return (protocol, source, source_port, destination, destination_port, action)
 
 
-    def grep(self, line):
-        self.parser.next_line(line)
-        
-        try:
+class ASADialect(CiscoDialect):
+    """The access-list lines of the ASA (and PIX) configuration and of "show access-list", which adds
+       a line number, the hit count and the hash of each rule."""
+    name = "asa"
 
-            # FIXME check any if desired
-            if self.source_ip_address:
-                if self.parser.source_net == "any":
-                    return self.match_any
-                if not self.parser.source_net:
-                    return False
-                if not self.ip_in_net(self.source_ip_address, self.net_string_to_pair(self.parser.source_net)):
-                    return False
+    @classmethod
+    def detect(cls, line):
+        if line.startswith("access-list "):
+            words = line.split(None, 3)
+            return len(words) > 2 and not words[1].isdigit() and words[2] in ("extended", "standard", "line", "remark", "webtype", "ethertype")
+        return line.startswith(("ASA Version", "PIX Version", "object network "))
 
-            if self.destination_ip_address:
-                if self.parser.destination_net == "any":
-                    return self.match_any
-                if not self.parser.destination_net:
+    def parse(self, words):
+        if words[0] != "access-list" or len(words) < 4:
+            return None
+        i = 2
+        if words[2] == "line":
+            i = 4
+        if words[i:i + 1] == ["extended"]:
+            i += 1
+        if i + 1 >= len(words):
+            return None
+        kind = words[i]
+        if kind in self.actions:
+            return self.extended(words, i)
+        if kind == "remark":
+            return NO_FIELDS
+        if kind == "standard" and i + 2 < len(words) and words[i + 1] in self.actions:
+            # standard ACLs select destinations, e.g. of routes
+            destination = self.net(words, i + 2)[0]
+            if destination is not None:
+                return (None, None, None, destination, None, words[i + 1])
+        return None
+
+
+class IOSDialect(CiscoDialect):
+    """The numbered and named ACLs of IOS and IOS-XE, IPv4 and IPv6, their entries with or without
+       sequence numbers, and the output of "show access-lists". Standard ACLs only have a source."""
+    name = "ios"
+
+    @classmethod
+    def detect(cls, line):
+        if line.startswith("access-list "):
+            words = line.split(None, 3)
+            return len(words) > 2 and words[1].isdigit()
+        return line.startswith(("ip access-list extended ", "ip access-list standard ", "ipv6 access-list ",
+                                "Extended IP access list ", "Standard IP access list ", "IPv6 access list "))
+
+    def parse(self, words):
+        count = len(words)
+        word = words[0]
+        if word == "access-list":
+            if count < 4 or not words[1].isdigit():
+                return None
+            if words[2] == "remark":
+                return NO_FIELDS
+            if words[2] not in self.actions:
+                return None
+            number = int(words[1])
+            if number < 100 or 1300 <= number < 2000:
+                return self.standard(words, 2)
+            return self.extended(words, 2)
+
+        if words[1:2] == ["access-list"] or (count > 3 and words[2:4] == ["access", "list"]):
+            # the header of a named ACL, "ip" is no protocol here
+            return NO_FIELDS
+
+        # an entry of a named ACL
+        i = 0
+        if word.isdigit():
+            i = 1
+        elif word == "sequence":
+            i = 2
+        if i + 1 >= count:
+            return None
+        if words[i] == "remark":
+            return NO_FIELDS
+        if words[i] not in self.actions:
+            return None
+        following = words[i + 1]
+        if following in ANY_NETS or following == "host" or "." in following:
+            return self.standard(words, i)
+        return self.extended(words, i)
+
+    def standard(self, words, i):
+        '''Returns the fields of a standard rule whose action is words[i].'''
+        source, j = self.net(words, i + 1)
+        if source is None:
+            # a single address, or the net as "show access-lists" writes it: "10.1.1.0, wildcard bits 0.0.0.255"
+            address = words[i + 1].rstrip(",")
+            m = self.parser.address(address)
+            if not m or m.group(2):
+                return None
+            if words[i + 2:i + 4] == ["wildcard", "bits"] and i + 4 < len(words):
+                source = address + " " + words[i + 4]
+            else:
+                source = address + "/32"
+        return (None, source, None, None, None, words[i])
+
+
+class NXOSDialect(IOSDialect):
+    """The ACLs of NX-OS, which share the grammar of the named ACLs of IOS. Their headers have no type,
+       nets are mostly written as prefixes. Lines with addrgroup and portgroup are left to the
+       tokenizer."""
+    name = "nxos"
+
+    @classmethod
+    def detect(cls, line):
+        if line.startswith("ip access-list "):
+            return len(line.split()) == 3
+        return line.startswith(("!Command: ", "IP access list ", "object-group ip address ", "feature "))
+
+
+class JuniperDialect(ACLDialect):
+    """The firewall filters of Junos, in the hierarchical format of the configuration as well as in the
+       "set" format of "show configuration | display set". The match conditions of a term are spread over
+       several lines, so they are collected by track_acl and the rule is reported on the line with the
+       action of the term (accept, discard or reject).
+
+       Addresses and ports of a term become lists joined by ",", missing ones are any. Conditions for
+       either side (address, port), prefix lists and "except" cannot be expressed as a rule, they are
+       taken as any, and several protocols as all protocols."""
+    name = "juniper"
+    implicit_any = True
+    stateful = True
+
+    actions = {"accept": "permit", "discard": "deny", "reject": "deny"}
+
+    # the conditions which are turned into the fields of the rule, the others restrict it further
+    conditions = ("source-address", "destination-address", "protocol", "next-header", "source-port", "destination-port")
+
+    # port names of Junos which the ASA names differently
+    port_names = {"http": "80", "imap": "143", "kerberos-sec": "88", "ldp": "646", "nfsd": "2049", "syslog": "514"}
+
+    # the nets which stand for all addresses of a family
+    family_any = {"inet": "any4", "inet6": "any6"}
+
+    def __init__(self, parser):
+        ACLDialect.__init__(self, parser)
+        # the words of the open blocks of the hierarchical format
+        self.blocks = []
+        self.term = None
+        self.values = {}
+        self.family = "inet"
+        # the fields of the line if it has the action of a term, see track_acl
+        self.fields = NO_FIELDS
+        self.complete = True
+
+    @classmethod
+    def detect(cls, line):
+        if line.startswith("set firewall "):
+            return True
+        line = line.strip()
+        return line == "firewall {" or (line.startswith(("filter ", "term ")) and line.endswith("{"))
+
+    def track_acl(self, line):
+        self.fields = NO_FIELDS
+        words = line.replace(";", " ").replace("[", " ").replace("]", " ").split()
+        if not words or words[0].startswith(("#", "/*")):
+            return None
+        if words[0] == "set":
+            return self.set_line(words)
+
+        if words[0] == "inactive:":
+            words = words[1:]
+        if words[-1] == "{":
+            if len(words) > 2 and words[0] == "term":
+                self.start_term(words[1])
+            elif len(words) > 2 and words[0] == "family":
+                self.family = words[1]
+            self.blocks.append(words[:-1])
+            return self.filter_name()
+        if words[0] == "}":
+            if self.blocks:
+                block = self.blocks.pop()
+                if block[0] == "filter":
+                    self.term = None
+                elif block[0] == "family":
+                    self.family = "inet"
+            return None
+
+        # a statement, its meaning depends on the blocks it is in
+        name = self.filter_name()
+        if self.term is None:
+            return name
+        block = self.blocks[-1][0] if self.blocks else None
+        if block == "from":
+            self.add(words[0], words[1:])
+        elif block == "then":
+            self.finish(words[0])
+        elif block == "term" and words[0] == "then" and len(words) > 1:
+            self.finish(words[1])
+        elif len(self.blocks) > 1 and self.blocks[-2][0] == "from":
+            # the values of a condition, one per line
+            self.add(block, words)
+        return name
+
+    def filter_name(self):
+        for block in self.blocks:
+            if block[0] == "filter" and len(block) > 1:
+                return block[1]
+        return None
+
+    def set_line(self, words):
+        '''Tracks a line like "set firewall family inet filter NAME term TERM from protocol tcp".'''
+        if words[1:2] != ["firewall"] or "filter" not in words:
+            return None
+        i = words.index("filter")
+        if i + 1 >= len(words):
+            return None
+        family = words[words.index("family") + 1] if "family" in words[:i] else "inet"
+        if i + 4 < len(words) and words[i + 2] == "term":
+            if (words[i + 1], words[i + 3]) != self.term:
+                self.start_term(words[i + 3], words[i + 1])
+                self.family = family
+            clause = words[i + 4]
+            if clause == "from" and i + 5 < len(words):
+                self.add(words[i + 5], words[i + 6:])
+            elif clause == "then" and i + 5 < len(words):
+                self.finish(words[i + 5])
+        return words[i + 1]
+
+    def start_term(self, term, filter = None):
+        self.term = (filter, term)
+        self.values = {}
+        self.complete = True
+
+    def add(self, condition, values):
+        '''Adds the values of a match condition of the current term. All conditions have to match, so
+           leaving out the others only makes the rule match more packets.'''
+        if condition not in self.conditions or "except" in values:
+            self.complete = False
+        if "except" in values:
+            # an excluded address
+            return
+        self.values.setdefault(condition, []).extend(values)
+
+    def finish(self, action):
+        '''Turns the conditions of the current term into the fields of the line, if it has an action.'''
+        action = self.actions.get(action)
+        if action is None:
+            return
+        values = self.values
+        protocols = values.get("protocol", []) + values.get("next-header", [])
+        protocol = "ip"
+        if len(protocols) == 1 and (protocols[0] in PROTOCOL_NUMBERS or protocols[0].isdigit()):
+            protocol = protocols[0]
+        self.fields = (protocol, self.nets("source"), self.ports("source", protocol), self.nets("destination"), self.ports("destination", protocol), action)
+
+    def nets(self, side):
+        addresses = self.values.get(side + "-address")
+        if not addresses:
+            return self.family_any.get(self.family, "any")
+        return ",".join(address if "/" in address else address + ("/128" if ":" in address else "/32") for address in addresses)
+
+    def ports(self, side, protocol):
+        ports = []
+        for value in self.values.get(side + "-port", ()):
+            if "-" in value:
+                low, high = value.split("-", 1)
+                ports.append("range %s %s" % (low, high))
+            else:
+                port = self.port_names.get(value) or self.parser.resolve_port(value, protocol)
+                if port:
+                    ports.append("eq " + port)
+        return ",".join(ports) or None
+
+    def parse(self, words):
+        return self.fields
+
+    def exact(self, words):
+        return self.complete
+
+
+class IptablesDialect(ACLDialect):
+    """The rules of iptables-save and ip6tables-save (or of iptables commands in a script): "-A CHAIN"
+       followed by options. The chains are the ACLs. Options negated with "!" are taken as any."""
+    name = "iptables"
+    implicit_any = True
+
+    options = {
+        "-s": "source", "--source": "source", "--src": "source",
+        "-d": "destination", "--destination": "destination", "--dst": "destination",
+        "-p": "protocol", "--protocol": "protocol",
+        "--sport": "source_port", "--source-port": "source_port",
+        "--dport": "destination_port", "--destination-port": "destination_port",
+        "--sports": "source_port", "--source-ports": "source_port",
+        "--dports": "destination_port", "--destination-ports": "destination_port",
+        "-j": "target", "--jump": "target",
+        "-m": "module", "--match": "module",
+        "--comment": "comment",
+        "-A": "chain", "--append": "chain",
+    }
+
+    # the modules which only bring the options above
+    modules = ("tcp", "udp", "multiport", "comment")
+
+    actions = {"ACCEPT": "permit", "DROP": "deny", "REJECT": "deny"}
+    protocols = {"all": "ip", "ipv6-icmp": "icmp6", "icmpv6": "icmp6"}
+
+    def __init__(self, parser):
+        ACLDialect.__init__(self, parser)
+        self.complete = True
+
+    @classmethod
+    def detect(cls, line):
+        return line.startswith(("-A ", ":INPUT ", ":FORWARD ", ":OUTPUT ", "*filter", "# Generated by ip"))
+
+    def track_acl(self, line):
+        if line.startswith("-A "):
+            return line.split(None, 2)[1]
+        if line.startswith(("iptables -A ", "ip6tables -A ")):
+            return line.split(None, 3)[2]
+        return None
+
+    def parse(self, words):
+        i = 1 if words[0] in ("iptables", "ip6tables") else 0
+        if words[i:i + 1] != ["-A"] and words[i:i + 1] != ["--append"]:
+            return None
+        values = {}
+        complete = True
+        negated = False
+        count = len(words)
+        options = self.options
+        while i < count:
+            word = words[i]
+            i += 1
+            if word == "!":
+                negated = True
+                continue
+            option = options.get(word)
+            if option is None:
+                if word.startswith("-"):
+                    complete = False
+                continue
+            if i < count and words[i] == "!":
+                negated = True
+                i += 1
+            if i == count:
+                break
+            value = words[i]
+            i += 1
+            if negated:
+                # everything but the value, which is more than a rule can express
+                complete = False
+                negated = False
+            elif option == "module":
+                if value not in self.modules:
+                    complete = False
+            else:
+                values[option] = value
+
+        protocol = values.get("protocol", "ip")
+        protocol = self.protocols.get(protocol, protocol)
+        if protocol not in PROTOCOL_NUMBERS and not protocol.isdigit():
+            protocol = None
+        self.complete = complete and values.get("target") in self.actions
+        return (protocol, self.nets(values.get("source")), self.ports(values.get("source_port"), protocol),
+                self.nets(values.get("destination")), self.ports(values.get("destination_port"), protocol),
+                self.actions.get(values.get("target")))
+
+    def nets(self, value):
+        if value is None:
+            return "any"
+        return ",".join(net if "/" in net else net + ("/128" if ":" in net else "/32") for net in value.split(","))
+
+    def ports(self, value, protocol):
+        if value is None:
+            return None
+        ports = []
+        for port in value.split(","):
+            if ":" in port:
+                low, high = port.split(":", 1)
+                ports.append("range %s %s" % (low or "0", high or str(MAX_PORT)))
+            else:
+                ports.append("eq " + (self.parser.resolve_port(port, protocol) or port))
+        return ",".join(ports)
+
+    def exact(self, words):
+        return self.complete
+
+
+# the dialects by name, in the order they win ties in detect_dialect
+DIALECTS = dict((dialect.name, dialect) for dialect in (ASADialect, IOSDialect, NXOSDialect, JuniperDialect, IptablesDialect))
+
+def detect_dialect(lines):
+    '''Returns the name of the dialect most of the first lines (at most DETECT_LINES) are typical for,
+       None if there are none.'''
+    votes = collections.Counter()
+    dialects = list(DIALECTS.values())
+    for number, line in enumerate(lines):
+        if number == DETECT_LINES:
+            break
+        for dialect in dialects:
+            if dialect.detect(line):
+                votes[dialect.name] += 1
+    if not votes:
+        return None
+    return max(DIALECTS, key = votes.__getitem__)
+
+def file_dialect(path):
+    '''Returns the dialect of a file, see detect_dialect.'''
+    return detect_dialect(read_lines(path))
+
+
+# how the nets of the rules are compared with a net of the query, see ACLQuery.net_matches
+NET_MATCHES = ("intersects", "contains", "within")
+
+class ACLQuery:
+    """The compiled search criteria. All values are converted once to ints, so matching a parsed
+       ACLRule is pure integer comparison. IPv4 and IPv6 addresses are compared the same way,
+       see IPV6_BIT.
+
+       Instead of a single address, the source and destination may be nets or ranges of addresses
+       (see net_string_to_range), net_match tells which rules they match: those whose nets intersect
+       them, contain them or are within them. Single addresses are kept in source_ip and destination_ip
+       unless they have to be within the nets, everything else in source_net and destination_net."""
+    __slots__ = ("source_ip", "source_port", "destination_ip", "destination_port", "protocol", "match_any",
+                 "source_net", "destination_net", "net_match")
+
+    def __init__(self, sip = None, sport = None, dip = None, dport = None, protocol = None, match_any = False, net_match = "intersects"):
+        init = object.__setattr__
+        if net_match not in NET_MATCHES:
+            raise ValueError("Invalid net match %s" % net_match)
+        init(self, "net_match", net_match)
+        for side, address in (("source", sip), ("destination", dip)):
+            net = net_string_to_range(address) if address else None
+            if net and net[0] == net[1] and net_match != "within":
+                # a rule intersects a single address if it contains it
+                init(self, side + "_ip", net[0])
+                init(self, side + "_net", None)
+            else:
+                init(self, side + "_ip", None)
+                init(self, side + "_net", net)
+        init(self, "source_port", port_string_to_int(sport, protocol) if sport else None)
+        init(self, "destination_port", port_string_to_int(dport, protocol) if dport else None)
+        if protocol:
+            # unknown protocols only match rules for all ip protocols
+            protocol = int(protocol) if protocol.isdigit() else PROTOCOL_NUMBERS.get(protocol, -1)
+        init(self, "protocol", protocol)
+        init(self, "match_any", bool(match_any))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ACLQuery is immutable")
+
+    def net_matches(self, net, query_net):
+        '''Checks a net of a rule (a pair, an AddressSet or one of the "any" markers) against a net of the
+           query (low, high, pairs) as given by net_match. Pairs are compared bit by bit, which works for
+           non-contiguous masks as well: two pairs intersect if they agree where both masks are set.'''
+        low, high, pairs = query_net
+        if net.__class__ is AddressSet:
+            lows, highs = net.lows, net.highs
+            if not lows:
+                return False
+            if self.net_match == "within":
+                return lows[0] >= low and highs[-1] <= high
+            if self.net_match == "contains":
+                i = bisect.bisect_right(lows, low) - 1
+                return i >= 0 and highs[i] >= high
+            i = bisect.bisect_right(lows, high) - 1
+            return i >= 0 and highs[i] >= low
+
+        if net.__class__ is AnyMarker:
+            address, mask = net.net, net.mask
+        elif net == NEVER:
+            return False
+        else:
+            address, mask = net
+        if self.net_match == "within":
+            # the query is a single range, so the net is inside if its lowest and highest address are
+            first, last = prefix_range(address, mask)
+            return first >= low and last <= high
+        if self.net_match == "contains":
+            for query_address, query_mask in pairs:
+                if mask & ~query_mask or (address ^ query_address) & mask:
                     return False
-                if not self.ip_in_net(self.destination_ip_address, self.net_string_to_pair(self.parser.destination_net)):
+            return True
+        for query_address, query_mask in pairs:
+            if not (address ^ query_address) & mask & query_mask:
+                return True
+        return False
+
+    def matches(self, rule):
+        '''Checks a parsed ACLRule against the criteria.'''
+
+        # FIXME check any if desired
+        if self.source_ip is not None:
+            net = rule.source_net
+            if net.__class__ is not tuple:
+                # None, an object group or "any", which only counts for addresses of its family
+                if net is None or not net.contains(self.source_ip):
                     return False
-                
-            if self.protocol:
-                if not (self.parser.protocol == self.protocol or self.parser.protocol == "ip"):
+                if net.is_any:
+                    return self.match_any
+            elif self.source_ip & net[1] != net[0]:
+                return False
+        elif self.source_net is not None:
+            net = rule.source_net
+            if net is None or not self.net_matches(net, self.source_net):
+                return False
+            if net.__class__ is AnyMarker:
+                return self.match_any
+
+        if self.destination_ip is not None:
+            net = rule.destination_net
+            if net.__class__ is not tuple:
+                if net is None or not net.contains(self.destination_ip):
                     return False
-                
-            if self.source_port:
-                pattern = self.parser.source_port
-            
-                if pattern:
-                    # any is ok anyway
-
-                    # eq
-                    if pattern[:2] == "eq":
-                        parts = pattern.split()
-                        if not self.source_port in parts[1:]:
-                            return False
-
-                    # neq
-                    if pattern[:3] == "neq":
-                        if self.source_port == pattern[4:]:
-                            return False
-
-                    # gt
-                    if pattern[:2] == "gt":
-                        if int(self.source_port) <= int(pattern[3:]):
-                            return False
-
-                    # lt
-                    if pattern[:2] == "lt":
-                        if int(self.source_port) >= int(pattern[3:]):
-                            return False
-
-                    # range
-                    if pattern[:5] == "range":
-                        parts = pattern.split()
-                        if int(self.source_port) < int(parts[1]) or int(self.source_port) > int(parts[2]):
-                            return False
-
-            if self.destination_port:
-                pattern = self.parser.destination_port
-
-                if pattern:
-                    # any is ok anyway
-
-                    # eq
-                    if pattern[:2] == "eq":
-                        parts = pattern.split()
-                        if not self.destination_port in parts[1:]:
-                            return False
-
-                    # neq
-                    if pattern[:3] == "neq":
-                        if self.destination_port == pattern[4:]:
-                            return False
-
-                    # gt
-                    if pattern[:2] == "gt":
-                        if int(self.destination_port) <= int(pattern[3:]):
-                            return False
-
-                    # lt
-                    if pattern[:2] == "lt":
-                        if int(self.destination_port) >= int(pattern[3:]):
-                            return False
-
-                    # range
-                    if pattern[:5] == "range":
-                        parts = pattern.split()
-                        if int(self.destination_port) < int(parts[1]) or int(self.destination_port) > int(parts[2]):
-                            return False
-        except ValueError:
-            # some trouble when parsing stuff, let's assume this is not a match
-            return False
+                if net.is_any:
+                    return self.match_any
+            elif self.destination_ip & net[1] != net[0]:
+                return False
+        elif self.destination_net is not None:
+            net = rule.destination_net
+            if net is None or not self.net_matches(net, self.destination_net):
+                return False
+            if net.__class__ is AnyMarker:
+                return self.match_any
+
+        if self.protocol is not None:
+            if not (rule.protocol == self.protocol or rule.protocol == 0):
+                return False
+
+        # no ports or any is ok anyway
+        if self.source_port is not None and rule.source_ports is not None:
+            if not port_in_intervals(self.source_port, rule.source_ports):
+                return False
+
+        if self.destination_port is not None and rule.destination_ports is not None:
+            if not port_in_intervals(self.destination_port, rule.destination_ports):
+                return False
 
         return True
 
 
-if __name__ == '__main__':
+class PacketQuery(ACLQuery):
+    """The criteria describing a single packet, used to find the rule a firewall would apply.
+       Unlike in ACLQuery "any" always matches and the other criteria are still checked."""
+    __slots__ = ()
+
+    def __init__(self, sip = None, sport = None, dip = None, dport = None, protocol = None, match_any = True):
+        ACLQuery.__init__(self, sip, sport, dip, dport, protocol, match_any)
+        if self.source_net or self.destination_net:
+            raise ValueError("A packet has single addresses, not nets")
+
+    def matches(self, rule):
+        if self.source_ip is not None:
+            net = rule.source_net
+            if net.__class__ is not tuple:
+                if net is None or not net.contains(self.source_ip):
+                    return False
+            elif self.source_ip & net[1] != net[0]:
+                return False
+
+        if self.destination_ip is not None:
+            net = rule.destination_net
+            if net.__class__ is not tuple:
+                if net is None or not net.contains(self.destination_ip):
+                    return False
+            elif self.destination_ip & net[1] != net[0]:
+                return False
+
+        if self.protocol is not None:
+            if not (rule.protocol == self.protocol or rule.protocol == 0):
+                return False
+
+        if self.source_port is not None and rule.source_ports is not None:
+            if not port_in_intervals(self.source_port, rule.source_ports):
+                return False
+
+        if self.destination_port is not None and rule.destination_ports is not None:
+            if not port_in_intervals(self.destination_port, rule.destination_ports):
+                return False
+
+        return True
+
+
+# the fields of the tests of query expressions and their aliases, see ACLExpression
+EXPRESSION_FIELDS = {
+    "sip": "sip", "src": "sip", "source": "sip",
+    "dip": "dip", "dst": "dip", "destination": "dip",
+    "sport": "sport", "dport": "dport",
+    "proto": "proto", "protocol": "proto",
+    # either side
+    "ip": ("sip", "dip"), "port": ("sport", "dport"),
+}
+
+# the order of the criteria of ACLQuery and the relative costs of testing them, protocols are a single
+# comparison, ports a search in few intervals, nets may be object groups
+CRITERIA = ("sip", "sport", "dip", "dport", "proto")
+CRITERIA_COSTS = {"proto": 1, "sport": 2, "dport": 2, "sip": 3, "dip": 3}
+
+# number of tests of an and or or after which its children are sorted again
+REORDER_INTERVAL = 1024
+
+class Predicate:
+    """A node of the tree a query expression is compiled into (see ACLExpression). Each node counts how
+       often it was tested and passed, so and and or can test those of their children first which decide
+       the most for the least cost."""
+    cost = 1
+    tested = 0
+    passed = 0
+
+    def rate(self):
+        '''Returns the share of the tests which passed so far, 0.5 before the first one.'''
+        return (self.passed + 1.0) / (self.tested + 2.0)
+
+    def decay(self):
+        '''Halves the counts, so the order follows changes of the input.'''
+        self.tested //= 2
+        self.passed //= 2
+
+class TestPredicate(Predicate):
+    """A leaf of the tree: an ACLQuery with the criteria of a single test."""
+
+    def __init__(self, query, cost, field = None, value = None):
+        self.check = query.matches
+        self.cost = cost
+        self.field = field
+        self.value = value
+
+    def matches(self, rule):
+        self.tested += 1
+        if self.check(rule):
+            self.passed += 1
+            return True
+        return False
+
+class NotPredicate(Predicate):
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+
+    def matches(self, rule):
+        self.tested += 1
+        if self.child.matches(rule):
+            return False
+        self.passed += 1
+        return True
+
+class AndPredicate(Predicate):
+    """Passes if all children pass. The children are tested by cost first, after every REORDER_INTERVAL
+       tests by their cost per failure, so the cheap ones which fail most often come first."""
+
+    def __init__(self, children):
+        self.children = sorted(children, key = lambda child: child.cost)
+        self.cost = sum(child.cost for child in children)
+        self.countdown = REORDER_INTERVAL
+
+    def order(self, child):
+        return child.cost / (1.0 - child.rate())
+
+    def reorder(self):
+        self.countdown = REORDER_INTERVAL
+        self.children.sort(key = self.order)
+        for child in self.children:
+            child.decay()
+
+    def matches(self, rule):
+        self.tested += 1
+        self.countdown -= 1
+        if not self.countdown:
+            self.reorder()
+        for child in self.children:
+            if not child.matches(rule):
+                return False
+        self.passed += 1
+        return True
+
+class OrPredicate(AndPredicate):
+    """Passes if any child passes, the cheap ones which pass most often are tested first."""
+
+    def order(self, child):
+        return child.cost / child.rate()
+
+    def matches(self, rule):
+        self.tested += 1
+        self.countdown -= 1
+        if not self.countdown:
+            self.reorder()
+        for child in self.children:
+            if child.matches(rule):
+                self.passed += 1
+                return True
+        return False
+
+class ACLExpression:
+    """A query expression like "dip 10.0.0.0/8 and (dport 443 or dport 8443) and not proto icmp", compiled
+       once into a tree of predicates. A test is a field (sip, dip, sport, dport, proto, src and dst for sip
+       and dip, ip and port for either side) followed by a value like the ones of -i, -p and so on, "in" or
+       "=" in between are optional. Tests are combined with and, or, not and parentheses. Each test is an
+       ACLQuery of its own, so "any" only matches a net with match_any, all are checked against the same
+       parsed ACLRule. The criteria of ACLGrepper are another test combined with and.
+
+       query is an ACLQuery of the tests combined with and at the top and of the criteria, it matches all
+       rules the expression matches and maybe more. The prefilter and the index use it to skip the rules
+       which cannot match, only the rest is checked against the whole expression."""
+
+    def __init__(self, text, match_any = False, net_match = "intersects", criteria = (None,) * 5):
+        self.match_any = match_any
+        self.net_match = net_match
+        self.tokens = re.findall(r"[()]|[^\s()]+", text)
+        self.position = 0
+        root = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError("Invalid query expression, unexpected %s" % self.tokens[self.position])
+
+        tests = root.children if root.__class__ is AndPredicate else [root]
+        required = {}
+        for test in tests:
+            if test.__class__ is TestPredicate:
+                required.setdefault(test.field, test.value)
+        self.query = ACLQuery(*[criterion or required.get(field) for field, criterion in zip(CRITERIA, criteria)],
+                              match_any = match_any, net_match = net_match)
+
+        if any(criteria):
+            cost = sum(CRITERIA_COSTS[field] for field, criterion in zip(CRITERIA, criteria) if criterion)
+            root = AndPredicate([TestPredicate(ACLQuery(*criteria, match_any = match_any, net_match = net_match), cost), root])
+        self.root = root
+        self.matches = root.matches
+
+    def next_token(self, expected = None):
+        if self.position == len(self.tokens):
+            raise ValueError("Invalid query expression, %s missing at the end" % (expected or "a test"))
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def peek(self):
+        return self.tokens[self.position].lower() if self.position < len(self.tokens) else None
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == "or":
+            self.position += 1
+            children.append(self.parse_and())
+        return self.combine(OrPredicate, children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() not in (None, "or", ")"):
+            # and between the tests is optional
+            if self.peek() == "and":
+                self.position += 1
+            children.append(self.parse_not())
+        return self.combine(AndPredicate, children)
+
+    def combine(self, kind, children):
+        if len(children) == 1:
+            return children[0]
+        flat = []
+        for child in children:
+            flat.extend(child.children if child.__class__ is kind else [child])
+        return kind(flat)
+
+    def parse_not(self):
+        token = self.next_token()
+        if token.lower() == "not":
+            return NotPredicate(self.parse_not())
+        if token == "(":
+            node = self.parse_or()
+            if self.next_token(")") != ")":
+                raise ValueError("Invalid query expression, ) missing")
+            return node
+
+        field = EXPRESSION_FIELDS.get(token.lower())
+        if field is None:
+            raise ValueError("Invalid query expression, unknown field %s" % token)
+        value = self.next_token("a value")
+        if value.lower() in ("in", "=", "=="):
+            value = self.next_token("a value")
+        if isinstance(field, tuple):
+            return OrPredicate([self.test(f, value) for f in field])
+        return self.test(field, value)
+
+    def test(self, field, value):
+        criteria = dict.fromkeys(CRITERIA)
+        criteria[field] = value
+        query = ACLQuery(*[criteria[f] for f in CRITERIA], match_any = self.match_any, net_match = self.net_match)
+        return TestPredicate(query, CRITERIA_COSTS[field], field, value)
+
+
+class ACLTracer:
+    """Finds the first matching rule of each ACL for a packet, like the firewall would do.
+       Once an ACL has a hit, the remaining lines of that ACL are skipped without parsing them."""
+    parser = None
+
+    def __init__(self, sip = None, sport = None, dip = None, dport = None, protocol = None, parser = None):
+        self.parser = parser or ACLParser()
+        self.query = PacketQuery(sip, sport, dip, dport, protocol, True)
+
+        # (source, ACL name) -> (action, line number, line) of the first hit or None, in order of appearance
+        self.hits = {}
+        self.source = None
+
+    def new_file(self, source):
+        '''Starts a new file, ACLs of different files are different ACLs even if their names are equal.'''
+        self.source = source
+        self.parser.acl_name = None
+
+    def trace(self, line, line_number = None):
+        '''Checks the line and returns True if it is the first hit of its ACL.'''
+        key = (self.source, self.parser.track_acl(line))
+        hits = self.hits
+        if hits.get(key) is not None:
+            # the firewall never gets here
+            return False
+
+        self.parser.parse_line(line)
+        if not self.parser.action:
+            # remarks, headers and other lines which are no rules
+            return False
+
+        if key not in hits:
+            hits[key] = None
+        if self.query.matches(self.parser.current_rule()):
+            hits[key] = (self.parser.action, line_number, line.strip())
+            return True
+        return False
+
+    def results(self):
+        '''Returns a list of (source, ACL name, hit) in order of appearance, hit is a triple
+           (action, line number, line) or None if the packet is denied implicitly.'''
+        return [(source, name, hit) for (source, name), hit in self.hits.items()]
+
+
+class ACLShadowAnalyzer:
+    """Finds the rules of each ACL which can never match, because a single earlier rule of the same ACL
+       matches all their packets already. Such a rule is shadowed if the earlier one has another action,
+       redundant if it has the same.
+
+       Instead of comparing each rule with all earlier ones, the earlier rules are kept in a prefix trie
+       over their source nets, each of its prefixes has a prefix trie over the destination nets. Only the
+       rules found in both, i.e. those whose nets contain the nets of the rule, are compared further.
+       Rules which are covered themselves are not added, the earlier rule covers all they would cover."""
+    parser = None
+
+    # the tries are one bit wider than the address space: the top bit is set for missing nets (None),
+    # which are only covered by missing nets
+    width = ADDRESS_WIDTH + 1
+    missing = (1 << ADDRESS_WIDTH, ADDRESS_WIDTH + 1)
+
+    def __init__(self, parser = None):
+        self.parser = parser or ACLParser()
+        # (source, ACL name) -> (trie of source nets, destination tries by source prefix, earlier rules)
+        self.acls = {}
+        # (source, ACL name, "shadowed" or "redundant", (line number, line), (line number, line) of the earlier rule)
+        self.found = []
+        self.source = None
+
+    def new_file(self, source):
+        '''Starts a new file, ACLs of different files are different ACLs even if their names are equal.'''
+        self.source = source
+        self.parser.acl_name = None
+
+    def prefix(self, net):
+        '''Returns the smallest prefix (net, length) of the tries containing all addresses of the net.'''
+        if net is None:
+            return self.missing
+        ranges = net_ranges(net)
+        low, high = ranges[0][0], ranges[-1][1]
+        return (low, self.width - (low ^ high).bit_length())
+
+    def exact(self, line, rule):
+        '''Checks if the rule applies to all packets described by its ACLRule. Words after the last net or
+           port (ICMP types, TCP flags, time ranges, inactive, ...) restrict it further, so it must not be
+           used to cover other rules, only logging and hit counts may follow.'''
+        if rule.protocol == 0 and self.parser.protocol and self.parser.protocol.startswith("object"):
+            # a group of services with different protocols, all ports are taken for all protocols
+            return False
+        for net in (rule.source_net, rule.destination_net):
+            if net.__class__ is tuple and not is_prefix(*net):
+                # its range includes addresses which are not part of it, see net_ranges
+                return False
+        words = line.split()
+        if self.parser.dialect is not None:
+            exact = self.parser.dialect.exact(words)
+            if exact is not None:
+                return exact
+        nets, ports, protocols, action = self.parser.tokenize(words, ":" in line)
+        end = max(hit[0] for hit in nets[-1:] + ports[-1:] + [(0, None)])
+        return end == len(words) or words[end] in ("log", "log-input") or words[end].startswith("(hitcnt=")
+
+    def covers(self, earlier, rule, ranges):
+        '''Checks if an earlier rule, an entry of the earlier rules of the ACL, matches all packets of the rule.'''
+        cover = earlier[0]
+        if cover.protocol != rule.protocol and not (cover.protocol == 0 and rule.protocol is not None):
+            return False
+        for mine, theirs in ((cover.source_ports, rule.source_ports), (cover.destination_ports, rule.destination_ports)):
+            if mine is not None and (theirs is None or not ranges_cover(mine, [i[0] for i in mine], theirs)):
+                return False
+        for mine, theirs in zip(earlier[3:5], ranges):
+            if mine is None or theirs is None:
+                if mine is not theirs:
+                    return False
+            elif not ranges_cover(mine[0], mine[1], theirs):
+                return False
+        return True
+
+    def check(self, line, line_number = None):
+        '''Checks the line and returns the earlier rule (line number, line) covering it or None.'''
+        key = (self.source, self.parser.track_acl(line))
+        self.parser.parse_line(line)
+        if not self.parser.action:
+            return None
+        rule = self.parser.current_rule()
+        if NEVER in (rule.source_net, rule.destination_net) or () in (rule.source_ports, rule.destination_ports):
+            # matches nothing anyway
+            return None
+
+        acl = self.acls.get(key)
+        if acl is None:
+            acl = self.acls[key] = (PrefixTrie(self.width), {}, [])
+        trie, destinations, earlier = acl
+
+        ranges = [None if net is None else net_ranges(net) for net in (rule.source_net, rule.destination_net)]
+        source, destination = self.prefix(rule.source_net), self.prefix(rule.destination_net)
+        cover = None
+        for source_prefix in trie.covering(*source):
+            for n in destinations[source_prefix].covering(*destination):
+                if (cover is None or n < cover) and self.covers(earlier[n], rule, ranges):
+                    cover = n
+
+        if cover is not None:
+            hit = earlier[cover]
+            kind = "redundant" if hit[0].action == rule.action else "shadowed"
+            self.found.append((self.source, key[1], kind, (line_number, line.strip()), hit[1:3]))
+            return hit[1:3]
+
+        if self.exact(line, rule):
+            if source not in destinations:
+                destinations[source] = PrefixTrie(self.width)
+                trie.insert(source[0], source[1], source)
+            destinations[source].insert(destination[0], destination[1], len(earlier))
+            earlier.append((rule, line_number, line.strip()) + tuple(None if r is None else (r, [i[0] for i in r]) for r in ranges))
+        return None
+
+    def results(self):
+        '''Returns a list of (source, ACL name, kind, (line number, line), (line number, line) of the
+           earlier rule) for all rules which can never match, kind is "shadowed" or "redundant".'''
+        return self.found
+
+
+def hit_annotation(line):
+    '''Returns the hit count and the rule hash of a line of "show access-list" output, e.g. 920296 and
+       "0x4c3b867e" for "... (hitcnt=920296) 0x4c3b867e". Either is None if the line has none.'''
+    words = line.split()
+    if len(words) < 2 or not words[-1].startswith("0x"):
+        return None, None
+    if words[-2].startswith("(hitcnt=") and words[-2].endswith(")") and words[-2][8:-1].isdigit():
+        return int(words[-2][8:-1]), words[-1]
+    return None, words[-1]
+
+
+class ACLHitCounter:
+    """Sums up the hit counts of "show access-list" output of the ASA in a single pass: the rules with
+       the most hits, the rules without hits and the totals of each ACL. Rules with object groups only
+       show their hash, their hits are those of the expanded (indented) lines below them.
+
+       Only the top rules (in a heap), the totals and the current rule are kept, so the memory does
+       not grow with the output. The rules without hits are handed to unused (with source, ACL name,
+       line number and line) as soon as they are complete. Given the counts of an older output of the
+       same device (see counts), only the hits since then are counted, rules are matched by their
+       ACL and hash. Lower counts than before mean that the counters were cleared in between."""
+
+    def __init__(self, top = 10, since = None, parser = None, unused = None, counts = None):
+        import heapq
+        self.heappush, self.heappushpop = heapq.heappush, heapq.heappushpop
+        self.parser = parser or ACLParser()
+        self.size = top
+        self.since = since
+        self.unused = unused
+        # (ACL name, hash) -> hits of all rules, if given
+        self.counts = counts
+        # (hits, -sequence number, (source, ACL name, line number, line)), the smallest first
+        self.heap = []
+        self.rules = 0
+        # (source, ACL name) -> [rules, hits, rules without hits], in order of appearance
+        self.acls = {}
+        # [source, ACL name, line number, line, hash, own hits, hits of the expanded lines]
+        self.current = None
+        self.source = None
+
+    def new_file(self, source):
+        '''Starts a new file, ACLs of different files are different ACLs even if their names are equal.'''
+        self.finish()
+        self.source = source
+        self.parser.acl_name = None
+
+    def check(self, line, line_number = None):
+        hits, rule_hash = hit_annotation(line)
+        if rule_hash is None:
+            return
+        # only rules count, the nets and ports do not matter here
+        keywords = self.parser.keywords
+        for word in line.split():
+            kind = keywords.get(word)
+            if kind == ACLParser.ACTION:
+                break
+            if kind == ACLParser.REMARK:
+                return
+        else:
+            return
+        acl = self.parser.track_acl(line)
+
+        current = self.current
+        if line[:1].isspace() and current and current[1] == acl:
+            current[6] += hits or 0
+            return
+        self.finish()
+        self.current = [self.source, acl, line_number, line.strip(), rule_hash, hits, 0]
+
+    def finish(self):
+        '''Adds the current rule to the results, it is complete as soon as the next rule or file starts.'''
+        current = self.current
+        if current is None:
+            return
+        self.current = None
+        source, acl, line_number, line, rule_hash, hits, expanded = current
+        if hits is None:
+            hits = expanded
+        if self.counts is not None:
+            self.counts[(acl, rule_hash)] = hits
+        if self.since is not None:
+            before = self.since.get((acl, rule_hash))
+            if before is not None and before <= hits:
+                hits -= before
+
+        totals = self.acls.get((source, acl))
+        if totals is None:
+            totals = self.acls[(source, acl)] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += hits
+        if not hits:
+            totals[2] += 1
+            if self.unused:
+                self.unused(source, acl, line_number, line)
+
+        # the earlier rule wins among equal counts
+        self.rules += 1
+        entry = (hits, -self.rules, (source, acl, line_number, line))
+        if hits and len(self.heap) < self.size:
+            self.heappush(self.heap, entry)
+        elif hits and self.size:
+            self.heappushpop(self.heap, entry)
+
+    def top(self):
+        '''Returns (hits, source, ACL name, line number, line) of the rules with the most hits, the most first.'''
+        self.finish()
+        return [(entry[0],) + entry[2] for entry in sorted(self.heap, reverse = True)]
+
+    def totals(self):
+        '''Returns (source, ACL name, rules, hits, rules without hits) of all ACLs.'''
+        self.finish()
+        return [key + tuple(totals) for key, totals in self.acls.items()]
+
+
+class ACLGrepper:
+    '''The main class which handles the grep process as a whole.'''
+    # created per instance, so importing the module does not create any parser
+    parser = None
+
+    source_ip_string = None
+    source_ip_address = None
+    source_port = None
+
+    destination_ip_string = None
+    destination_ip_address = None
+    destination_port = None
+
+    protocol = None
+    match_any = False
+
+
+    def __init__(self, sip = None, sport = None, dip = None, dport = None, protocol = None, match_any = None, parser = None, net_match = "intersects", expression = None):
+        self.parser = parser or ACLParser()
+
+        # compile the criteria once, every line is only parsed and compared afterwards
+        self.query = ACLQuery(sip, sport, dip, dport, protocol, match_any, net_match)
+        self.matches = self.query.matches
+
+        # the expression includes the criteria, its query only narrows down the rules, see ACLExpression
+        self.expression = None
+        if expression:
+            self.expression = ACLExpression(expression, match_any, net_match, (sip, sport, dip, dport, protocol))
+            self.matches = self.expression.matches
+
+        # the addresses are None for nets
+        self.source_ip_string = sip
+        self.source_ip_address = self.query.source_ip
+        self.source_port = sport
+
+        self.destination_ip_string = dip
+        self.destination_ip_address = self.query.destination_ip
+        self.destination_port = dport
+
+        self.protocol = protocol
+        self.match_any = match_any
+
+        if self.expression:
+            self.query = self.expression.query
+
+    def ip_to_bits(self, address):
+        '''Turns an IP address in dot notation into a single long value.'''
+        return ip_to_bits(address)
+
+    def ip_in_net(self, ip, net):
+        '''Checks if an IP adress is contained in a network described by a pair (net address, subnetmask).
+           All values are given as longs.'''
+        return ip_in_net(ip, net)
+
+    def ip_and_mask_to_pair(self, pattern):
+        '''Takes a mask pattern and creates a pair (net address, subnetmask) from it.'''
+        return ip_and_mask_to_pair(pattern)
+
+    def ip_and_cidr_to_pair(self, pattern):
+        '''Takes a CIDR pattern and creates a pair (net address, subnetmask) from it.'''
+        return ip_and_cidr_to_pair(pattern)
+
+    def net_string_to_pair(self, pattern):
+        return net_string_to_pair(pattern)
+
+    def grep(self, line):
+        return self.matches(self.parser.parse_rule(line))
+
+
+class PrefixTrie:
+    """A Patricia trie over network prefixes. Each node is a list [net, length, values, child0, child1],
+       paths without values are compressed, so the depth depends on the number of distinct prefixes
+       only."""
+
+    def __init__(self, width = 32):
+        self.width = width
+        all_bits = (1 << width) - 1
+        self.masks = [all_bits ^ ((1 << (width - length)) - 1) for length in range(width + 1)]
+        self.root = [0, 0, [], None, None]
+
+    def insert(self, net, length, value):
+        '''Stores a value for the prefix net/length.'''
+        width = self.width
+        net &= self.masks[length]
+        node = self.root
+        while True:
+            if node[1] == length:
+                node[2].append(value)
+                return
+
+            index = 3 + ((net >> (width - 1 - node[1])) & 1)
+            child = node[index]
+            if child is None:
+                node[index] = [net, length, [value], None, None]
+                return
+            if child[1] <= length and net & self.masks[child[1]] == child[0]:
+                # the new prefix is inside the child
+                node = child
+                continue
+
+            # number of leading bits the child and the new prefix have in common
+            common = min(child[1], length, width - (child[0] ^ net).bit_length())
+            if common == child[1]:
+                node = child
+                continue
+
+            # split the edge to the child
+            middle = [net & self.masks[common], common, [], None, None]
+            middle[3 + ((child[0] >> (width - 1 - common)) & 1)] = child
+            node[index] = middle
+            if common == length:
+                middle[2].append(value)
+            else:
+                middle[3 + ((net >> (width - 1 - common)) & 1)] = [net, length, [value], None, None]
+            return
+
+    def lookup(self, ip):
+        '''Returns the values of all prefixes containing the address.'''
+        width = self.width
+        masks = self.masks
+        result = []
+        node = self.root
+        while node is not None and ip & masks[node[1]] == node[0]:
+            result.extend(node[2])
+            if node[1] == width:
+                break
+            node = node[3 + ((ip >> (width - 1 - node[1])) & 1)]
+        return result
+
+    def covering(self, net, length):
+        '''Returns the values of all prefixes containing the prefix net/length.'''
+        width = self.width
+        masks = self.masks
+        result = []
+        node = self.root
+        while node is not None and node[1] <= length and net & masks[node[1]] == node[0]:
+            result.extend(node[2])
+            if node[1] == width:
+                break
+            node = node[3 + ((net >> (width - 1 - node[1])) & 1)]
+        return result
+
+
+    def overlapping(self, net, length):
+        '''Returns the values of all prefixes containing the prefix net/length or inside of it.'''
+        width = self.width
+        masks = self.masks
+        result = []
+        node = self.root
+        while node is not None:
+            if node[1] >= length:
+                if node[0] & masks[length] == net & masks[length]:
+                    # the whole subtree is inside
+                    nodes = [node]
+                    while nodes:
+                        node = nodes.pop()
+                        result.extend(node[2])
+                        nodes.extend(child for child in node[3:] if child is not None)
+                break
+            if net & masks[node[1]] != node[0]:
+                break
+            result.extend(node[2])
+            node = node[3 + ((net >> (width - 1 - node[1])) & 1)]
+        return result
+
+
+class IntervalIndex:
+    """A static centered interval tree answering which intervals contain a given point.
+       Each node is a tuple (center, intervals sorted by low, intervals sorted by high descending,
+       left subtree, right subtree), the intervals are triples (low, high, value)."""
+
+    def __init__(self, intervals):
+        self.root = self.build(list(intervals))
+
+    def build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(i[0] for i in intervals)
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for i in intervals:
+            if i[1] < center:
+                left.append(i)
+            elif i[0] > center:
+                right.append(i)
+            else:
+                here.append(i)
+        return (center,
+                sorted(here, key=lambda i: i[0]),
+                sorted(here, key=lambda i: i[1], reverse=True),
+                self.build(left), self.build(right))
+
+    def lookup(self, point):
+        '''Returns the values of all intervals containing the point.'''
+        result = []
+        node = self.root
+        while node is not None:
+            center, by_low, by_high, left, right = node
+            if point < center:
+                for low, high, value in by_low:
+                    if low > point:
+                        break
+                    result.append(value)
+                node = left
+            elif point > center:
+                for low, high, value in by_high:
+                    if high < point:
+                        break
+                    result.append(value)
+                node = right
+            else:
+                result.extend(i[2] for i in by_low)
+                break
+        return result
+
+
+# numpy is optional, it is only imported by load_numpy when rules are checked in bulk
+numpy = None
+numpy_loaded = False
+
+def load_numpy():
+    '''Returns the numpy module or None if it is not installed. It is imported on first use only,
+       importing it takes longer than most greps.'''
+    global numpy, numpy_loaded
+    if not numpy_loaded:
+        numpy_loaded = True
+        try:
+            import numpy as module
+            numpy = module
+        except ImportError:
+            pass
+    return numpy
+
+BITS_64 = (1 << 64) - 1
+
+class RuleTable:
+    """Parsed rules stored as columns of plain integers (a struct of arrays) instead of an ACLRule object
+       each, which takes a fraction of the memory: about 31 bytes per rule and 4 bytes per port interval.
+       Rules are appended and read back by their number as ACLRule. The columns are arrays of the array
+       module, so they are pickled as plain bytes and turned into numpy arrays without copying, to check
+       a query against all rules at once (see select).
+
+       IPv4 nets are stored in the net and mask columns, IPv6 nets in a table of their own (nets6) which
+       the net column refers to, the kind column tells which one it is or if it is one of the constants.
+       The port intervals of all rules are stored one after the other, port_start tells where those of
+       a rule start. Rules which do not fit (object groups) are kept as they are in others."""
+
+    # kinds of nets, see constants
+    NET4, NET6, NO_NET, NEVER_NET, ANY_NET, ANY4_NET, ANY6_NET = range(7)
+    constants = {NO_NET: None, NEVER_NET: NEVER, ANY_NET: ANY, ANY4_NET: ANY4, ANY6_NET: ANY6}
+    kinds = dict((value, kind) for kind, value in constants.items())
+    actions = (None, "permit", "deny", "remark")
+    action_codes = dict((action, code) for code, action in enumerate(actions))
+
+    def __init__(self, rules = ()):
+        self.count = 0
+        self.columns = {"protocol": array.array("h"), "action": array.array("B")}
+        for side in ("source", "destination"):
+            for name, typecode in (("kind", "B"), ("net", "I"), ("mask", "I"), ("ports_any", "B"), ("port_start", "I"), ("port_low", "H"), ("port_high", "H")):
+                self.columns[side + "_" + name] = array.array(typecode)
+        self.nets6 = dict((name, array.array("Q")) for name in ("net_high", "net_low", "mask_high", "mask_low"))
+        # the columns of each side in the order of decode_side
+        self.sides = [tuple(self.columns[side + "_" + name] for name in ("kind", "net", "mask", "ports_any", "port_start", "port_low", "port_high"))
+                      for side in ("source", "destination")]
+        # number -> ACLRule
+        self.others = {}
+        self.extend(rules)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield self[number]
+
+    def extend(self, rules):
+        for rule in rules:
+            self.append(rule)
+
+    def append(self, rule):
+        '''Stores the rule as the next one.'''
+        columns = self.columns
+        number = self.count
+        self.count += 1
+
+        sides = [self.encode_net(rule.source_net), self.encode_net(rule.destination_net)]
+        protocol = -2 if rule.protocol is None else rule.protocol
+        action = self.action_codes.get(rule.action)
+        if None in sides or action is None or not -2 <= protocol <= 255:
+            # stored with placeholders, select checks these rules one by one
+            self.others[number] = rule
+            sides = [(self.NO_NET, 0, 0)] * 2
+            protocol, action, ports = -2, 0, (None, None)
+        else:
+            ports = (rule.source_ports, rule.destination_ports)
+
+        columns["protocol"].append(protocol)
+        columns["action"].append(action)
+        for side, (kind, net, mask), intervals in zip(("source", "destination"), sides, ports):
+            columns[side + "_kind"].append(kind)
+            columns[side + "_net"].append(net)
+            columns[side + "_mask"].append(mask)
+            columns[side + "_ports_any"].append(intervals is None)
+            columns[side + "_port_start"].append(len(columns[side + "_port_low"]))
+            for low, high in intervals or ():
+                columns[side + "_port_low"].append(low)
+                columns[side + "_port_high"].append(high)
+
+    def encode_net(self, net):
+        '''Returns the kind, net and mask column values of a net, None if it cannot be stored.'''
+        if net.__class__ is tuple and net != NEVER:
+            address, mask = net
+            if mask >> 32 == IPV6_BIT >> 32 and 0 <= address <= 0xffffffff:
+                return (self.NET4, address, mask & 0xffffffff)
+            if address >> 128 == 1 and mask >> 128 == 1:
+                nets6 = self.nets6
+                nets6["net_high"].append((address >> 64) & BITS_64)
+                nets6["net_low"].append(address & BITS_64)
+                nets6["mask_high"].append((mask >> 64) & BITS_64)
+                nets6["mask_low"].append(mask & BITS_64)
+                return (self.NET6, len(nets6["net_low"]) - 1, 0)
+            return None
+        kind = self.kinds.get(net) if net is None or net.__class__ is not AddressSet else None
+        return None if kind is None else (kind, 0, 0)
+
+    def decode_side(self, side, number):
+        '''Returns the net and the ports of one side of a rule.'''
+        kinds, nets, masks, ports_any, starts, lows, highs = side
+        kind = kinds[number]
+        if kind == self.NET4:
+            net = (nets[number], IPV6_BIT | masks[number])
+        elif kind == self.NET6:
+            nets6, n = self.nets6, nets[number]
+            net = (IPV6_BIT | (nets6["net_high"][n] << 64) | nets6["net_low"][n],
+                   IPV6_BIT | (nets6["mask_high"][n] << 64) | nets6["mask_low"][n])
+        else:
+            net = self.constants[kind]
+
+        if ports_any[number]:
+            return net, None
+        start = starts[number]
+        end = starts[number + 1] if number + 1 < len(starts) else len(lows)
+        return net, tuple(zip(lows[start:end], highs[start:end]))
+
+    def __getitem__(self, number):
+        '''Returns the rule with the given number as ACLRule.'''
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError("rule number out of range")
+        rule = self.others.get(number)
+        if rule is not None:
+            return rule
+
+        protocol = self.columns["protocol"][number]
+        source_net, source_ports = self.decode_side(self.sides[0], number)
+        destination_net, destination_ports = self.decode_side(self.sides[1], number)
+        return ACLRule(None if protocol == -2 else protocol, source_net, source_ports, destination_net, destination_ports,
+                       self.actions[self.columns["action"][number]])
+
+    def action(self, number):
+        '''Returns the action of a rule without building the whole ACLRule.'''
+        rule = self.others.get(number)
+        return rule.action if rule is not None else self.actions[self.columns["action"][number]]
+
+    def net_hits(self, np, columns, side, ip):
+        '''Returns which nets of the side contain the address.'''
+        kind = columns[side + "_kind"]
+        if not ip & IPV6_BIT:
+            return (((columns[side + "_mask"] & ip) == columns[side + "_net"]) & (kind == self.NET4)) | (kind == self.ANY_NET) | (kind == self.ANY4_NET)
+
+        hits = (kind == self.ANY_NET) | (kind == self.ANY6_NET)
+        rows = np.flatnonzero(kind == self.NET6)
+        if len(rows):
+            ids = columns[side + "_net"][rows]
+            nets6 = dict((name, np.frombuffer(column, column.typecode)[ids]) for name, column in self.nets6.items())
+            high, low = np.uint64((ip >> 64) & BITS_64), np.uint64(ip & BITS_64)
+            inside = ((nets6["mask_high"] & high) == nets6["net_high"]) & ((nets6["mask_low"] & low) == nets6["net_low"])
+            hits[rows[inside]] = True
+        return hits
+
+    def range_hits(self, np, columns, side, query, net):
+        '''Returns which nets of the side match a net of the query, see ACLQuery.net_matches. IPv6 nets
+           are checked one by one, there are few of them usually.'''
+        kind = columns[side + "_kind"]
+        hits = np.zeros(self.count, bool)
+        for constant_kind, constant in self.constants.items():
+            if constant is not None and query.net_matches(constant, net):
+                hits |= kind == constant_kind
+
+        low, high, pairs = net
+        if low & IPV6_BIT:
+            side_columns = self.sides[side == "destination"]
+            for row in np.flatnonzero(kind == self.NET6).tolist():
+                if query.net_matches(self.decode_side(side_columns, row)[0], net):
+                    hits[row] = True
+            return hits
+
+        nets, masks = columns[side + "_net"], columns[side + "_mask"]
+        if query.net_match == "within":
+            inside = (nets >= low) & ((nets | ~masks) <= high)
+        elif query.net_match == "contains":
+            inside = np.ones(self.count, bool)
+            for address, mask in pairs:
+                inside &= ((masks & (0xffffffff & ~mask)) == 0) & (((nets ^ address) & masks) == 0)
+        else:
+            inside = np.zeros(self.count, bool)
+            for address, mask in pairs:
+                inside |= ((nets ^ address) & masks & (mask & 0xffffffff)) == 0
+        return hits | (inside & (kind == self.NET4))
+
+    def port_hits(self, np, columns, side, port):
+        '''Returns which rules allow the port on the side.'''
+        hits = columns[side + "_ports_any"].astype(bool)
+        inside = np.flatnonzero((columns[side + "_port_low"] <= port) & (port <= columns[side + "_port_high"]))
+        # the rule of an interval is the last one starting at or before it
+        hits[np.searchsorted(columns[side + "_port_start"], inside, "right") - 1] = True
+        return hits
+
+    def select(self, query, np):
+        '''Returns the numbers of the rules matching the query in order, the same as checking each of the
+           rules with query.matches.'''
+        columns = dict((name, np.frombuffer(column, column.typecode)) for name, column in self.columns.items())
+
+        result = np.ones(self.count, bool)
+        if query.protocol is not None:
+            protocols = columns["protocol"]
+            result &= (protocols == query.protocol) | (protocols == 0)
+        if query.source_port is not None:
+            result &= self.port_hits(np, columns, "source", query.source_port)
+        if query.destination_port is not None:
+            result &= self.port_hits(np, columns, "destination", query.destination_port)
+
+        # the source is checked first by ACLQuery.matches, so it is applied last here: a contained
+        # "any" decides on its own, unless all criteria are checked anyway (PacketQuery)
+        for side, ip, net in (("destination", query.destination_ip, query.destination_net), ("source", query.source_ip, query.source_net)):
+            if ip is not None or net is not None:
+                contains = self.net_hits(np, columns, side, ip) if net is None else self.range_hits(np, columns, side, query, net)
+                if isinstance(query, PacketQuery):
+                    result &= contains
+                else:
+                    result = np.where(contains & (columns[side + "_kind"] >= self.ANY_NET), query.match_any, contains & result)
+
+        numbers = np.flatnonzero(result).tolist()
+        if self.others:
+            matched = set(numbers)
+            for number, rule in self.others.items():
+                if query.matches(rule):
+                    matched.add(number)
+                else:
+                    matched.discard(number)
+            numbers = sorted(matched)
+        return numbers
+
+
+# with numpy, all rules are checked at once if more than 1 / VECTOR_SHARE of them are candidates
+VECTOR_SHARE = 32
+
+class ACLFileIndex:
+    """The parsed rules of a single file together with the lookup structures for them.
+       The file is identified by its path, modification time and size."""
+
+    # check queries which select many rules with numpy, if it is installed (see RuleTable)
+    vectorize = True
+
+    def __init__(self, path, parser, known = None):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+
+        # the file is read once for its hash, its definitions and its lines
+        self.digest, lines = read_file(path)
+        objects = ACLObjects()
+        objects.read(lines)
+        parser.use_objects(objects)
+        self.parser_name = parser.__class__.__name__
+        self.fingerprint = objects.fingerprint()
+        self.names = frozenset(objects.names)
+        self.dialect = objects.dialect
+        if parser.dialect is not None and parser.dialect.stateful:
+            # the rule of a line depends on the lines before
+            known = None
+
+        # lines seen before are not parsed again, see rule_key
+        known = known or {}
+        self.lines = []
+        rules = []
+        self.parsed = 0
+        for line in lines:
+            line = line.strip()
+            seen = known.get(self.rule_key(line))
+            if seen is None:
+                rule = parser.parse_rule(line)
+                self.parsed += 1
+            else:
+                rule = seen[0][seen[1]]
+            self.lines.append(line)
+            rules.append(rule)
+
+        self.source_nets = PrefixTrie(ADDRESS_WIDTH)
+        self.destination_nets = PrefixTrie(ADDRESS_WIDTH)
+        self.source_any = []
+        self.destination_any = []
+        self.protocols = {}
+        self.unrestricted_source_ports = []
+        self.unrestricted_destination_ports = []
+        source_ports = []
+        destination_ports = []
+
+        for number, rule in enumerate(rules):
+            self.add_net(rule.source_net, number, self.source_nets, self.source_any)
+            self.add_net(rule.destination_net, number, self.destination_nets, self.destination_any)
+            self.protocols.setdefault(rule.protocol, []).append(number)
+            self.add_ports(rule.source_ports, number, source_ports, self.unrestricted_source_ports)
+            self.add_ports(rule.destination_ports, number, destination_ports, self.unrestricted_destination_ports)
+
+        self.source_ports = IntervalIndex(source_ports)
+        self.destination_ports = IntervalIndex(destination_ports)
+        self.rules = RuleTable(rules)
+
+    def rule_key(self, line):
+        '''Returns the key of the parsed rule of a line for reusing it in other files or versions of
+           the file. The rule depends on the line only, unless it refers to names or objects, then
+           it depends on the definitions as well, and on the dialect of the file.'''
+        if "object" in line or (self.names and not self.names.isdisjoint(line.split())):
+            return (self.fingerprint, line)
+        if self.dialect:
+            return (self.dialect, line)
+        return line
+
+    def remember(self, known):
+        '''Adds where the parsed rules are to known, so they are reused when parsing other files.'''
+        dialect = DIALECTS.get(self.dialect)
+        if dialect is not None and dialect.stateful:
+            return
+        rule_key = self.rule_key
+        for number, line in enumerate(self.lines):
+            known[rule_key(line)] = (self.rules, number)
+
+    def diff(self, old):
+        '''Returns the rules (ACEs) which were added and removed since the old version of the file,
+           as lists of lines in the order of the files.'''
+        new_lines = collections.Counter(line for number, line in enumerate(self.lines) if self.rules.action(number))
+        old_lines = collections.Counter(line for number, line in enumerate(old.lines) if old.rules.action(number))
+        added, removed = new_lines - old_lines, old_lines - new_lines
+
+        def take(counter, lines):
+            result = []
+            for line in lines:
+                if counter[line] > 0:
+                    counter[line] -= 1
+                    result.append(line)
+            return result
+        return take(added, self.lines), take(removed, old.lines)
+
+    def add_net(self, net, number, trie, any_list):
+        if isinstance(net, AnyMarker):
+            # the family of "any4" and "any6" is checked by the query
+            any_list.append(number)
+        elif isinstance(net, AddressSet):
+            for low, high in net.ranges():
+                for prefix, length in range_to_prefixes(low, high):
+                    trie.insert(prefix, length, number)
+        elif net is not None and net != NEVER:
+            # a net with a non-contiguous mask is stored at the longest prefix containing it
+            trie.insert(net[0], prefix_length(*net), number)
+
+    def add_ports(self, ports, number, intervals, unrestricted):
+        if ports is None:
+            unrestricted.append(number)
+        else:
+            intervals.extend((low, high, number) for low, high in ports)
+
+    def is_current(self):
+        '''Checks if the file did not change since the index was built.'''
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+
+    def refresh(self):
+        '''Checks if the content of a file which was touched is still the same, and takes over its new
+           modification time and size if so. Returns False if it needs to be parsed again.'''
+        try:
+            if file_digest(self.path) != self.digest:
+                return False
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        return True
+
+    def candidates(self, query):
+        '''Returns the numbers of the rules which might match the query, using the most selective
+           criterion available.'''
+        numbers = None
+        if query.source_ip is not None:
+            numbers = self.source_nets.lookup(query.source_ip)
+        elif query.destination_ip is not None:
+            numbers = self.destination_nets.lookup(query.destination_ip)
+        else:
+            for net, trie in ((query.source_net, self.source_nets), (query.destination_net, self.destination_nets)):
+                if net is not None:
+                    numbers = [n for pair in net[2] for n in trie.overlapping(pair[0], prefix_length(*pair))]
+                    break
+        if numbers is not None:
+            if query.match_any:
+                # a rule with "any" on a side the query asks for matches whatever its other side is,
+                # so the "any" rules of both sides are candidates, not only those of the side looked up
+                if query.source_ip is not None or query.source_net is not None:
+                    numbers = numbers + self.source_any
+                if query.destination_ip is not None or query.destination_net is not None:
+                    numbers = numbers + self.destination_any
+            return numbers
+        if query.destination_port is not None:
+            return self.destination_ports.lookup(query.destination_port) + self.unrestricted_destination_ports
+        if query.source_port is not None:
+            return self.source_ports.lookup(query.source_port) + self.unrestricted_source_ports
+        if query.protocol is not None:
+            return self.protocols.get(query.protocol, []) + (self.protocols.get(0, []) if query.protocol else [])
+        return range(len(self.rules))
+
+    def numbers(self, query):
+        '''Returns the numbers of all rules matching the query in the order of the file.'''
+        np = load_numpy() if self.vectorize else None
+        if np is not None and query.source_ip is None and query.destination_ip is None and query.source_net is None and query.destination_net is None:
+            # ports and protocols select large parts of the rules
+            return self.rules.select(query, np)
+
+        candidates = self.candidates(query)
+        if np is not None and len(candidates) * VECTOR_SHARE > len(self.rules):
+            # e.g. the "any" rules with --any
+            return self.rules.select(query, np)
+        rules = self.rules
+        return [n for n in sorted(set(candidates)) if query.matches(rules[n])]
+
+    def query(self, query):
+        '''Returns all lines of the file matching the query in the order of the file.'''
+        return [self.lines[n] for n in self.numbers(query)]
+
+
+def paused_gc(function, *args):
+    '''Calls the function with the cyclic garbage collector paused. Indexes consist of millions of objects
+       without cycles, which the collector would scan again and again while they are loaded or built.'''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+class ACLIndex:
+    """Parsed rules of several files, stored on disk so they do not need to be parsed again
+       for each query. Files which changed since they were indexed are parsed again automatically,
+       only their lines which are not in the index yet are parsed though."""
+    version = 8
+
+    def __init__(self, path = None):
+        self.path = path
+        self.files = {}
+        self.changed = False
+        # path -> (added, removed) rules of the files which changed during the last update
+        self.diffs = {}
+
+        if path and os.path.exists(path):
+            import pickle
+            with open(path, "rb") as f:
+                data = paused_gc(pickle.load, f)
+            # indexes of other versions or with other port names are just built again
+            if data.get("version") == self.version and data.get("services") == ACLParser.services.fingerprint():
+                self.files = data["files"]
+
+    def save(self, path = None):
+        import pickle
+        path = path or self.path
+        with open(path + ".tmp", "wb") as f:
+            data = {"version": self.version, "services": ACLParser.services.fingerprint(), "files": self.files}
+            paused_gc(pickle.dump, data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.changed = False
+
+    def update(self, paths, parser = None):
+        '''Makes sure all given files are indexed and up to date.'''
+        paused_gc(self.update_files, paths, parser or ACLParser())
+
+    def update_files(self, paths, parser):
+        self.diffs = {}
+        known = None
+        for path in paths:
+            key = os.path.abspath(path)
+            entry = self.files.get(key)
+            if entry is None or not entry.is_current():
+                self.changed = True
+                if entry is not None and entry.refresh():
+                    # written again with the same content
+                    continue
+                if known is None:
+                    # a new snapshot of a file mostly consists of lines which are indexed already
+                    known = {}
+                    for other in self.files.values():
+                        if other.parser_name == parser.__class__.__name__:
+                            other.remember(known)
+                self.files[key] = ACLFileIndex(key, parser, known)
+                self.files[key].remember(known)
+                if entry is not None:
+                    self.diffs[key] = self.files[key].diff(entry)
+
+    def query(self, query, paths, expression = None):
+        '''Returns all matching lines of the given files, file by file in the given order.'''
+        return [hit[2] for hit in self.hits(query, paths, expression)]
+
+    def hits(self, query, paths, expression = None):
+        '''Returns (path, line number, line) of all matching lines of the given files. With an ACLExpression
+           the rules matching the query (its query) are checked against the whole expression.'''
+        result = []
+        for path in paths:
+            entry = self.files[os.path.abspath(path)]
+            numbers = entry.numbers(query)
+            if expression is not None:
+                numbers = [n for n in numbers if expression.matches(entry.rules[n])]
+            result.extend((path, n + 1, entry.lines[n]) for n in numbers)
+        return result
+
+
+def cache_directory(name):
+    '''Returns the directory for the cached data of the name in the cache directory of the user
+       ($XDG_CACHE_HOME or ~/.cache), it may not exist yet.'''
+    home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(home, "aclgrep", name)
+
+# the number of address and port ranges a summary keeps of each side, see ACLFileSummary
+SUMMARY_RANGES = 64
+
+class ACLFileSummary:
+    """What the rules of a file cover, coarsely: the address ranges and the ports of both sides, the
+       "any" nets and the protocols. Neighbouring ranges are merged until only a few are left, so a
+       summary is small, but it covers at least all rules. Files whose summary does not match a query
+       cannot contain a matching line, see may_match."""
+
+    def __init__(self):
+        self.protocols = set()
+        for side in ("source", "destination"):
+            setattr(self, side + "_ranges", [])
+            setattr(self, side + "_any", set())
+            setattr(self, side + "_ports", [])
+            # whether a rule allows all ports
+            setattr(self, side + "_all_ports", False)
+
+    def add(self, rule):
+        '''Adds a parsed ACLRule, of any line: the grep matches lines which are no rules as well.'''
+        self.protocols.add(rule.protocol)
+        for side, net, ports in (("source", rule.source_net, rule.source_ports), ("destination", rule.destination_net, rule.destination_ports)):
+            if net.__class__ is AnyMarker:
+                getattr(self, side + "_any").add(net)
+            elif net.__class__ is AddressSet:
+                getattr(self, side + "_ranges").extend(net.ranges())
+            elif net is not None and net != NEVER:
+                getattr(self, side + "_ranges").append(prefix_range(*net))
+            if ports is None:
+                setattr(self, side + "_all_ports", True)
+            else:
+                getattr(self, side + "_ports").extend(ports)
+
+        # large files are compacted on the way
+        if len(self.source_ranges) + len(self.destination_ranges) > 16 * SUMMARY_RANGES:
+            self.finish()
+
+    def finish(self):
+        '''Merges the ranges, after the last rule is added.'''
+        for side in ("source", "destination"):
+            setattr(self, side + "_ranges", list(cap_intervals(getattr(self, side + "_ranges"), SUMMARY_RANGES)))
+            setattr(self, side + "_ports", list(cap_intervals(getattr(self, side + "_ports"), SUMMARY_RANGES)))
+
+    def to_json(self):
+        '''Returns the summary as lists and numbers only, which can be stored as JSON.'''
+        data = {"protocols": list(self.protocols)}
+        for side in ("source", "destination"):
+            data[side + "_ranges"] = getattr(self, side + "_ranges")
+            data[side + "_any"] = [marker.name for marker in getattr(self, side + "_any")]
+            data[side + "_ports"] = getattr(self, side + "_ports")
+            data[side + "_all_ports"] = getattr(self, side + "_all_ports")
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        '''Returns the summary stored with to_json.'''
+        summary = cls()
+        summary.protocols = set(data["protocols"])
+        for side in ("source", "destination"):
+            setattr(summary, side + "_ranges", [(int(low), int(high)) for low, high in data[side + "_ranges"]])
+            setattr(summary, side + "_any", set(ANY_NETS[name.lower()] for name in data[side + "_any"]))
+            setattr(summary, side + "_ports", [(int(low), int(high)) for low, high in data[side + "_ports"]])
+            setattr(summary, side + "_all_ports", bool(data[side + "_all_ports"]))
+        return summary
+
+    def may_match(self, query):
+        '''Returns False if no rule of the file can match the ACLQuery, the criteria are checked
+           in the order and with the shortcuts of ACLQuery.matches.'''
+        for side in ("source", "destination"):
+            ip, net = getattr(query, side + "_ip"), getattr(query, side + "_net")
+            if ip is None and net is None:
+                continue
+            low, high = (ip, ip) if ip is not None else net[:2]
+            if query.match_any and any(low & marker.mask == marker.net for marker in getattr(self, side + "_any")):
+                # a rule with "any" matches right away
+                return True
+            ranges = getattr(self, side + "_ranges")
+            i = bisect.bisect_right(ranges, (high, IPV6_BIT << 1)) - 1
+            if i < 0 or ranges[i][1] < low:
+                return False
+
+        if query.protocol is not None and query.protocol not in self.protocols and 0 not in self.protocols:
+            return False
+
+        for side in ("source", "destination"):
+            port = getattr(query, side + "_port")
+            if port is not None and not getattr(self, side + "_all_ports") and not port_in_intervals(port, getattr(self, side + "_ports")):
+                return False
+        return True
+
+def summarize_file(path, parser_class = ACLParser):
+    '''Returns the modification time and size of a file and its ACLFileSummary.'''
+    stat = os.stat(path)
+    parser = parser_class()
+    parser.use_objects(read_objects(path))
+    summary = ACLFileSummary()
+    for line in read_lines(path):
+        summary.add(parser.parse_rule(line))
+    summary.finish()
+    return stat.st_mtime_ns, stat.st_size, summary
+
+class ACLSummaries:
+    """The summaries of the files of directory trees (see ACLFileSummary), so a file which cannot match a
+       query is skipped without opening it. The summaries of the files of each directory are kept as JSON
+       in a file of the cache directory of the user (see cache_directory), named by the hash of the real
+       path of the directory, so nothing is written into the trees searched. A summary is valid as long
+       as the modification time and the size of its file are the same."""
+    version = 3
+
+    def __init__(self, parser_class = ACLParser, cache = None):
+        self.parser_class = parser_class
+        self.cache = cache or cache_directory("summaries")
+        self.services = None
+        # directory -> {file name: (modification time, size, summary)}
+        self.directories = {}
+        self.changed = set()
+
+    def identity(self):
+        '''Returns what the summaries depend on besides the files: the version, the parser and its port names.'''
+        if self.services is None:
+            self.services = self.parser_class.services.fingerprint()
+        return [self.version, self.parser_class.__name__, self.services]
+
+    def cache_file(self, directory):
+        '''Returns the real path of the directory and the path of the file keeping its summaries.'''
+        import hashlib
+        directory = os.path.realpath(directory)
+        return directory, os.path.join(self.cache, hashlib.sha1(directory.encode("utf-8", "surrogateescape")).hexdigest() + ".json")
+
+    def entries(self, directory):
+        entries = self.directories.get(directory)
+        if entries is None:
+            entries = self.directories[directory] = {}
+            real_path, path = self.cache_file(directory)
+            try:
+                import json
+                with open(path, encoding = "utf-8") as f:
+                    data = json.load(f)
+                if [data.get("version"), data.get("parser"), data.get("services")] == self.identity() and data.get("directory") == real_path:
+                    for name, (mtime, size, summary) in data["files"].items():
+                        entries[name] = (mtime, size, ACLFileSummary.from_json(summary))
+            except (OSError, ValueError, TypeError, KeyError, AttributeError):
+                # missing or broken, the files are summarized again
+                entries.clear()
+        return entries
+
+    def get(self, path):
+        '''Returns the summary of the file if it is up to date, else None.'''
+        directory, name = os.path.split(os.path.abspath(path))
+        entry = self.entries(directory).get(name)
+        if entry is None:
+            return None
+        stat = os.stat(path)
+        if (stat.st_mtime_ns, stat.st_size) != entry[:2]:
+            return None
+        return entry[2]
+
+    def update(self, paths, jobs = 1):
+        '''Summarizes the files whose summaries are missing or out of date, with a pool of processes
+           if there are several jobs.'''
+        missing = [path for path in paths if self.get(path) is None]
+        if jobs > 1 and len(missing) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs)
+            try:
+                summaries = pool.starmap(summarize_file, [(path, self.parser_class) for path in missing], 16)
+            finally:
+                pool.terminate()
+        else:
+            summaries = [summarize_file(path, self.parser_class) for path in missing]
+
+        for path, entry in zip(missing, summaries):
+            directory, name = os.path.split(os.path.abspath(path))
+            self.entries(directory)[name] = entry
+            self.changed.add(directory)
+
+    def save(self):
+        '''Writes the summaries of the directories with new summaries, errors just leave them unsaved.'''
+        import json
+        for directory in sorted(self.changed):
+            real_path, path = self.cache_file(directory)
+            version, parser_name, services = self.identity()
+            files = dict((name, (mtime, size, summary.to_json())) for name, (mtime, size, summary) in self.directories[directory].items())
+            data = {"version": version, "parser": parser_name, "services": services, "directory": real_path, "files": files}
+            try:
+                os.makedirs(self.cache, exist_ok = True)
+                with open(path + ".tmp", "w", encoding = "utf-8") as f:
+                    json.dump(data, f)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                pass
+        self.changed = set()
+
+    def select(self, paths, query):
+        '''Returns the files which may contain lines matching the ACLQuery, see update.'''
+        return [path for path in paths if self.get(path).may_match(query)]
+
+
+def scan_directory(path):
+    '''Returns the sorted paths of the files and of the subdirectories of a directory. Hidden ones
+       (like .git) are left out, links to directories are not followed.'''
+    files, directories = [], []
+    try:
+        entries = sorted(os.scandir(path), key = lambda entry: entry.name)
+    except OSError:
+        return files, directories
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir(follow_symlinks = False):
+            directories.append(entry.path)
+        elif entry.is_file():
+            files.append(entry.path)
+    return files, directories
+
+def walk_files(paths, threads = 8):
+    '''Returns all files below the given directories, the files of a directory before those of its
+       subdirectories, and the paths which are files themselves. The directories of each level are
+       listed by a pool of threads, which pays off on network file systems.'''
+    from concurrent.futures import ThreadPoolExecutor
+    listings = {}
+    level = [path for path in paths if os.path.isdir(path)]
+    with ThreadPoolExecutor(threads) as pool:
+        while level:
+            results = list(pool.map(scan_directory, level))
+            listings.update(zip(level, results))
+            level = [directory for files, directories in results for directory in directories]
+
+    found = []
+    def add(directory):
+        files, directories = listings[directory]
+        found.extend(files)
+        for subdirectory in directories:
+            add(subdirectory)
+    for path in paths:
+        if path in listings:
+            add(path)
+        else:
+            found.append(path)
+    return found
+
+
+class ACLBatchGrepper:
+    """The multi query counterpart of ACLGrepper: checks every line against a whole set of flows
+       (sip, sport, dip, dport, protocol) at once. The flows are sorted by their addresses, so for
+       each rule only the flows inside its nets are looked at instead of all of them."""
+    parser = None
+
+    def __init__(self, flows, match_any = False, parser = None):
+        self.parser = parser or ACLParser()
+
+        self.flows = list(flows)
+        self.queries = [ACLQuery(*(tuple(flow) + (match_any,))) for flow in self.flows]
+        self.match_any = match_any
+
+        self.source_keys, self.source_flows, self.source_free = self.build_index("source_ip")
+        self.destination_keys, self.destination_flows, self.destination_free = self.build_index("destination_ip")
+
+    def build_index(self, field):
+        '''Returns the addresses of the flows which have one in sorted order, the matching flow numbers
+           and the numbers of the flows without an address.'''
+        pairs = sorted((getattr(q, field), n) for n, q in enumerate(self.queries) if getattr(q, field) is not None)
+        free = [n for n, q in enumerate(self.queries) if getattr(q, field) is None]
+        return [p[0] for p in pairs], [p[1] for p in pairs], free
+
+    def in_net(self, net, keys, flows):
+        '''Returns the flows with an address inside the net (a pair, an AddressSet or one of the "any" markers).'''
+        # all addresses of the net are between the net address and the net address with all
+        # wildcard bits set, IPv6 addresses are sorted after all IPv4 addresses
+        if isinstance(net, AddressSet):
+            ranges = net.ranges()
+        else:
+            ranges = [prefix_range(net.net, net.mask) if isinstance(net, AnyMarker) else prefix_range(*net)]
+
+        result = []
+        for low, high in ranges:
+            result.extend(flows[bisect.bisect_left(keys, low):bisect.bisect_right(keys, high)])
+        return result
+
+    def candidates(self, net, keys, flows, free):
+        '''Returns the flows which might be matched by the net, those without an address included.'''
+        if net is None or net == NEVER:
+            return free
+        if isinstance(net, AnyMarker) and not self.match_any:
+            # flows with an address only match "any" if desired
+            return free
+        return self.in_net(net, keys, flows) + free
+
+    def grep(self, line):
+        '''Returns the numbers of all flows matched by the line.'''
+        rule = self.parser.parse_rule(line)
+        queries = self.queries
+
+        if isinstance(rule.source_net, AnyMarker) and self.match_any:
+            # flows with a source address of the family match right away, see ACLQuery.matches
+            matched = self.in_net(rule.source_net, self.source_keys, self.source_flows)
+            matched += [n for n in self.source_free if queries[n].matches(rule)]
+            return sorted(matched)
+
+        sources = self.candidates(rule.source_net, self.source_keys, self.source_flows, self.source_free)
+        destinations = self.candidates(rule.destination_net, self.destination_keys, self.destination_flows, self.destination_free)
+
+        # every matching flow is in both candidate lists, so the shorter one is enough
+        candidates = sources if len(sources) <= len(destinations) else destinations
+        return [n for n in sorted(candidates) if queries[n].matches(rule)]
+
+def read_flows(path):
+    '''Reads flows from a CSV file with the columns sip, sport, dip, dport and protocol.
+       Empty columns are not checked, a header line and lines starting with # are skipped.'''
+    import csv
+    flows = []
+    with open(path) as f:
+        for row in csv.reader(f):
+            row = [column.strip() or None for column in row]
+            if not any(row) or (row[0] or "").startswith("#") or row[0] == "sip":
+                continue
+            flows.append(tuple((row + [None] * 5)[:5]))
+    return flows
+
+
+def file_digest(path):
+    '''Returns the SHA-1 hash of the content of a file.'''
+    import hashlib
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# the first bytes of compressed files and the module reading them, zstandard is not in the standard library
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "lzma"), (b"\x28\xb5\x2f\xfd", "zstandard"))
+
+# size of the blocks decompressed in the background and the number of blocks waiting for the parser
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+DECOMPRESS_QUEUE_SIZE = 8
+
+def compression(path):
+    '''Returns the name of the module to decompress the file with or None if it is not compressed.'''
+    with open(path, "rb") as f:
+        return compression_of(f.read(6))
+
+def compression_of(start):
+    '''Returns the name of the module to decompress content starting with the bytes with, see compression.'''
+    for magic, module in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return module
+    return None
+
+def decompress_data(data, module):
+    '''Returns the decompressed bytes of the content of a compressed file, see compression.'''
+    if module != "zstandard":
+        return __import__(module).decompress(data)
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("reading zstd files needs the zstandard module")
+    import io
+    return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+
+def open_compressed(path, module):
+    '''Opens a compressed file for reading the decompressed bytes, see compression.'''
+    if module != "zstandard":
+        return __import__(module).open(path, "rb")
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("%s: reading zstd files needs the zstandard module" % path)
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd = True)
+
+def decompress(stream, blocks, stop, block_size):
+    '''Reads the decompressed stream into the queue in blocks ending at line boundaries, followed by None
+       or the exception which ended it. Runs in a thread, decompressing does not hold the GIL.'''
+    try:
+        rest = b""
+        while not stop.is_set():
+            block = stream.read(block_size)
+            if not block:
+                break
+            end = block.rfind(b"\n") + 1
+            if end:
+                blocks.put(rest + block[:end])
+                rest = block[end:]
+            else:
+                rest += block
+        if rest:
+            blocks.put(rest)
+        blocks.put(None)
+    except Exception as e:
+        blocks.put(e)
+    finally:
+        stream.close()
+
+def decompressed_blocks(path, module, block_size = DECOMPRESS_BLOCK_SIZE):
+    '''Yields the content of a compressed file in blocks of whole lines. The file is decompressed in a
+       background thread, at most DECOMPRESS_QUEUE_SIZE blocks ahead of the consumer, so decompressing
+       overlaps with parsing without keeping the file in memory.'''
+    import queue, threading
+    blocks = queue.Queue(DECOMPRESS_QUEUE_SIZE)
+    stop = threading.Event()
+    thread = threading.Thread(target = decompress, args = (open_compressed(path, module), blocks, stop, block_size))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        # the consumer may stop early, free the queue so the thread sees the stop
+        stop.set()
+        while not blocks.empty():
+            blocks.get_nowait()
+
+def read_lines(path, errors = "replace"):
+    '''Yields the lines of a text file, compressed files are decompressed on the fly.'''
+    module = compression(path)
+    if module is None:
+        with open(path, errors = errors) as f:
+            for line in f:
+                yield line
+        return
+    for block in decompressed_blocks(path, module):
+        for line in block.splitlines(True):
+            yield line.decode("utf-8", errors)
+
+def read_file(path):
+    '''Reads a whole file once and returns the SHA-1 hash of its content (see file_digest) and its
+       lines, decompressed and decoded strictly.'''
+    import hashlib, io
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    module = compression_of(data[:6])
+    if module is not None:
+        data = decompress_data(data, module)
+    return digest, list(io.TextIOWrapper(io.BytesIO(data), encoding = "utf-8"))
+
+def read_objects(path):
+    '''Collects the names, objects and object groups defined in a file, see ACLObjects.'''
+    objects = ACLObjects()
+    objects.read(read_lines(path))
+    return objects
+
+# number of lines at the start of stdin the definitions and the dialect are taken from, see input_files
+STDIN_HEAD_LINES = 100000
+
+def input_files(args):
+    '''Yields (file name, ACLObjects, lines) for all files given on the command line, "-" or no file
+       at all is stdin. The definitions of a file are collected before its lines are handed out.
+       Only the first STDIN_HEAD_LINES lines of stdin are kept for that, the rest is streamed, so
+       definitions after them are unknown.'''
+    for path in args or ["-"]:
+        if path == "-":
+            import itertools
+            head = list(itertools.islice(sys.stdin, STDIN_HEAD_LINES))
+            objects = ACLObjects()
+            objects.read(head)
+            yield "<stdin>", objects, itertools.chain(head, sys.stdin)
+        else:
+            yield path, read_objects(path), read_lines(path)
+
+def line_prefilter(query, objects = None, headers = False):
+    '''Returns a bytes regex every line matching the query contains, so lines without a match can be
+       skipped without decoding and parsing them. Returns None if there is no such regex.
+       Lines may refer to the names, objects and object groups given by objects instead.
+       With headers the headers of named ACLs match as well, so the parser knows the ACL of each line.
+       The lines of a stateful dialect (see ACLDialect) are never skipped.'''
+    dialect = DIALECTS.get(objects.dialect) if objects is not None else None
+    if dialect is not None and dialect.stateful:
+        return None
+    implicit = dialect is not None and dialect.implicit_any
+
+    required = []
+    addresses = [ip for ip in (query.source_ip, query.destination_ip) if ip is not None]
+    addresses += [net[0] for net in (query.source_net, query.destination_net) if net is not None]
+    if addresses and not (implicit and query.match_any):
+        # a net of the family of the address, "any" only matches if desired
+        nets = []
+        if any(ip < IPV6_BIT for ip in addresses):
+            nets.append(br"\d\.\d+\.\d+\.\d")
+        if any(ip >= IPV6_BIT for ip in addresses):
+            nets.append(br"[0-9A-Fa-f:]:")
+        if query.match_any:
+            nets.append(br"any")
+        if objects:
+            nets.append(br"object")
+            nets.extend(re.escape(name.encode()) for name in objects.names)
+        required.append(b"|".join(nets))
+
+    # an "any" net ends the matching before the protocol is checked, see ACLQuery.matches
+    if query.protocol is not None and not (addresses and query.match_any) and not implicit:
+        # the protocol itself, by name or number, or "ip", which covers all protocols
+        names = [name for name, number in PROTOCOL_NUMBERS.items() if number in (0, query.protocol)]
+        if query.protocol >= 0:
+            names.append(str(query.protocol))
+        if objects:
+            # service objects and groups
+            names += ["object", "object-group"]
+        required.append(br"(?:^|[ \t])(?:" + "|".join(names).encode() + br")(?=[ \t\r\n]|$)")
+
+    if not required:
+        return None
+    if len(required) == 1:
+        pattern = required[0]
+    else:
+        # all of them must be somewhere in the same line
+        pattern = br"^" + b"".join(br"(?=[^\n]*?(?:" + r + b"))" for r in required)
+    if headers:
+        # see ACLParser.track_acl
+        pattern = br"^(?:ip(?:v6)? access-list |\S[^\n]* access list )|(?:" + pattern + b")"
+    return re.compile(pattern, re.M)
+
+def count_newlines(data, start, end):
+    '''Counts the line ends in data[start:end], an mmap is copied in blocks to do so.'''
+    if isinstance(data, bytes):
+        return data.count(b"\n", start, end)
+    count = 0
+    while start < end:
+        stop = min(end, start + DECOMPRESS_BLOCK_SIZE)
+        count += data[start:stop].count(b"\n")
+        start = stop
+    return count
+
+def candidate_lines(data, prefilter, first = None):
+    '''Yields all lines of the bytes (or mmap) data which contain a match of the prefilter.
+       The regex runs over the whole data, so lines without a match are skipped at C speed.
+       If first is given, (line number, line) pairs are yielded, the data starting with line first.'''
+    if prefilter is None:
+        lines = data.splitlines(True) if isinstance(data, bytes) else iter(data.readline, b"")
+        for line in lines if first is None else enumerate(lines, first):
+            yield line
+        return
+
+    search = prefilter.search
+    find = data.find
+    size = len(data)
+    # the number of the line starting at position
+    position, number = 0, first
+    m = search(data)
+    while m:
+        start = data.rfind(b"\n", 0, m.start()) + 1
+        end = find(b"\n", m.end())
+        end = size if end == -1 else end + 1
+        if first is None:
+            yield data[start:end]
+        else:
+            number += count_newlines(data, position, start)
+            position = start
+            yield number, data[start:end]
+        m = search(data, end)
+
+def read_candidates(path, prefilter, numbered = False, counted = None):
+    '''Memory maps the file and yields the decoded lines which contain a match of the prefilter,
+       as (line number, line) pairs if numbered is set.
+       Compressed files are searched block by block while they are decompressed.
+       counted is called with the number of lines of the file once it is read, see ACLStats.lines_read.'''
+    module = compression(path)
+    if module:
+        first, last = 1, b"\n"
+        for block in decompressed_blocks(path, module):
+            for line in candidate_lines(block, prefilter, first if numbered else None):
+                yield (line[0], line[1].decode("utf-8", "replace")) if numbered else line.decode("utf-8", "replace")
+            if numbered or counted:
+                first += block.count(b"\n")
+                last = block[-1:]
+        if counted:
+            counted(first - 1 + (last != b"\n"))
+        return
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            if counted:
+                counted(0)
+            return
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            for line in candidate_lines(data, prefilter, 1 if numbered else None):
+                yield (line[0], line[1].decode("utf-8", "replace")) if numbered else line.decode("utf-8", "replace")
+            if counted:
+                # the pages are mapped already, nothing is read again
+                counted(count_newlines(data, 0, size) + (data[size - 1:size] != b"\n"))
+        finally:
+            data.close()
+
+
+# the formats of --format, text is the lines as they are
+OUTPUT_FORMATS = ("text", "jsonl", "csv")
+
+# the fields of a matching line in the other formats, see match_record
+MATCH_FIELDS = ("file", "line_number", "acl", "action", "protocol", "source", "source_port", "destination", "destination_port", "line")
+
+def match_record(path, number, parser, line):
+    '''Returns the fields of a matching line as named by MATCH_FIELDS, the parser must have parsed
+       the line last. Nets, ports and protocol are the strings the parser found, missing ports are None.'''
+    source_port = parser.source_port if parser.source_port != "any" else None
+    destination_port = parser.destination_port if parser.destination_port != "any" else None
+    return (path, number, parser.acl_name, parser.action, parser.protocol, parser.source_net, source_port,
+            parser.destination_net, destination_port, line.strip())
+
+class MatchWriter:
+    """Writes the matching lines in one of the OUTPUT_FORMATS. The output is collected and written to
+       the stream in blocks of lines instead of line by line, unless the stream is a terminal. Call
+       flush at the end."""
+
+    def __init__(self, format = "text", stream = None, size = 1024):
+        self.format = format
+        self.stream = stream or sys.stdout
+        self.size = 1 if self.stream.isatty() else size
+        self.pending = []
+        self.encode = None
+        if format == "jsonl":
+            import json
+            self.encode = lambda record: json.dumps(dict(zip(MATCH_FIELDS, record)))
+        elif format == "csv":
+            import csv, io
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator = "")
+            def encode(record):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerow(record)
+                return buffer.getvalue()
+            self.encode = encode
+            self.line(encode(MATCH_FIELDS))
+
+    def line(self, text):
+        '''Writes a line of text as it is.'''
+        self.pending.append(text)
+        if len(self.pending) >= self.size:
+            self.flush()
+
+    def record(self, fields):
+        '''Writes the fields of a matching line, see match_record.'''
+        self.line(self.encode(fields) if self.encode else fields[-1])
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if pending:
+            pending.append("")
+            self.stream.write("\n".join(pending))
+        self.stream.flush()
+
+
+class ACLStats:
+    """Counters and timers of a run, see --stats. The timed stages are methods of the parser,
+       grepper and so on, which are replaced by timing wrappers on the instances only. So the
+       classes stay untouched and nothing is slowed down without --stats. Stages called from other
+       timed stages are included in their times, and all times include the timing overhead."""
+
+    # the stages of the parsers, each parser has some of them
+    parser_stages = ("track_acl", "tokenize", "replace_port_names", "match_patterns", "assign_source_dest", "net_value", "port_value")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counters = {}
+        # stage -> [calls, seconds]
+        self.timers = {}
+
+    def count(self, name, amount = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timed(self, function, stage, check = None):
+        '''Returns a wrapper of the function which adds its calls and run time to the stage.
+           The result is passed to check, which may update the counters.'''
+        timer = self.timers.setdefault(stage, [0, 0.0])
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            result = function(*args)
+            timer[1] += clock() - start
+            timer[0] += 1
+            if check:
+                check(result)
+            return result
+        return wrapper
+
+    def instrument(self, owner, name, check = None):
+        setattr(owner, name, self.timed(getattr(owner, name), name, check))
+
+    def instrument_parser(self, parser):
+        # nets which could not be converted, the lines are kept but never match
+        checks = {"net_value": lambda net: net is NEVER and self.count("invalid nets")}
+        for name in self.parser_stages:
+            if hasattr(parser, name):
+                self.instrument(parser, name, checks.get(name))
+
+    def instrument_grepper(self, grepper):
+        '''Instruments an ACLGrepper, ACLBatchGrepper or ACLTracer and its parser.'''
+        self.instrument_parser(grepper.parser)
+        if isinstance(grepper, ACLTracer):
+            self.instrument(grepper, "trace", lambda hit: self.checked(hit))
+        else:
+            self.instrument(grepper, "grep", lambda matched: self.checked(matched))
+
+    def checked(self, matched):
+        self.count("lines checked")
+        if matched:
+            self.count("lines matched")
+
+    def lines_read(self, lines):
+        '''Counts the lines of a file as read by read_candidates, the ones which are not checked were
+           skipped by the prefilter.'''
+        self.count("lines read", lines)
+
+    def report(self):
+        counters = dict(self.counters)
+        for name in ("lines checked", "lines matched", "invalid nets"):
+            counters.setdefault(name, 0)
+        counters.setdefault("lines read", counters["lines checked"])
+        counters["lines prefiltered out"] = counters["lines read"] - counters["lines checked"]
+        return {
+            "seconds": time.perf_counter() - self.start,
+            "counters": counters,
+            "stages": dict((stage, {"calls": calls, "seconds": seconds}) for stage, (calls, seconds) in self.timers.items() if calls),
+        }
+
+    def dump(self, out = None):
+        import json
+        json.dump(self.report(), out or sys.stderr, indent=2, sort_keys=True)
+        (out or sys.stderr).write("\n")
+
+def dump_profile(profiler, path):
+    '''Writes the cProfile results to the file, - prints the most expensive functions to stderr.'''
+    profiler.disable()
+    if path == "-":
+        import pstats
+        pstats.Stats(profiler, stream = sys.stderr).sort_stats("cumulative").print_stats(25)
+    else:
+        profiler.dump_stats(path)
+
+
+# size of the pieces large files are split into for parallel processing
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# the grepper of a worker process, see init_worker
+worker_grepper = None
+
+# whether the workers return records instead of lines, see grep_chunk
+worker_records = False
+
+def split_file(path, chunk_size = CHUNK_SIZE, objects = None):
+    '''Splits a file into chunks (path, start, end, ACL name) of about chunk_size bytes which start
+       and end at line boundaries. The name is that of the ACL the lines before the chunk ended in, so
+       the lines at the start of the chunk get the name of their ACL (see last_acl_name).
+       A compressed file is a single chunk with end None, as is a file of a stateful dialect, whose lines
+       depend on the lines before. The dialect is taken from the ACLObjects of the file, if they are given.'''
+    name = objects.dialect if objects is not None else file_dialect(path)
+    dialect = DIALECTS.get(name)
+    if compression(path) or (dialect is not None and dialect.stateful):
+        yield (path, 0, None, None)
+        return
+    parser = ACLParser()
+    parser.use_dialect(name)
+    size = os.path.getsize(path)
+    start = 0
+    acl_name = None
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(start + chunk_size)
+            f.readline()
+            end = min(f.tell(), size)
+            yield (path, start, end, acl_name)
+            if end < size:
+                acl_name = last_acl_name(f, start, end, parser) or acl_name
+            start = end
+
+def last_acl_name(f, start, end, parser):
+    '''Returns the name of the last ACL header (see ACLParser.track_acl) in the lines of the file between
+       start and end, None if there is none. The lines are searched backwards, in blocks from the end,
+       as most rules repeat the name of their ACL.'''
+    rest = b""
+    while end > start:
+        block_start = max(start, end - 65536)
+        f.seek(block_start)
+        data = f.read(end - block_start) + rest
+        lines = data.split(b"\n")
+        # the first line may continue in the block before
+        rest = lines.pop(0) if block_start > start else b""
+        for line in reversed(lines):
+            parser.acl_name = None
+            name = parser.track_acl(line.decode("utf-8", "replace"))
+            if name is not None:
+                return name
+        end = block_start
+    return None
+
+def init_worker(criteria, parser_class, net_match = "intersects", records = False, expression = None, services = None):
+    '''Builds the grepper once per worker process, with the port names of the main process.'''
+    global worker_grepper, worker_records
+    if services is not None:
+        ACLParser.services = services
+    worker_grepper = ACLGrepper(*criteria, parser = parser_class(), net_match = net_match, expression = expression)
+    worker_records = records
+
+def file_chunks(paths, chunk_size = CHUNK_SIZE):
+    '''Yields the chunks of the files (see split_file) together with the ACLObjects of their file, as
+       the definitions may be anywhere in the file, not only in the chunk. They are read once here
+       instead of once in each worker.'''
+    for path in paths:
+        objects = read_objects(path)
+        for chunk in split_file(path, chunk_size, objects):
+            yield chunk, objects
+
+def grep_chunk(task):
+    '''Returns the matching lines of a chunk and the ACLObjects of its file, see file_chunks. If the
+       worker returns records, it returns the start, the number of lines of the chunk and the
+       match_record of each matching line instead, numbered from the start of the chunk.'''
+    (path, start, end, acl_name), objects = task
+    parser = worker_grepper.parser
+    parser.use_objects(objects)
+    parser.acl_name = acl_name
+    prefilter = line_prefilter(worker_grepper.query, objects, worker_records)
+
+    # a compressed file is a single chunk, its line count does not matter
+    count = 0
+    if end is None:
+        lines = read_candidates(path, prefilter, worker_records)
+    else:
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        if worker_records:
+            count = data.count(b"\n")
+            lines = ((number, line.decode("utf-8", "replace")) for number, line in candidate_lines(data, prefilter, 1))
+        else:
+            lines = (line.decode("utf-8", "replace") for line in candidate_lines(data, prefilter))
+
+    grep = worker_grepper.grep
+    if worker_records:
+        return start, count, [match_record(path, number, parser, line) for number, line in lines if grep(line)]
+    result = []
+    for line in lines:
+        if grep(line):
+            result.append(line.strip())
+    return result
+
+def parallel_grep(paths, criteria, jobs, parser_class = ACLParser, chunk_size = CHUNK_SIZE, net_match = "intersects", records = False, expression = None):
+    '''Greps the files with a pool of worker processes and yields the matching lines in the order
+       of the files and lines, their match_record if records is set. The criteria are the arguments
+       of ACLGrepper.'''
+    import multiprocessing
+    chunks = file_chunks(paths, chunk_size)
+    pool = multiprocessing.Pool(jobs, init_worker, (criteria, parser_class, net_match, records, expression, ACLParser.services))
+    try:
+        if not records:
+            for lines in pool.imap(grep_chunk, chunks):
+                for line in lines:
+                    yield line
+            return
+
+        # the chunks come in order, so the lines before a chunk are those of the earlier chunks of its file
+        offset = 0
+        for start, count, matches in pool.imap(grep_chunk, chunks):
+            if start == 0:
+                offset = 0
+            for match in matches:
+                yield match[:1] + (match[1] + offset,) + match[2:]
+            offset += count
+    finally:
+        pool.terminate()
+
+
+# how often the server looks for changed files, in seconds
+RELOAD_INTERVAL = 1.0
+
+class ACLServer:
+    """Keeps the parsed rules of files in memory and answers queries of many clients, so they do not pay
+       for starting Python and parsing the files on each lookup. Queries are JSON objects with the keys
+       sip, sport, dip, dport, proto, any, match (see ACLQuery) and query (see ACLExpression), sent one
+       per line over a Unix socket or as HTTP GET parameters or POST body to a localhost port. Files which
+       change are parsed again in a thread and replace their old rules at once, queries are answered from
+       the old rules in the meantime."""
+
+    def __init__(self, paths, parser_class = ACLParser):
+        self.paths = list(paths)
+        self.parser_class = parser_class
+        self.index = ACLIndex()
+        self.index.update(self.paths, parser_class())
+        # the files being parsed again right now
+        self.reloading = set()
+        # the files which could not be parsed again, their error is shown once until they are back
+        self.failed = set()
+
+    def answer(self, request):
+        '''Returns the response to a query, a dict with the matching lines or an error.'''
+        try:
+            criteria = (request.get("sip"), request.get("sport"), request.get("dip"), request.get("dport"), request.get("proto"))
+            match_any, net_match = request.get("any") in (True, "1", "true", "yes"), request.get("match", "intersects")
+            query = ACLQuery(*criteria, match_any = match_any, net_match = net_match)
+            expression = None
+            if request.get("query"):
+                expression = ACLExpression(request["query"], match_any, net_match, criteria)
+                query = expression.query
+        except (ValueError, AttributeError, TypeError) as e:
+            return {"error": str(e) or "invalid query"}
+        hits = self.index.hits(query, self.paths, expression)
+        return {"hits": [{"file": path, "line_number": number, "line": line} for path, number, line in hits]}
+
+    def parse(self, key):
+        '''Parses a file again, the lines which did not change are taken from the old rules.'''
+        old = self.index.files[key]
+        if old.refresh():
+            return old
+        known = {}
+        old.remember(known)
+        return ACLFileIndex(key, self.parser_class(), known)
+
+    async def reload_changed(self):
+        '''Parses all files again which changed since they were parsed.'''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        changed = [os.path.abspath(path) for path in self.paths]
+        changed = [key for key in changed if key not in self.reloading and not self.index.files[key].is_current()]
+        self.reloading.update(changed)
+        try:
+            entries = await asyncio.gather(*[loop.run_in_executor(None, self.parse, key) for key in changed], return_exceptions = True)
+        finally:
+            self.reloading.difference_update(changed)
+
+        for key, entry in zip(changed, entries):
+            if isinstance(entry, Exception):
+                # e.g. removed while it is replaced, the old rules are kept until it is back
+                if key not in self.failed:
+                    self.failed.add(key)
+                    print("%s: %s" % (key, entry), file = sys.stderr)
+            else:
+                self.failed.discard(key)
+                self.index.files[key] = entry
+
+    async def watch(self):
+        import asyncio
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            await self.reload_changed()
+
+    async def handle_lines(self, reader, writer):
+        '''Answers queries sent as one JSON object per line until the client closes the connection.'''
+        import json
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                response = self.answer(request) if isinstance(request, dict) else {"error": "invalid JSON"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        '''Answers a single HTTP request, GET with the query as parameters or POST with a JSON body.'''
+        import asyncio, json
+        from urllib.parse import urlsplit, parse_qsl
+        try:
+            try:
+                method, target = (await reader.readline()).decode("latin-1").split()[:2]
+                length = 0
+                while True:
+                    header = (await reader.readline()).decode("latin-1")
+                    if header.strip() == "":
+                        break
+                    name, _, value = header.partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+
+                if method == "POST":
+                    try:
+                        request = json.loads(await reader.readexactly(length)) if length else {}
+                    except ValueError:
+                        request = None
+                else:
+                    request = dict(parse_qsl(urlsplit(target).query))
+                response = self.answer(request) if isinstance(request, dict) else {"error": "invalid JSON"}
+                status = "400 Bad Request" if "error" in response else "200 OK"
+            except (ValueError, asyncio.IncompleteReadError):
+                # a broken request line or header, or the body ended before its Content-Length
+                response, status = {"error": "invalid request"}, "400 Bad Request"
+
+            body = json.dumps(response).encode()
+            writer.write(("HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                          % (status, len(body))).encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            # the client is gone, there is no one to answer
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, address):
+        '''Starts listening, address is a port or host:port for HTTP or else the path of a Unix socket.'''
+        import asyncio
+        host, _, port = address.rpartition(":")
+        if port.isdigit():
+            return await asyncio.start_server(self.handle_http, host or "127.0.0.1", int(port))
+        return await asyncio.start_unix_server(self.handle_lines, address)
+
+    async def run(self, address):
+        import asyncio
+        server = await self.start(address)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.watch())
+
+    def serve(self, address):
+        import asyncio
+        asyncio.run(self.run(address))
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
     # check command line args
     parser = OptionParser(usage="Usage: %prog [options] [file, file, ...]")
     parser.add_option("-a", "--any", dest="match_any", action="store_true", default=False, help="Match ACLs with 'any', too")
@@ -384,6 +4130,25 @@ if __name__ == '__main__':
     parser.add_option("-I", "--dip", dest="destination_ip", default=None, help="Destination IP to look for")
     parser.add_option("-P", "--dport", dest="destination_port", default=None, help="Destination port to look for")
     parser.add_option("-o", "--proto", dest="protocol", default=None, help="Protocol to look for")
+    parser.add_option("-q", "--query", dest="query", default=None, help="Show the lines matching the query expression, e.g. 'dip 10.0.0.0/8 and (dport 443 or dport 8443) and not proto icmp', together with the other criteria")
+    parser.add_option("-m", "--net-match", dest="net_match", type="choice", choices=NET_MATCHES, default="intersects", help="For nets and ranges (10.0.0.0/16, 10.0.0.5-10.0.0.9) given as IPs: show the rules whose nets intersect (default), contain or are within them")
+    parser.add_option("-r", "--recursive", dest="recursive", action="store_true", default=False, help="Search all files below the directories given (the current one by default), files which cannot match are skipped by their summaries")
+    parser.add_option("--services", dest="services", default=None, metavar="FILE", help="Add the port names of a services file like /etc/services to the built-in ones, by protocol")
+    parser.add_option("--regex-parser", dest="regex_parser", action="store_true", default=False, help="Use the old regex based parser instead of the tokenizer")
+    parser.add_option("--build-index", dest="build_index", default=None, metavar="INDEX", help="Parse the files and store the rules in the index file")
+    parser.add_option("--index", dest="index", default=None, metavar="INDEX", help="Answer the query from the index file, files which changed are parsed again")
+    parser.add_option("--diff", dest="diff", action="store_true", default=False, help="Show the rules added (+) and removed (-) in files which changed since they were indexed")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=1, help="Number of processes to grep the files with")
+    parser.add_option("--first-match", dest="first_match", action="store_true", default=False, help="Show only the first matching rule of each ACL with its action, like the firewall would apply it to the packet")
+    parser.add_option("--shadowed", dest="shadowed", action="store_true", default=False, help="Show the rules which can never match, because an earlier rule of the same ACL matches all their packets")
+    parser.add_option("--hits", dest="hits", action="store_true", default=False, help="Sum up the hit counts of 'show access-list' output: the rules without hits, the rules with the most hits and the totals of each ACL")
+    parser.add_option("--top", dest="top", type="int", default=10, help="Number of rules with the most hits to show with --hits (default 10)")
+    parser.add_option("--hits-since", dest="hits_since", default=None, metavar="FILE", help="Count only the hits since the older 'show access-list' output in the file, rules are matched by their hash")
+    parser.add_option("--flows", dest="flows", default=None, metavar="CSV", help="Look for all flows (sip,sport,dip,dport,proto) of the CSV file and show the matching lines for each flow")
+    parser.add_option("--serve", dest="serve", default=None, metavar="ADDRESS", help="Keep the files parsed and answer JSON queries on a Unix socket (a path) or via HTTP on a port (PORT or HOST:PORT), changed files are parsed again")
+    parser.add_option("--format", dest="format", type="choice", choices=OUTPUT_FORMATS, default="text", help="Show the matching lines as they are (text), or with their file, line number, ACL and parsed fields as JSON lines (jsonl) or CSV (csv)")
+    parser.add_option("--stats", dest="stats", action="store_true", default=False, help="Print counters and the time spent in each stage as JSON to stderr at exit")
+    parser.add_option("--profile", dest="profile", default=None, metavar="FILE", help="Run with cProfile and write the results to the file, - prints the top functions to stderr")
 
     (options, args) = parser.parse_args()
 
@@ -391,10 +4156,240 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit()
 
+    if options.services:
+        try:
+            ACLParser.services = PortNames.load(options.services)
+        except OSError as e:
+            parser.error("cannot read the services file: %s" % e)
+
     # initialize grepper and...
-    grepper = ACLGrepper(options.source_ip, options.source_port, options.destination_ip, options.destination_port, options.protocol, options.match_any)
+    parser_class = RegexACLParser if options.regex_parser else ACLParser
+    criteria = (options.source_ip, options.source_port, options.destination_ip, options.destination_port, options.protocol, options.match_any)
+    try:
+        grepper = ACLGrepper(*criteria, parser = parser_class(), net_match = options.net_match, expression = options.query)
+    except ValueError as e:
+        parser.error(str(e))
+    if options.query and (options.first_match or options.shadowed or options.hits or options.flows or options.serve):
+        parser.error("--query is for grep and --index, not for --first-match, --shadowed, --hits, --flows or --serve")
+
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        atexit.register(dump_profile, profiler, options.profile)
+        profiler.enable()
+
+    if options.format != "text" and (options.first_match or options.shadowed or options.hits or options.flows or options.diff or options.serve):
+        parser.error("--format is for the matching lines of a query, not for --first-match, --shadowed, --hits, --flows, --diff or --serve")
+
+    # the matching lines are written in blocks, which are flushed at exit
+    writer = MatchWriter(options.format)
+    atexit.register(writer.flush)
+    structured = options.format != "text"
+
+    stats = None
+    output = print
+    write_line, write_record = writer.line, writer.record
+    if options.stats and options.jobs > 1:
+        parser.error("--stats only measures a single process, not --jobs")
+    if options.stats:
+        stats = ACLStats()
+        atexit.register(stats.dump)
+        output = stats.timed(print, "output")
+        write_line = stats.timed(writer.line, "output")
+        write_record = stats.timed(writer.record, "output")
+
+    if options.recursive:
+        if "-" in args:
+            parser.error("-r needs files and directories, not stdin")
+        args = walk_files(args or ["."])
+        if not (options.first_match or options.shadowed or options.hits or options.flows or options.serve or options.build_index or options.diff):
+            # the summaries only tell which files may contain lines matching the query
+            summaries = ACLSummaries(parser_class)
+            summaries.update(args, options.jobs)
+            summaries.save()
+            selected = summaries.select(args, grepper.query)
+            if stats:
+                stats.count("files skipped by their summaries", len(args) - len(selected))
+            args = selected
+        if not args:
+            sys.exit()
+
+    if options.serve:
+        if not args:
+            parser.error("the server needs files, not stdin")
+        server = ACLServer(args, parser_class)
+        print("serving %d files on %s" % (len(args), options.serve), file = sys.stderr)
+        try:
+            server.serve(options.serve)
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    if options.first_match:
+        try:
+            tracer = ACLTracer(*criteria[:5], parser = parser_class())
+        except ValueError as e:
+            parser.error(str(e))
+        if stats:
+            stats.instrument_grepper(tracer)
+        for name, objects, lines in input_files(args):
+            tracer.new_file(name)
+            tracer.parser.use_objects(objects)
+            for number, line in enumerate(lines, 1):
+                tracer.trace(line, number)
+
+        for source, name, hit in tracer.results():
+            if hit:
+                output("%s: %s: %s:%d: %s" % (name or "-", hit[0], source, hit[1], hit[2]))
+            else:
+                output("%s: implicit deny: %s" % (name or "-", source))
+        sys.exit()
+
+    if options.shadowed:
+        analyzer = ACLShadowAnalyzer(parser_class())
+        for name, objects, lines in input_files(args):
+            analyzer.new_file(name)
+            analyzer.parser.use_objects(objects)
+            for number, line in enumerate(lines, 1):
+                analyzer.check(line, number)
+
+        for source, name, kind, rule, cover in analyzer.results():
+            output("%s: %s: %s:%d: %s" % (name or "-", kind, source, rule[0], rule[1]))
+            output("\tcovered by %s:%d: %s" % (source, cover[0], cover[1]))
+        sys.exit()
+
+    if options.hits or options.hits_since:
+        since = None
+        if options.hits_since:
+            # only the counts of the older output are needed
+            before = ACLHitCounter(0, parser = parser_class(), counts = {})
+            for name, objects, lines in input_files([options.hits_since]):
+                before.new_file(name)
+                for number, line in enumerate(lines, 1):
+                    before.check(line, number)
+            before.finish()
+            since = before.counts
+
+        unused = lambda source, name, number, line: output("%s: no hits: %s:%d: %s" % (name or "-", source, number, line))
+        counter = ACLHitCounter(options.top, since, parser_class(), unused)
+        for name, objects, lines in input_files(args):
+            counter.new_file(name)
+            for number, line in enumerate(lines, 1):
+                counter.check(line, number)
+
+        for hits, source, name, number, line in counter.top():
+            output("%s: %d hits: %s:%d: %s" % (name or "-", hits, source, number, line))
+        for source, name, rules, hits, without in counter.totals():
+            output("%s: %d hits in %d rules, %d without hits: %s" % (name or "-", hits, rules, without, source))
+        sys.exit()
+
+    if options.flows:
+        try:
+            batch = ACLBatchGrepper(read_flows(options.flows), options.match_any, parser_class())
+        except ValueError as e:
+            parser.error("%s: %s" % (options.flows, e))
+
+        if options.index:
+            # every flow is answered from the parsed rules, with numpy against all of them at once
+            if not args:
+                parser.error("an index needs files, not stdin")
+            index = ACLIndex(options.index)
+            index.update(args, batch.parser)
+            if index.changed:
+                index.save()
+            for flow, query in zip(batch.flows, batch.queries):
+                output(",".join(column or "" for column in flow))
+                for path, number, line in index.hits(query, args):
+                    output("\t%s:%d: %s" % (path, number, line))
+            sys.exit()
+
+        if stats:
+            stats.instrument_grepper(batch)
+        matches = [[] for flow in batch.flows]
+        for name, objects, lines in input_files(args):
+            batch.parser.use_objects(objects)
+            for number, line in enumerate(lines, 1):
+                for n in batch.grep(line):
+                    matches[n].append("%s:%d: %s" % (name, number, line.strip()))
+
+        for flow, lines in zip(batch.flows, matches):
+            output(",".join(column or "" for column in flow))
+            for line in lines:
+                output("\t" + line)
+        sys.exit()
+
+    if stats:
+        stats.instrument_grepper(grepper)
+
+    if options.build_index or options.index:
+        if not args:
+            parser.error("an index needs files, not stdin")
+
+        index = ACLIndex(options.build_index or options.index)
+        index.update(args, grepper.parser)
+        if index.changed:
+            index.save()
+        if options.diff:
+            for path in args:
+                added, removed = index.diffs.get(os.path.abspath(path), ((), ()))
+                if added or removed:
+                    output("--- %s" % path)
+                for line in added:
+                    output("+ " + line)
+                for line in removed:
+                    output("- " + line)
+        if options.index and structured:
+            # only the rules are in the index, the fields are taken from the line again and the name
+            # of its ACL from the lines before
+            last, seen = None, 0
+            for path, number, line in index.hits(grepper.query, args, grepper.expression):
+                if path != last or number <= seen:
+                    grepper.parser.use_objects(read_objects(path))
+                    lines = index.files[os.path.abspath(path)].lines
+                    last, seen = path, 0
+                for earlier in lines[seen:number - 1]:
+                    grepper.parser.track_acl(earlier)
+                seen = number
+                grepper.parser.next_line(line)
+                write_record(match_record(path, number, grepper.parser, line))
+        elif options.index:
+            for line in index.query(grepper.query, args, grepper.expression):
+                write_line(line)
+        sys.exit()
+
+    # stdin can only be read by a single process
+    if options.jobs > 1 and args and not "-" in args:
+        for match in parallel_grep(args, criteria, options.jobs, parser_class, net_match = options.net_match, records = structured, expression = options.query):
+            if structured:
+                write_record(match)
+            else:
+                write_line(match)
+        sys.exit()
+
+    # ...check all lines in all files, lines which cannot match are skipped before parsing them
+    if args and not "-" in args:
+        counted = stats.lines_read if stats else None
+        for path in args:
+            objects = read_objects(path)
+            grepper.parser.use_objects(objects)
+            prefilter = line_prefilter(grepper.query, objects, structured)
+            if structured:
+                for number, line in read_candidates(path, prefilter, True, counted):
+                    if grepper.grep(line):
+                        write_record(match_record(path, number, grepper.parser, line))
+            else:
+                for line in read_candidates(path, prefilter, False, counted):
+                    if grepper.grep(line):
+                        write_line(line.strip())
+        sys.exit()
 
-    # ...check all lines in all files (or stdin)
-    for line in fileinput.input(args):
-        if grepper.grep(line):
-            print(line.strip())
+    # ...or stdin
+    for name, objects, lines in input_files(args):
+        grepper.parser.use_objects(objects)
+        for number, line in enumerate(lines, 1):
+            if not grepper.grep(line):
+                continue
+            if structured:
+                write_record(match_record(name, number, grepper.parser, line))
+            else:
+                write_line(line.strip())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+'''Measures throughput and peak memory of the parser and the matcher on a generated corpus.
+   The results can be written as JSON and compared with the results of an earlier run.
+
+   Copyright 2013, Steffen Imhof
+   Licensed under the MIT License (MIT), see LICENSE file for details
+'''
+
+import os, sys, json, time, platform, tempfile, subprocess, tracemalloc
+from optparse import OptionParser
+
+# aclgrep is a single file one directory above
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import aclgrep
+from benchmarks.corpus import CorpusGenerator, FORMATS
+
+# the criteria of the end to end benchmark, see ACLGrepper
+GREP_CRITERIA = ("10.10.10.10", None, None, "443", "tcp")
+
+
+def parse_lines(lines):
+    next_line = aclgrep.ACLParser().next_line
+    for line in lines:
+        next_line(line)
+
+def convert_nets(nets):
+    net_string_to_pair = aclgrep.net_string_to_pair
+    for net in nets:
+        net_string_to_pair(net)
+
+def grep_lines(lines):
+    grep = aclgrep.ACLGrepper(*GREP_CRITERIA, parser = aclgrep.ACLParser()).grep
+    for line in lines:
+        grep(line)
+
+def found_nets(lines):
+    '''Returns the nets the parser finds in the lines, as they are handed to net_string_to_pair.'''
+    parser = aclgrep.ACLParser()
+    nets = []
+    for line in lines:
+        parser.next_line(line)
+        nets.extend(net for net in (parser.source_net, parser.destination_net) if net and net != "any")
+    return nets
+
+def measure(function, items, repeat):
+    '''Runs the function over the items and returns the best time of the runs and the peak memory.
+       The memory is traced in a separate run, as tracing slows everything down.'''
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(items)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    tracemalloc.start()
+    function(items)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"items": len(items), "seconds": best, "per_second": len(items) / best, "peak_kib": peak / 1024.0}
+
+def run(lines, repeat):
+    nets = found_nets(lines)
+    return {
+        "next_line": measure(parse_lines, lines, repeat),
+        "net_string_to_pair": measure(convert_nets, nets, repeat),
+        "grep": measure(grep_lines, lines, repeat),
+    }
+
+def import_seconds():
+    '''Returns the seconds a new interpreter spends importing aclgrep, as reported by -X importtime.'''
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import aclgrep"], cwd=ROOT,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    for line in output.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "aclgrep":
+            return int(fields[1]) / 1e6
+    raise ValueError("no import time of aclgrep in the output")
+
+def measure_startup(runs):
+    '''Measures the import of the module and a whole run of the script on a file of a few lines, which
+       is what dominates when the script is called many times on small files. Both are run in new
+       interpreters, the best of the runs counts.'''
+    with tempfile.NamedTemporaryFile("w", suffix=".acl", delete=False) as f:
+        f.write("\n".join(CorpusGenerator().mixed(20)) + "\n")
+    try:
+        command = [sys.executable, os.path.join(ROOT, "aclgrep.py"), "-i", GREP_CRITERIA[0], f.name]
+        imports, scripts = [], []
+        for i in range(runs):
+            imports.append(import_seconds())
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+            scripts.append(time.perf_counter() - start)
+    finally:
+        os.unlink(f.name)
+
+    # the memory of other processes is not traced
+    return {
+        "import": {"items": runs, "seconds": min(imports), "per_second": 1 / min(imports), "peak_kib": 0},
+        "startup": {"items": runs, "seconds": min(scripts), "per_second": 1 / min(scripts), "peak_kib": 0},
+    }
+
+def compare(results, baseline, tolerance):
+    '''Prints the change against the baseline and returns the names of the benchmarks which got slower
+       by more than the tolerance.'''
+    slower = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = result["per_second"] / old["per_second"] - 1
+        print("%-20s %+7.1f%% throughput %+7.1f%% peak memory" % (name, change * 100, (result["peak_kib"] / old["peak_kib"] - 1) * 100 if old["peak_kib"] else 0))
+        if change < -tolerance:
+            slower.append(name)
+    return slower
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="Usage: %prog [options]")
+    parser.add_option("-n", "--lines", dest="lines", type="int", default=100000, help="Number of lines of the corpus")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=1, help="Seed of the corpus generator")
+    parser.add_option("-f", "--format", dest="format", default="mixed", help="Format of the corpus, one of %s or mixed" % ", ".join(FORMATS))
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3, help="Number of timed runs, the best one counts")
+    parser.add_option("--json", dest="json", default=None, metavar="FILE", help="Write the results as JSON to the file, - for stdout")
+    parser.add_option("--compare", dest="compare", default=None, metavar="FILE", help="Compare with the JSON results of an earlier run")
+    parser.add_option("--startup", dest="startup", type="int", default=10, help="Number of runs of the startup benchmark, 0 to skip it")
+    parser.add_option("--startup-budget", dest="startup_budget", type="float", default=None, metavar="MS", help="Exit with status 1 if importing aclgrep takes longer than this")
+    parser.add_option("--tolerance", dest="tolerance", type="float", default=0.1, help="Exit with status 1 if the throughput dropped by more than this fraction (default 0.1)")
+    (options, args) = parser.parse_args()
+
+    if options.format not in FORMATS + ("mixed",):
+        parser.error("unknown format %s" % options.format)
+
+    generator = CorpusGenerator(options.seed)
+    lines = generator.mixed(options.lines) if options.format == "mixed" else generator.lines(options.lines, options.format)
+    results = run(lines, options.repeat)
+    if options.startup > 0:
+        results.update(measure_startup(options.startup))
+
+    report = {
+        "corpus": {"lines": options.lines, "seed": options.seed, "format": options.format},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if options.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print("")
+    else:
+        for name, result in sorted(results.items()):
+            print("%-20s %10.0f per second %10.1f KiB peak (%d items)" % (name, result["per_second"], result["peak_kib"], result["items"]))
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if options.startup_budget is not None and "import" in results and results["import"]["seconds"] * 1000 > options.startup_budget:
+        print("importing aclgrep took %.1f ms, more than the budget of %.1f ms" % (results["import"]["seconds"] * 1000, options.startup_budget))
+        sys.exit(1)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, options.tolerance)
+        if slower:
+            print("slower than the baseline: %s" % ", ".join(slower))
+            sys.exit(1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+'''Generates synthetic ACL files for the benchmarks. The same seed always gives the same lines.
+
+   Copyright 2013, Steffen Imhof
+   Licensed under the MIT License (MIT), see LICENSE file for details
+'''
+
+import random
+from optparse import OptionParser
+
+FORMATS = ("asa", "hitcnt", "ios", "ios-named")
+
+# named ports as they show up in real ACLs
+NAMED_PORTS = ["www", "https", "ssh", "telnet", "smtp", "domain", "ntp", "snmp", "ldap", "ftp-data", "netbios-ns", "radius-acct"]
+
+MASKS = ["255.255.255.0", "255.255.0.0", "255.255.255.128", "255.255.255.252", "255.0.0.0", "255.255.255.255"]
+WILDCARDS = ["0.0.0.255", "0.0.255.255", "0.0.0.127", "0.0.0.3", "0.255.255.255", "0.0.0.1"]
+
+
+class CorpusGenerator:
+    """Creates ACL lines with the mix of nets (host, net + mask, net + wildcard, CIDR, any) and ports
+       (eq with numbers and names, several ports, range, gt, lt, neq) found in the test cases."""
+
+    def __init__(self, seed = 1):
+        self.random = random.Random(seed)
+
+    def address(self):
+        r = self.random
+        return "%d.%d.%d.%d" % (r.choice((10, 10, 172, 192, r.randint(1, 223))), r.randint(0, 255), r.randint(0, 255), r.randint(1, 254))
+
+    def net(self, ios = False):
+        r = self.random.random()
+        if r < 0.3:
+            return "host " + self.address()
+        if r < 0.5:
+            return "any"
+        if r < 0.8:
+            # IOS uses wildcards, the ASA subnet masks
+            return self.address() + " " + self.random.choice(WILDCARDS if ios else MASKS)
+        return "%s/%d" % (self.address(), self.random.choice((8, 16, 24, 28, 32)))
+
+    def port(self):
+        r = self.random
+        value = lambda: r.choice(NAMED_PORTS) if r.random() < 0.4 else str(r.randint(1, 65535))
+        kind = r.random()
+        if kind < 0.45:
+            return ""
+        if kind < 0.7:
+            return " eq " + value()
+        if kind < 0.75:
+            return " eq " + " ".join(value() for i in range(r.randint(2, 4)))
+        if kind < 0.85:
+            low = r.randint(1, 60000)
+            return " range %d %d" % (low, low + r.randint(1, 5000))
+        return " %s %d" % (r.choice(("gt", "lt", "neq")), r.randint(1, 65535))
+
+    def rule(self, ios = False):
+        '''Returns the part of a rule after the name of the ACL.'''
+        r = self.random
+        protocol = r.choice(("tcp", "tcp", "udp", "ip", "icmp"))
+        action = "deny" if r.random() < 0.2 else "permit"
+        if protocol in ("tcp", "udp"):
+            return "%s %s %s%s %s%s" % (action, protocol, self.net(ios), self.port(), self.net(ios), self.port())
+        return "%s %s %s %s" % (action, protocol, self.net(ios), self.net(ios))
+
+    def remark(self):
+        return "remark ticket %d change window for %s" % (self.random.randint(1, 99999), self.random.choice(("webservers", "dns", "backup", "monitoring")))
+
+    def lines(self, count, format = "asa"):
+        '''Returns count lines of ACLs in the given format, see FORMATS.'''
+        r = self.random
+        lines = []
+        acl = 0
+        while len(lines) < count:
+            acl += 1
+            size = r.randint(5, 200)
+            if format == "ios-named":
+                lines.append("ip access-list extended ACL_%d" % acl)
+            for number in range(1, size + 1):
+                if len(lines) >= count:
+                    break
+                text = self.remark() if r.random() < 0.05 else self.rule(format.startswith("ios"))
+                if format == "asa":
+                    lines.append("access-list acl%d extended %s" % (acl, text))
+                elif format == "hitcnt":
+                    hash = "0x%08x" % r.getrandbits(32)
+                    if text.startswith("remark"):
+                        lines.append("access-list acl%d line %d %s" % (acl, number, text))
+                    else:
+                        lines.append("access-list acl%d line %d extended %s (hitcnt=%d) %s" % (acl, number, text, r.randint(0, 10 ** 6), hash))
+                elif format == "ios":
+                    lines.append("access-list %d %s" % (100 + acl % 100, text))
+                else:
+                    lines.append(" %d %s" % (number * 10, text))
+        return lines
+
+    def mixed(self, count):
+        '''Returns count lines with blocks of all formats.'''
+        lines = []
+        while len(lines) < count:
+            lines.extend(self.lines(min(1000, count - len(lines)), self.random.choice(FORMATS)))
+        return lines
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="Usage: %prog [options] [output file]")
+    parser.add_option("-n", "--lines", dest="lines", type="int", default=100000, help="Number of lines to generate")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=1, help="Seed of the random generator")
+    parser.add_option("-f", "--format", dest="format", default="mixed", help="One of %s or mixed" % ", ".join(FORMATS))
+    (options, args) = parser.parse_args()
+
+    if options.format not in FORMATS + ("mixed",):
+        parser.error("unknown format %s" % options.format)
+
+    generator = CorpusGenerator(options.seed)
+    lines = generator.mixed(options.lines) if options.format == "mixed" else generator.lines(options.lines, options.format)
+    out = open(args[0], "w") if args else None
+    try:
+        for line in lines:
+            print(line, file=out)
+    finally:
+        if out:
+            out.close()
@@ -7,7 +7,7 @@ import unittest
 
 # import aclgrep code from one directory above
 sys.path.append("..")
-from aclgrep import ACLParser
+from aclgrep import ACLParser, RegexACLParser
 
 
 class ACLParserTest(unittest.TestCase):
@@ -100,5 +100,85 @@ class ACLParserTest(unittest.TestCase):
         self.parser.next_line("40 deny ip any 10.111.114.0/32")
         self.assertEqual("ip", self.parser.protocol)
 
+
+class TokenizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = ACLParser()
+
+    def testNamedPortsWithDashes(self):
+        self.parser.next_line("permit tcp 10.223.217.27/32 range ftp-data ftp 172.29.205.170/32 eq radius-acct")
+        self.assertEqual("range 20 21", self.parser.source_port)
+        self.assertEqual("eq 1646", self.parser.destination_port)
+
+    def testMultipleNamedPorts(self):
+        self.parser.next_line("permit tcp host 10.1.1.1 eq www https 8080 any")
+        self.assertEqual("eq 80 443 8080", self.parser.source_port)
+        self.assertEqual("any", self.parser.destination_net)
+
+    def testUnknownNamedPort(self):
+        self.parser.next_line("permit tcp any host 10.1.1.1 eq foo\n")
+        self.assertEqual("eq foo", self.parser.destination_port)
+        self.parser.next_line("permit tcp any host 10.1.1.1 gt foo\n")
+        self.assertEqual("any", self.parser.source_port)
+        self.assertEqual(None, self.parser.destination_port)
+
+    def testIPv6Nets(self):
+        self.parser.next_line("permit tcp 2001:db8::/32 eq www host 2001:DB8::1 eq 443 sequence 10")
+        self.assertEqual("2001:db8::/32", self.parser.source_net)
+        self.assertEqual("2001:DB8::1/128", self.parser.destination_net)
+        self.assertEqual("eq 80", self.parser.source_port)
+        self.assertEqual("eq 443", self.parser.destination_port)
+        self.parser.next_line("access-list v6 extended permit icmp6 any6 ::/0")
+        self.assertEqual("any6", self.parser.source_net)
+        self.assertEqual("::/0", self.parser.destination_net)
+        self.assertEqual("icmp6", self.parser.protocol)
+        # times are no addresses
+        self.parser.next_line("permit ip any4 host 10.1.1.1 time 12:30:00")
+        self.assertEqual("any4", self.parser.source_net)
+        self.assertEqual("10.1.1.1/32", self.parser.destination_net)
+
+    def testAction(self):
+        self.parser.next_line("access-list acl761 line 3 extended permit tcp any host 10.114.6.135 eq ssh")
+        self.assertEqual("permit", self.parser.action)
+        self.parser.next_line(" 10 deny ip any any")
+        self.assertEqual("deny", self.parser.action)
+        self.parser.next_line("access-list acl761 line 1 remark permit everything")
+        self.assertEqual(None, self.parser.action)
+
+    def testACLName(self):
+        self.parser.next_line("access-list acl761 line 3 extended permit tcp any host 10.114.6.135 eq ssh")
+        self.assertEqual("acl761", self.parser.acl_name)
+        self.parser.next_line("access-list outside; 3 elements; name hash: 0x3a2f")
+        self.assertEqual("outside", self.parser.acl_name)
+        self.parser.next_line("ip access-list extended INSIDE")
+        self.assertEqual("INSIDE", self.parser.acl_name)
+        self.parser.next_line(" 10 deny ip any any")
+        self.assertEqual("INSIDE", self.parser.acl_name)
+        self.parser.next_line("Extended IP access list 101")
+        self.assertEqual("101", self.parser.acl_name)
+        self.parser.next_line("    10 permit udp any any eq domain")
+        self.assertEqual("101", self.parser.acl_name)
+
+    def testHeaders(self):
+        for line in ("ip access-list extended INSIDE", "ipv6 access-list V6", "access-list 101"):
+            self.parser.next_line(line)
+            self.assertEqual(None, self.parser.action, line)
+            self.assertEqual(None, self.parser.protocol, line)
+
+    def testNoTokens(self):
+        self.parser.next_line("")
+        self.assertEqual(None, self.parser.source_net)
+        self.parser.next_line("remark host")
+        self.assertEqual(None, self.parser.source_net)
+        self.assertEqual(None, self.parser.protocol)
+
+
+class RegexACLParserTest(ACLParserTest):
+    """Runs the same checks against the old regex based parser."""
+
+    def setUp(self):
+        self.parser = RegexACLParser()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLBatchGrepper, ACLGrepper, read_flows
+
+
+LINES = [
+    "access-list acl762 line 1 extended permit ip 192.168.2.0 255.255.255.0 10.221.34.0 255.255.255.0",
+    "access-list acl762 line 2 extended permit tcp host 192.168.2.12 any eq ssh",
+    "access-list acl762 line 3 extended permit udp any 10.221.0.0 255.255.0.0 range 100 200",
+    "access-list acl762 line 4 extended deny ip 192.168.0.0/16 any",
+    "access-list acl762 line 5 extended permit tcp any6 2001:db8::/32 eq ssh",
+    "access-list acl762 line 6 extended permit ip any4 host 10.221.34.1",
+    "access-list acl762 line 7 extended permit ip host 2001:db8::1 any",
+    "just some random text",
+]
+
+FLOWS = [
+    ("192.168.2.12", None, "10.221.34.1", "22", "tcp"),
+    ("192.168.3.1", "1024", "10.221.1.1", "150", "udp"),
+    (None, None, "10.221.34.1", None, None),
+    (None, None, None, "22", None),
+    ("172.16.1.1", None, None, None, None),
+    ("2001:db8::1", None, "2001:db8::2", "22", "tcp"),
+    ("::1", None, "10.221.34.1", None, None),
+]
+
+
+class batch(unittest.TestCase):
+
+    def checkSameAsGrepper(self, match_any):
+        batch = ACLBatchGrepper(FLOWS, match_any)
+        matches = [[] for flow in FLOWS]
+        for number, line in enumerate(LINES):
+            for flow in batch.grep(line):
+                matches[flow].append(number)
+
+        for flow, numbers in zip(FLOWS, matches):
+            grepper = ACLGrepper(*flow, match_any = match_any)
+            self.assertEqual([n for n, line in enumerate(LINES) if grepper.grep(line)], numbers)
+
+    def testSameAsGrepper(self):
+        self.checkSameAsGrepper(False)
+
+    def testSameAsGrepperWithAny(self):
+        self.checkSameAsGrepper(True)
+
+    def testReadFlows(self):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w") as f:
+            f.write("sip,sport,dip,dport,proto\n# comment\n10.1.1.1,,10.2.2.2,22,tcp\n\n,,10.2.2.2\n")
+        try:
+            self.assertEqual([("10.1.1.1", None, "10.2.2.2", "22", "tcp"), (None, None, "10.2.2.2", None, None)], read_flows(path))
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import sys
+import subprocess
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLParser
+from benchmarks.corpus import CorpusGenerator, FORMATS
+from benchmarks.benchmark import run, measure_startup, ROOT
+
+
+class corpus(unittest.TestCase):
+
+    def testSeed(self):
+        self.assertEqual(CorpusGenerator(7).mixed(500), CorpusGenerator(7).mixed(500))
+        self.assertNotEqual(CorpusGenerator(7).mixed(500), CorpusGenerator(8).mixed(500))
+
+    def testFormats(self):
+        parser = ACLParser()
+        for format in FORMATS:
+            lines = CorpusGenerator().lines(300, format)
+            self.assertEqual(300, len(lines))
+            for line in lines:
+                parser.next_line(line)
+                if "remark" in line or "ip access-list" in line:
+                    self.assertEqual(None, parser.action)
+                else:
+                    # every rule has an action and both nets
+                    self.assertTrue(parser.action in ("permit", "deny"), line)
+                    self.assertTrue(parser.source_net and parser.destination_net, line)
+
+    def testRun(self):
+        results = run(CorpusGenerator().mixed(100), 1)
+        self.assertEqual(["grep", "net_string_to_pair", "next_line"], sorted(results))
+        self.assertEqual(100, results["grep"]["items"])
+        self.assertTrue(results["next_line"]["per_second"] > 0)
+
+    def testStartup(self):
+        results = measure_startup(1)
+        self.assertEqual(["import", "startup"], sorted(results))
+        self.assertEqual(1, results["startup"]["items"])
+        self.assertTrue(results["import"]["seconds"] < results["startup"]["seconds"])
+
+    def testLazyImports(self):
+        # the modules of the other modes are only imported when they are used
+        code = "import sys, aclgrep; print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, universal_newlines=True).split()
+        for module in ("multiprocessing", "json", "pickle", "hashlib", "csv", "optparse", "ipaddress", "threading"):
+            self.assertFalse(module in modules, module)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLParser, ACLObjects, ACLQuery, AddressSet, detect_dialect, line_prefilter, split_file
+
+
+IPTABLES = """# Generated by iptables-save v1.8.7
+*filter
+:INPUT DROP [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -s 10.1.0.0/16 -p tcp -m tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp -m multiport --dports 80,443,8000:8080 -j ACCEPT
+-A INPUT ! -s 192.168.0.0/16 -p udp --dport 53 -j DROP
+-A FORWARD -s 10.2.0.0/16,10.3.0.0/16 -d 172.16.5.5 -p udp --sport 1024: -j ACCEPT
+-A FORWARD -p 50 -j LOG
+COMMIT
+"""
+
+JUNOS = """firewall {
+    family inet {
+        filter PROTECT {
+            term ssh {
+                from {
+                    source-address {
+                        10.1.0.0/16;
+                        10.1.99.0/24 except;
+                    }
+                    protocol tcp;
+                    destination-port ssh;
+                }
+                then accept;
+            }
+            term web {
+                from {
+                    destination-address 172.16.1.0/24;
+                    destination-port [ http 8000-8080 ];
+                }
+                then {
+                    count web;
+                    discard;
+                }
+            }
+        }
+    }
+}
+"""
+
+JUNOS_SET = """set firewall family inet filter PROTECT term ssh from source-address 10.1.0.0/16
+set firewall family inet filter PROTECT term ssh from source-address 10.1.99.0/24 except
+set firewall family inet filter PROTECT term ssh from protocol tcp
+set firewall family inet filter PROTECT term ssh from destination-port ssh
+set firewall family inet filter PROTECT term ssh then accept
+set firewall family inet filter PROTECT term web from destination-address 172.16.1.0/24
+set firewall family inet filter PROTECT term web from destination-port http
+set firewall family inet filter PROTECT term web from destination-port 8000-8080
+set firewall family inet filter PROTECT term web then count web
+set firewall family inet filter PROTECT term web then discard
+"""
+
+
+class dialects(unittest.TestCase):
+
+    def parse(self, text):
+        '''Returns the rules of the lines of a file with an action, with the name of their ACL.'''
+        lines = text.splitlines()
+        objects = ACLObjects()
+        objects.read(lines)
+        parser = ACLParser()
+        parser.use_objects(objects)
+        rules = []
+        for line in lines:
+            rule = parser.parse_rule(line)
+            if rule.action:
+                rules.append((parser.acl_name, rule))
+        return rules
+
+    def testDetect(self):
+        self.assertEqual("asa", detect_dialect(["ASA Version 9.8(4)", "access-list outside extended permit ip any any"]))
+        self.assertEqual("asa", detect_dialect(["access-list outside line 1 extended permit ip any any (hitcnt=0) 0x1"]))
+        self.assertEqual("ios", detect_dialect(["access-list 101 permit ip any any", "ip access-list extended EDGE"]))
+        self.assertEqual("nxos", detect_dialect(["!Command: show running-config", "ip access-list SERVERS"]))
+        self.assertEqual("juniper", detect_dialect(JUNOS.splitlines()))
+        self.assertEqual("juniper", detect_dialect(JUNOS_SET.splitlines()))
+        self.assertEqual("iptables", detect_dialect(IPTABLES.splitlines()))
+        self.assertEqual(None, detect_dialect(["interface GigabitEthernet0/1", " no shutdown"]))
+
+    def testPositions(self):
+        parser = ACLParser()
+        parser.use_dialect("asa")
+        # a port after "any" belongs to the source, a single port before other words to the destination
+        parser.next_line("access-list a extended permit tcp any eq 5306 host 10.1.1.1")
+        self.assertEqual(("eq 5306", None), (parser.source_port, parser.destination_port))
+        parser.next_line("access-list a line 3 extended permit tcp host 10.1.1.1 host 10.2.2.2 eq www (hitcnt=5) 0x5af84e6b")
+        self.assertEqual((None, "eq 80"), (parser.source_port, parser.destination_port))
+        parser.next_line("access-list a extended permit tcp host 10.1.1.1 host 10.2.2.2 eq www log")
+        self.assertEqual((None, "eq 80"), (parser.source_port, parser.destination_port))
+        # ASA standard ACLs are about destinations
+        parser.next_line("access-list split standard permit 10.0.0.0 255.0.0.0")
+        self.assertEqual((None, "10.0.0.0 255.0.0.0"), (parser.source_net, parser.destination_net))
+
+    def testFallback(self):
+        # lines the dialect does not know are tokenized
+        parser = ACLParser()
+        parser.use_dialect("asa")
+        parser.next_line("access-list a extended permit tcp interface outside host 10.1.1.1 eq 443")
+        self.assertEqual(("10.1.1.1/32", "permit"), (parser.source_net, parser.action))
+        parser.next_line("  network-object host 10.9.9.9")
+        self.assertEqual("10.9.9.9/32", parser.destination_net)
+
+    def testIOS(self):
+        rules = self.parse("""access-list 10 permit 10.1.1.1
+ip access-list standard MGMT
+ 10 permit 10.9.0.0 0.0.255.255
+ip access-list extended EDGE
+ 10 permit tcp any host 172.16.1.1 eq 443
+ 20 permit 6 any any
+Standard IP access list 10
+    20 permit 10.2.0.0, wildcard bits 0.0.255.255 (5 matches)
+""")
+        self.assertEqual(["10", "MGMT", "EDGE", "EDGE", "10"], [name for name, rule in rules])
+        # standard ACLs only have a source
+        self.assertTrue(ACLQuery(sip = "10.1.1.1").matches(rules[0][1]))
+        self.assertFalse(ACLQuery(dip = "10.1.1.1").matches(rules[0][1]))
+        self.assertTrue(ACLQuery(sip = "10.9.5.5").matches(rules[1][1]))
+        self.assertTrue(ACLQuery(sip = "10.2.5.5").matches(rules[4][1]))
+        self.assertEqual(6, rules[3][1].protocol)
+
+    def testIOSIPv6(self):
+        text = """ipv6 access-list V6
+ permit tcp any host 2001:db8::1 eq 22
+ sequence 20 deny ipv6 2001:db8:1::/48 any
+IPv6 access list SHOWN
+    permit udp any any eq domain (3 matches) sequence 10
+"""
+        self.assertEqual("ios", detect_dialect(text.splitlines()))
+        self.assertEqual("ios", detect_dialect(["ipv6 access-list V6", " permit ipv6 any any"]))
+        rules = self.parse(text)
+        self.assertEqual(["V6", "V6", "SHOWN"], [name for name, rule in rules])
+        self.assertTrue(ACLQuery(dip = "2001:db8::1", dport = "22", protocol = "tcp").matches(rules[0][1]))
+        self.assertFalse(ACLQuery(dip = "2001:db8::1", protocol = "udp").matches(rules[0][1]))
+        self.assertTrue(ACLQuery(sip = "2001:db8:1::5").matches(rules[1][1]))
+        self.assertEqual("deny", rules[1][1].action)
+        self.assertTrue(ACLQuery(dport = "53", protocol = "udp").matches(rules[2][1]))
+
+    def testNXOS(self):
+        rules = self.parse("""!Command: show running-config aclmgr
+ip access-list SERVERS
+  statistics per-entry
+  10 remark web servers
+  20 permit tcp 10.1.0.0/16 172.16.1.0/24 eq 443
+  30 permit udp any 172.16.2.2/32 eq 53 log
+""")
+        self.assertEqual(2, len(rules))
+        self.assertTrue(ACLQuery("10.1.2.3", None, "172.16.1.9", "443", "tcp").matches(rules[0][1]))
+        self.assertEqual(((53, 53),), rules[1][1].destination_ports)
+
+    def testJuniper(self):
+        rules = self.parse(JUNOS)
+        self.assertEqual(rules, self.parse(JUNOS_SET))
+        self.assertEqual(["PROTECT", "PROTECT"], [name for name, rule in rules])
+        ssh, web = rules[0][1], rules[1][1]
+        self.assertEqual(("permit", 6, ((22, 22),)), (ssh.action, ssh.protocol, ssh.destination_ports))
+        # the excluded net is left out, which only makes the rule match more
+        self.assertTrue(ACLQuery(sip = "10.1.99.1").matches(ssh))
+        self.assertFalse(ACLQuery(sip = "10.2.0.1").matches(ssh))
+        # missing addresses are any of the family, missing protocols all of them
+        self.assertEqual(("deny", 0, ((80, 80), (8000, 8080))), (web.action, web.protocol, web.destination_ports))
+        self.assertTrue(ACLQuery(sip = "10.2.0.1", dip = "172.16.1.1", match_any = True).matches(web))
+        self.assertFalse(ACLQuery(sip = "2001:db8::1", dip = "172.16.1.1", match_any = True).matches(web))
+
+    def testIptables(self):
+        rules = self.parse(IPTABLES)
+        self.assertEqual(["INPUT"] * 4 + ["FORWARD"], [name for name, rule in rules])
+        self.assertEqual(0, rules[0][1].protocol)
+        self.assertEqual(((80, 80), (443, 443), (8000, 8080)), rules[2][1].destination_ports)
+        # a negated source is any source
+        self.assertTrue(ACLQuery(sip = "192.168.1.1", match_any = True).matches(rules[3][1]))
+        self.assertFalse(ACLQuery(sip = "192.168.1.1").matches(rules[3][1]))
+        forward = rules[4][1]
+        self.assertTrue(isinstance(forward.source_net, AddressSet))
+        self.assertTrue(ACLQuery("10.3.1.1", "2000", "172.16.5.5", None, "udp").matches(forward))
+        self.assertFalse(ACLQuery("10.4.1.1").matches(forward))
+        self.assertEqual(((1024, 65535),), forward.source_ports)
+
+    def testPrefilter(self):
+        objects = ACLObjects()
+        objects.read(IPTABLES.splitlines())
+        # rules without addresses and protocols match as well
+        self.assertEqual(None, line_prefilter(ACLQuery(sip = "10.1.1.1", protocol = "tcp", match_any = True), objects))
+        prefilter = line_prefilter(ACLQuery(sip = "10.1.1.1", protocol = "tcp"), objects)
+        self.assertTrue(prefilter.search(b"-A INPUT -s 10.1.0.0/16 -j ACCEPT"))
+
+        objects = ACLObjects()
+        objects.read(JUNOS.splitlines())
+        self.assertEqual(None, line_prefilter(ACLQuery(sip = "10.1.1.1"), objects))
+
+    def testStatefulChunks(self):
+        with tempfile.NamedTemporaryFile("w", suffix = ".conf", delete = False) as f:
+            f.write(JUNOS * 20)
+        try:
+            # the terms must not be split
+            self.assertEqual([(f.name, 0, None, None)], list(split_file(f.name, 100)))
+        finally:
+            os.unlink(f.name)
+
+if __name__ == '__main__':
+    unittest.main()
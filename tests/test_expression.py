@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+import aclgrep
+from aclgrep import ACLExpression, ACLGrepper, ACLIndex, ACLParser
+
+
+LINES = [
+    "access-list outside extended permit tcp any host 10.1.1.1 eq 443",
+    "access-list outside extended permit tcp any host 10.1.1.2 eq 8443",
+    "access-list outside extended permit tcp any host 10.1.1.3 eq 80",
+    "access-list outside extended permit icmp any 10.1.0.0 255.255.0.0",
+    "access-list outside extended permit ip any 10.2.0.0 255.255.0.0",
+    "access-list outside extended permit udp host 192.168.1.1 eq 53 host 10.1.1.4",
+    "access-list outside extended permit tcp any host 172.16.1.1 eq 443",
+]
+
+
+class expression(unittest.TestCase):
+
+    def grep(self, text, *criteria):
+        grepper = ACLGrepper(*criteria, expression = text)
+        return [n for n, line in enumerate(LINES) if grepper.grep(line)]
+
+    def testExample(self):
+        # rules without ports allow all of them, rules for all protocols (ip) allow icmp as well
+        self.assertEqual([0, 1, 5], self.grep("dst in 10.0.0.0/8 AND (dport 443 OR dport 8443) AND NOT proto icmp"))
+
+    def testOperators(self):
+        self.assertEqual([0, 4, 6], self.grep("dport 443 and proto tcp"))
+        # and is optional, or binds weaker
+        self.assertEqual([0, 4, 6], self.grep("dport = 443 proto tcp"))
+        self.assertEqual([0, 1, 3, 4, 5, 6], self.grep("dport 443 proto tcp or dport 8443"))
+        self.assertEqual([3, 4, 5], self.grep("proto icmp or proto udp"))
+        self.assertEqual([0, 1, 2, 6], self.grep("not (proto icmp or proto udp)"))
+        self.assertEqual([5], self.grep("not not sport 53 and sip 192.168.0.0/16"))
+
+    def testEitherSide(self):
+        self.assertEqual([5], self.grep("ip 192.168.1.1"))
+        self.assertEqual([3, 5, 6], self.grep("ip 10.1.1.4 or ip 172.16.1.1"))
+
+    def testAny(self):
+        # a test of an address only matches "any" with match_any
+        self.assertEqual([5], self.grep("src 192.168.1.1"))
+        self.assertEqual([0, 1, 2, 3, 4, 5, 6], self.grep("src 192.168.1.1", None, None, None, None, None, True))
+
+    def testCriteria(self):
+        # the criteria are combined with and
+        self.assertEqual([0, 3], self.grep("dport 443 or dport 8443", None, None, "10.1.1.1"))
+        self.assertEqual([0], self.grep("dport 443 or dport 8443", None, None, "10.1.1.1", None, "tcp"))
+
+        # and so are they in the query
+        query = ACLExpression("proto udp and sport 53", criteria = ("192.168.1.1", None, "10.1.1.4", None, None)).query
+        self.assertEqual((17, 53, None), (query.protocol, query.source_port, query.destination_port))
+        self.assertTrue(query.source_ip is not None and query.destination_ip is not None)
+
+    def testQuery(self):
+        # only tests combined with and at the top narrow the query down
+        query = ACLExpression("dip 10.1.0.0/16 and (dport 443 or dport 8443) and not proto icmp").query
+        self.assertEqual((None, None, None), (query.destination_port, query.protocol, query.source_net))
+        self.assertNotEqual(None, query.destination_net)
+        self.assertEqual(None, ACLExpression("dip 10.1.1.1 or dport 443").query.destination_ip)
+
+    def testErrors(self):
+        for text in ("", "dip", "foo 1", "dport 443 and", "(dport 443", "dport 443)", "dip 10.1.1.300", "dport xyz"):
+            self.assertRaises(ValueError, ACLExpression, text)
+
+    def testReorder(self):
+        parser = ACLParser()
+        rules = [parser.parse_rule(line) for line in LINES]
+        expression = ACLExpression("dip 10.0.0.0/8 and not proto icmp and dport 8443")
+        expected = [expression.matches(rule) for rule in rules]
+        # protocols are tested first
+        self.assertEqual("NotPredicate", expression.root.children[0].__class__.__name__)
+
+        for i in range(aclgrep.REORDER_INTERVAL // len(rules) + 1):
+            self.assertEqual(expected, [expression.matches(rule) for rule in rules])
+        # dport 8443 rejects most rules, so it is tested first now
+        self.assertEqual("dport", expression.root.children[0].field)
+
+    def testIndex(self):
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            f.write("\n".join(LINES) + "\n")
+        try:
+            index = ACLIndex()
+            index.update([path])
+            grepper = ACLGrepper(expression = "dst 10.0.0.0/8 and (dport 443 or dport 8443) and not proto icmp")
+            self.assertEqual([LINES[0], LINES[1], LINES[5]], index.query(grepper.query, [path], grepper.expression))
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
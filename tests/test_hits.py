@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import sys
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLHitCounter, hit_annotation
+
+
+SHOW = """access-list outside; 4 elements; name hash: 0x6892a938
+access-list outside line 1 remark web servers
+access-list outside line 2 extended permit tcp any object-group WEB eq www 0x9d9d2b5b
+  access-list outside line 2 extended permit tcp any host 10.1.1.1 eq www (hitcnt=100) 0x2c0bba8f
+  access-list outside line 2 extended permit tcp any host 10.1.1.2 eq www (hitcnt=50) 0x93c2fea9
+access-list outside line 3 extended deny udp any any eq netbios-ns (hitcnt=920296) 0x4c3b867e
+access-list outside line 4 extended permit icmp any any (hitcnt=0) 0x11111111
+access-list inside; 2 elements; name hash: 0x1
+access-list inside line 1 extended permit ip 10.0.0.0 255.0.0.0 any (hitcnt=7) 0x22222222
+access-list inside line 2 extended deny ip any any (hitcnt=7) 0x33333333
+"""
+
+
+class hits(unittest.TestCase):
+
+    def count(self, text, top = 10, since = None, counts = None):
+        unused = []
+        counter = ACLHitCounter(top, since, unused = lambda *rule: unused.append(rule[1:3]), counts = counts)
+        counter.new_file("fw")
+        for number, line in enumerate(text.splitlines(), 1):
+            counter.check(line, number)
+        return counter, unused
+
+    def testAnnotation(self):
+        self.assertEqual((920296, "0x4c3b867e"), hit_annotation("access-list aclXFG line 46 extended deny udp any any eq netbios-ns (hitcnt=920296) 0x4c3b867e"))
+        self.assertEqual((None, "0x9d9d2b5b"), hit_annotation("access-list outside line 2 extended permit tcp any object-group WEB eq www 0x9d9d2b5b"))
+        self.assertEqual((None, None), hit_annotation("access-list outside extended permit tcp any any eq www"))
+
+    def testCounts(self):
+        counter, unused = self.count(SHOW)
+        self.assertEqual([("outside", 7)], unused)
+        # the rule with the object group has the hits of its expanded lines, among equal counts the earlier rule comes first
+        self.assertEqual([(920296, 6), (150, 3), (7, 9), (7, 10)], [(top[0], top[3]) for top in counter.top()])
+        self.assertEqual([("fw", "outside", 3, 920446, 1), ("fw", "inside", 2, 14, 0)], counter.totals())
+
+    def testTop(self):
+        counter, unused = self.count(SHOW, 2)
+        self.assertEqual([6, 3], [top[3] for top in counter.top()])
+        counter, unused = self.count(SHOW, 0)
+        self.assertEqual([], counter.top())
+
+    def testSince(self):
+        counts = {}
+        self.count(SHOW, counts = counts)
+        self.assertEqual(150, counts[("outside", "0x9d9d2b5b")])
+
+        # counters which went down were cleared, rules which are new count completely
+        later = SHOW.replace("hitcnt=100)", "hitcnt=130)").replace("(hitcnt=7) 0x22222222", "(hitcnt=3) 0x22222222").replace("0x33333333", "0x44444444")
+        counter, unused = self.count(later, since = counts)
+        self.assertEqual([("outside", 6), ("outside", 7)], unused)
+        self.assertEqual([(30, 3), (7, 10), (3, 9)], [(top[0], top[3]) for top in counter.top()])
+        self.assertEqual([("fw", "outside", 3, 30, 2), ("fw", "inside", 2, 10, 0)], counter.totals())
+
+    def testConfig(self):
+        # lines without counts are no output of "show access-list"
+        counter, unused = self.count("access-list outside extended permit tcp any any eq www\n")
+        self.assertEqual(([], [], []), (unused, counter.top(), counter.totals()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLFileIndex, ACLGrepper, ACLIndex, ACLQuery, IntervalIndex, PrefixTrie
+
+
+ACL = """access-list acl762 line 1 extended permit ip 192.168.2.0 255.255.255.0 10.221.34.0 255.255.255.0 (hitcnt=9) 0xfe82efcc
+access-list acl762 line 2 extended permit tcp host 192.168.2.12 any eq ssh (hitcnt=9) 0xfe82efcc
+access-list acl762 line 3 extended permit udp any 10.221.0.0 255.255.0.0 range 100 200 (hitcnt=9) 0xfe82efcc
+access-list acl762 line 4 extended deny ip 192.168.0.0/16 any (hitcnt=9) 0xfe82efcc
+access-list acl762 line 5 extended permit tcp any6 2001:db8::/32 eq ssh
+access-list acl762 line 6 extended permit ip host 2001:db8::1 any4
+just some random text
+"""
+
+
+class index(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.acl = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            f.write(ACL)
+        self.index_file = self.acl + ".idx"
+
+    def tearDown(self):
+        for path in (self.acl, self.index_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testPrefixTrie(self):
+        trie = PrefixTrie()
+        trie.insert(0x0a000000, 8, "a")
+        trie.insert(0x0a010000, 16, "b")
+        trie.insert(0x0a010101, 32, "c")
+        trie.insert(0x0b000000, 8, "d")
+        trie.insert(0, 0, "e")
+        self.assertEqual(["e", "a", "b", "c"], trie.lookup(0x0a010101))
+        self.assertEqual(["e", "a", "b"], trie.lookup(0x0a010102))
+        self.assertEqual(["e", "a"], trie.lookup(0x0a020202))
+        self.assertEqual(["e", "d"], trie.lookup(0x0b000001))
+        self.assertEqual(["e"], trie.lookup(0x0c000001))
+
+    def testIntervalIndex(self):
+        intervals = IntervalIndex([(1, 10, "a"), (5, 5, "b"), (8, 20, "c"), (30, 40, "d")])
+        self.assertEqual(["a", "b"], sorted(intervals.lookup(5)))
+        self.assertEqual(["a", "c"], sorted(intervals.lookup(9)))
+        self.assertEqual([], intervals.lookup(25))
+        self.assertEqual(["d"], intervals.lookup(40))
+
+    def checkSameAsGrep(self, index, *criteria):
+        grepper = ACLGrepper(*criteria)
+        expected = [line.strip() for line in ACL.splitlines() if grepper.grep(line)]
+        self.assertEqual(expected, index.query(grepper.query, [self.acl]))
+
+    def testQuery(self):
+        index = ACLIndex(self.index_file)
+        index.update([self.acl])
+        self.checkSameAsGrep(index, "192.168.2.12")
+        self.checkSameAsGrep(index, "192.168.2.12", None, None, None, None, True)
+        self.checkSameAsGrep(index, None, None, "10.221.34.1")
+        self.checkSameAsGrep(index, None, None, "10.221.34.1", "150", None, True)
+        self.checkSameAsGrep(index, "2001:db8::1")
+        self.checkSameAsGrep(index, "2001:db8::2", None, "2001:db8::1", None, None, True)
+        self.checkSameAsGrep(index, None, None, "2001:db8::1")
+        self.checkSameAsGrep(index, None, None, None, "22")
+        self.checkSameAsGrep(index, None, "80")
+        self.checkSameAsGrep(index, None, None, None, None, "udp")
+        self.checkSameAsGrep(index)
+
+    def testInvalidation(self):
+        index = ACLIndex(self.index_file)
+        index.update([self.acl])
+        self.assertTrue(index.changed)
+        index.save()
+
+        index = ACLIndex(self.index_file)
+        index.update([self.acl])
+        self.assertFalse(index.changed)
+
+        with open(self.acl, "a") as f:
+            f.write("permit ip host 1.2.3.4 any\n")
+        stat = os.stat(self.acl)
+        os.utime(self.acl, (stat.st_atime, stat.st_mtime + 1))
+        index.update([self.acl])
+        self.assertTrue(index.changed)
+        self.assertEqual(["permit ip host 1.2.3.4 any"], index.query(ACLGrepper("1.2.3.4").query, [self.acl]))
+
+    def testIncremental(self):
+        with open(self.acl, "a") as f:
+            f.write("object-group network SERVERS\n network-object host 10.1.1.1\naccess-list acl1 extended permit tcp any object-group SERVERS\n")
+        index = ACLIndex(self.index_file)
+        index.update([self.acl])
+        index.save()
+
+        # touched, but the same content
+        entry = index.files[self.acl]
+        stat = os.stat(self.acl)
+        os.utime(self.acl, (stat.st_atime, stat.st_mtime + 1))
+        index.update([self.acl])
+        self.assertTrue(entry is index.files[self.acl])
+        self.assertEqual({}, index.diffs)
+
+        lines = ACL.splitlines()
+        lines[1] = lines[1].replace("permit", "deny")
+        del lines[3]
+        lines += ["object-group network SERVERS", " network-object host 10.1.1.2", "access-list acl1 extended permit tcp any object-group SERVERS"]
+        with open(self.acl, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.utime(self.acl, (stat.st_atime, stat.st_mtime + 2))
+        index = ACLIndex(self.index_file)
+        index.update([self.acl])
+
+        # only the changed rule, the group and the rule using it are parsed again
+        self.assertEqual(4, index.files[self.acl].parsed)
+        self.assertEqual(([lines[1]], [ACL.splitlines()[1], ACL.splitlines()[3]]), index.diffs[self.acl])
+        self.assertTrue(lines[-1] in index.query(ACLGrepper(None, None, "10.1.1.2").query, [self.acl]))
+        self.assertFalse(lines[-1] in index.query(ACLGrepper(None, None, "10.1.1.1").query, [self.acl]))
+
+    def testNanoseconds(self):
+        mtime = 1700000000 * 10 ** 9
+        os.utime(self.acl, ns = (mtime, mtime))
+        index = ACLIndex()
+        index.update([self.acl])
+
+        # the same size and a modification time only a nanosecond later
+        with open(self.acl, "w") as f:
+            f.write(ACL.replace("line 1 extended permit", "line 1 extended deny  "))
+        os.utime(self.acl, ns = (mtime, mtime + 1))
+        self.assertFalse(index.files[self.acl].is_current())
+        index.update([self.acl])
+        self.assertEqual("deny", index.files[self.acl].rules.action(0))
+
+    def testCompressed(self):
+        import gzip
+        with gzip.open(self.index_file, "wt") as f:
+            f.write(ACL)
+        index = ACLIndex()
+        index.update([self.index_file])
+        self.assertEqual(ACL.splitlines(), index.files[os.path.abspath(self.index_file)].lines)
+
+    def testAnyOtherSide(self):
+        lines = ["access-list x extended permit ip any host 10.2.2.2", "access-list x extended permit ip 10.0.0.0 255.0.0.0 host 10.1.1.5"]
+        with open(self.acl, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        vectorize = ACLFileIndex.vectorize
+        ACLFileIndex.vectorize = False
+        try:
+            index = ACLIndex()
+            index.update([self.acl])
+            # the source "any" matches, whatever the destination is
+            for criteria in (("10.0.0.0/8", None, "10.1.1.5"), ("10.9.9.9", None, "10.1.1.5"), (None, None, "10.1.1.5")):
+                grepper = ACLGrepper(*criteria, match_any = True)
+                self.assertEqual([line for line in lines if grepper.grep(line)], index.query(grepper.query, [self.acl]), criteria)
+            self.assertEqual(lines, index.query(ACLQuery("10.0.0.0/8", None, "10.1.1.5", match_any = True), [self.acl]))
+        finally:
+            ACLFileIndex.vectorize = vectorize
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ import unittest
 
 # import aclgrep code from one directory above
 sys.path.append("..")
-from aclgrep import ACLGrepper
+from aclgrep import ACLGrepper, ACLQuery, ACLTracer, RegexACLParser
 
 class matching(unittest.TestCase):
 
@@ -139,6 +139,122 @@ class matching(unittest.TestCase):
         self.assertTrue(grepper.grep("permit tcp 10.221.216.200 0.0.0.1 range 5400 5413 host 10.221.69.143 gt 1023 established"))
         self.assertFalse(grepper.grep("permit tcp 10.221.216.200 0.0.0.1 gt 1023 host 10.221.69.143 eq 22"))
 
+    def testNamedQueryPorts(self):
+        grepper = ACLGrepper(None, None, None, "ssh")
+        self.assertTrue(grepper.grep("10 permit tcp 10.221.224.120/29 224.1.2.102/16 eq 22"))
+        self.assertFalse(grepper.grep("10 permit tcp 10.221.224.120/29 224.1.2.102/16 eq www"))
+
+    def testInvalidCriteria(self):
+        self.assertRaises(ValueError, ACLGrepper, "10.1.1.256")
+        self.assertRaises(ValueError, ACLGrepper, None, "foo")
+        self.assertRaises(ValueError, ACLGrepper, None, None, None, "65536")
+
+    def testRegexParser(self):
+        grepper = ACLGrepper("10.221.216.201", "5401", "10.221.69.143", "1024", parser = RegexACLParser())
+        self.assertTrue(grepper.grep("permit tcp 10.221.216.200 0.0.0.1 range 5400 5413 host 10.221.69.143 gt 1023 established"))
+        self.assertFalse(grepper.grep("permit tcp 10.221.216.200 0.0.0.1 gt 1023 host 10.221.69.143 eq 22"))
+
+    def testMatchIPv6(self):
+        grepper = ACLGrepper("2001:db8::1", None, "10.1.1.1")
+        self.assertTrue(grepper.grep("permit ip 2001:db8::/32 host 10.1.1.1"))
+        self.assertTrue(grepper.grep("permit ip host 2001:DB8:0::1 10.1.1.0/24"))
+        self.assertFalse(grepper.grep("permit ip 2001:db9::/32 host 10.1.1.1"))
+        self.assertFalse(grepper.grep("permit ip host 10.1.1.1 host 10.1.1.1"))
+
+        # the lower bits of an IPv6 address never match an IPv4 net and vice versa
+        self.assertFalse(ACLGrepper("::a01:101").grep("permit ip 10.1.1.0/24 any"))
+        self.assertFalse(ACLGrepper("::a01:101").grep("permit ip 0.0.0.0 0.0.0.0 any"))
+        self.assertFalse(ACLGrepper("10.1.1.1").grep("permit ip ::/0 any"))
+
+    def testMatchFamilyAny(self):
+        for match_any in (False, True):
+            v4 = ACLGrepper("10.1.1.1", None, None, None, None, match_any)
+            v6 = ACLGrepper("2001:db8::1", None, None, None, None, match_any)
+            self.assertEqual(match_any, v4.grep("permit ip any any"))
+            self.assertEqual(match_any, v6.grep("permit ip any any"))
+            self.assertEqual(match_any, v4.grep("permit ip any4 any4"))
+            self.assertFalse(v6.grep("permit ip any4 any4"))
+            self.assertFalse(v4.grep("permit ip any6 any6"))
+            self.assertEqual(match_any, v6.grep("permit ip any6 any6"))
+
+    def testMatchNet(self):
+        lines = ["permit ip 10.20.0.0 255.255.0.0 any", "permit ip 10.20.3.0 0.0.0.255 any", "permit ip 10.0.0.0/8 any",
+                 "permit ip 10.21.0.0/16 any", "permit ip any any", "permit ip 2001:db8::/32 any"]
+        grep = lambda *criteria, **options: [line for line in lines if ACLGrepper(*criteria, **options).grep(line)]
+        self.assertEqual(lines[:3], grep("10.20.0.0/16"))
+        self.assertEqual(lines[:3], grep("10.20.0.0/16", net_match = "intersects"))
+        self.assertEqual([lines[0], lines[2]], grep("10.20.0.0/16", net_match = "contains"))
+        self.assertEqual(lines[:2], grep("10.20.0.0/16", net_match = "within"))
+        self.assertEqual(lines[:3] + [lines[4]], grep("10.20.0.0/16", match_any = True))
+        # "any" covers both families
+        self.assertEqual(lines[:4], grep("0.0.0.0/0", match_any = True, net_match = "within"))
+        self.assertEqual([lines[5]], grep("2001:db8::/16"))
+        # ranges, the destination and other criteria
+        self.assertEqual([lines[0], lines[2], lines[3]], grep("10.20.255.255-10.21.0.1"))
+        self.assertEqual(["permit tcp any 10.1.1.0/24 eq 80"], [line for line in ["permit tcp any 10.1.1.0/24 eq 80", "permit tcp any 10.1.1.0/24 eq 22"] if ACLGrepper(None, None, "10.1.0.0/16", "80").grep(line)])
+        self.assertRaises(ValueError, ACLGrepper, "10.0.0.0/8", net_match = "overlaps")
+
+    def testMatchWildcard(self):
+        # every address ending in .5 in 10.1.0.0/16
+        line = "access-list 120 permit ip 10.1.0.5 0.0.255.0 any"
+        self.assertTrue(ACLGrepper("10.1.77.5").grep(line))
+        self.assertFalse(ACLGrepper("10.1.77.6").grep(line))
+        self.assertTrue(ACLGrepper("10.1.77.0/24").grep(line))
+        self.assertFalse(ACLGrepper("10.1.77.8/29").grep(line))
+        self.assertFalse(ACLGrepper("10.1.77.0/24", net_match = "contains").grep(line))
+        self.assertTrue(ACLGrepper("10.1.77.5", net_match = "contains").grep(line))
+        self.assertTrue(ACLGrepper("10.1.0.0/16", net_match = "within").grep(line))
+        self.assertFalse(ACLGrepper("10.1.0.0/17", net_match = "within").grep(line))
+
+    def testQueryIsImmutable(self):
+        query = ACLQuery("10.1.1.1", "80")
+        self.assertEqual(0x0a010101, query.source_ip)
+        self.assertEqual(80, query.source_port)
+        self.assertRaises(AttributeError, setattr, query, "source_port", 81)
+
+
+
+class firstMatch(unittest.TestCase):
+
+    LINES = [
+        "access-list outside line 1 remark web servers",
+        "access-list outside line 2 extended permit tcp any host 10.1.1.10 eq www (hitcnt=5) 0x1",
+        "access-list outside line 3 extended deny tcp any host 10.1.1.10 (hitcnt=1) 0x2",
+        "access-list outside line 4 extended permit ip any any (hitcnt=1) 0x3",
+        "ip access-list extended INSIDE",
+        " 10 deny tcp host 10.1.1.10 any eq 22",
+        " 20 permit ip 10.1.1.0 0.0.0.255 any",
+    ]
+
+    def trace(self, *packet):
+        tracer = ACLTracer(*packet)
+        tracer.new_file("test")
+        for number, line in enumerate(self.LINES):
+            tracer.trace(line, number + 1)
+        return dict((name, hit and hit[:2]) for source, name, hit in tracer.results())
+
+    def testFirstHit(self):
+        self.assertEqual({"outside": ("permit", 2), "INSIDE": ("permit", 7)}, self.trace("10.1.1.20", "1024", "10.1.1.10", "80", "tcp"))
+        self.assertEqual({"outside": ("deny", 3), "INSIDE": ("permit", 7)}, self.trace("10.1.1.20", "1024", "10.1.1.10", "22", "tcp"))
+        self.assertEqual({"outside": ("permit", 4), "INSIDE": ("deny", 6)}, self.trace("10.1.1.10", "1024", "10.1.1.11", "22", "tcp"))
+
+    def testImplicitDeny(self):
+        self.assertEqual({"outside": ("permit", 4), "INSIDE": None}, self.trace("10.2.2.2", None, "10.1.1.11", None, "udp"))
+
+    def testIPv6(self):
+        tracer = ACLTracer("2001:db8::1", None, "2001:db8:1::1", "22", "tcp")
+        tracer.new_file("test")
+        for number, line in enumerate(["ipv6 access-list V6", " permit tcp any4 any4 eq 22", " deny tcp any 2001:db8:1::/48", " permit ipv6 any any"]):
+            tracer.trace(line, number + 1)
+        self.assertEqual([("test", "V6", ("deny", 3, "deny tcp any 2001:db8:1::/48"))], tracer.results())
+
+    def testNoNets(self):
+        # a packet has single addresses
+        self.assertRaises(ValueError, ACLTracer, "10.1.1.0/24")
+
+    def testAnyIsChecked(self):
+        # any matches, but the other criteria are still checked
+        self.assertEqual({"outside": ("permit", 4), "INSIDE": ("permit", 7)}, self.trace("10.1.1.20", None, "10.1.1.11", "80", "tcp"))
 
 
 if __name__ == '__main__':
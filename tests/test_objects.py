@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+import aclgrep
+from aclgrep import ACLBatchGrepper, ACLGrepper, ACLIndex, ACLObjects, ACLParser, AddressSet, candidate_lines, input_files, line_prefilter, port_in_intervals
+
+
+CONFIG = """name 10.1.1.10 webserver
+name 2001:db8::10 webserver6
+object network WEB
+ host 10.1.1.10
+object network LAN
+ subnet 192.168.0.0 255.255.0.0
+object network POOL
+ range 10.9.0.10 10.9.0.20
+object-group network DMZ
+ network-object host 10.1.1.11
+ network-object 10.1.2.0 255.255.255.0
+ network-object object WEB
+ network-object host webserver6
+ group-object SERVERS
+object-group network SERVERS
+ network-object 10.1.3.0 255.255.255.128
+ network-object 10.1.3.128 255.255.255.128
+object-group service WEBPORTS tcp
+ port-object eq www
+ port-object eq https
+ port-object range 8000 8080
+object-group service MOREPORTS tcp
+ port-object eq 22
+ group-object WEBPORTS
+object service DNS
+ service udp destination eq domain
+object-group service MIXED
+ service-object tcp destination eq 25
+ service-object object DNS
+access-list outside extended permit tcp any object-group DMZ object-group MOREPORTS
+access-list outside extended permit object DNS object LAN any
+access-list outside extended permit object-group MIXED object-group SERVERS object POOL
+access-list outside extended permit tcp host webserver any eq ssh
+access-list outside extended permit ip webserver 255.255.255.255 object-group DMZ
+access-list outside extended deny ip any any
+"""
+
+LINES = CONFIG.splitlines()
+
+
+class objects(unittest.TestCase):
+
+    def setUp(self):
+        self.objects = ACLObjects()
+        self.objects.read(LINES)
+        self.parser = ACLParser()
+        self.parser.use_objects(self.objects)
+
+    def grep(self, *criteria):
+        grepper = ACLGrepper(*criteria, parser = self.parser)
+        return [n for n, line in enumerate(LINES) if line.startswith("access-list") and grepper.grep(line)]
+
+    def testFlattenNetworks(self):
+        dmz = self.objects.resolve("DMZ")
+        # nested groups are flattened, adjacent ranges merged
+        self.assertEqual([(0x0a01010a, 0x0a01010b), (0x0a010200, 0x0a0103ff)], dmz.ranges()[:2])
+        self.assertTrue(dmz.contains(0x0a0103f0))
+        self.assertFalse(dmz.contains(0x0a010400))
+        self.assertEqual(3, len(dmz.ranges()))
+        self.assertEqual(AddressSet([(0x0a09000a, 0x0a090014)]), self.objects.resolve("POOL"))
+        # flattened only once
+        self.assertTrue(dmz is self.objects.resolve("DMZ"))
+
+    def testCycle(self):
+        objects = ACLObjects()
+        objects.read(["object-group network A", " network-object host 10.1.1.1", " group-object B", "object-group network B", " group-object A", " group-object C"])
+        self.assertEqual([(0x0a010101, 0x0a010101)], objects.resolve("A").ranges())
+
+    def testFlattenServices(self):
+        self.assertEqual(((22, 22), (80, 80), (443, 443), (8000, 8080)), self.objects.resolve("MOREPORTS"))
+        self.assertEqual((17, None, ((53, 53),)), self.objects.resolve("DNS"))
+        self.assertEqual((0, None, ((25, 25), (53, 53))), self.objects.resolve("MIXED"))
+
+    def testParse(self):
+        self.parser.next_line(LINES[29])
+        self.assertEqual("object-group DMZ", self.parser.destination_net)
+        self.assertEqual("object-group MOREPORTS", self.parser.destination_port)
+        self.parser.next_line(LINES[32])
+        self.assertEqual("10.1.1.10/32", self.parser.source_net)
+        self.parser.next_line(LINES[33])
+        self.assertEqual("10.1.1.10 255.255.255.255", self.parser.source_net)
+
+        # without the definitions the references are ignored
+        parser = ACLParser()
+        parser.next_line(LINES[29])
+        self.assertEqual(None, parser.destination_net)
+        self.assertEqual(None, parser.destination_port)
+
+    def testMatch(self):
+        self.assertEqual([29, 33], self.grep(None, None, "10.1.3.5", "8080", "tcp"))
+        self.assertEqual([33], self.grep(None, None, "10.1.3.5", "8081", "tcp"))
+        self.assertEqual([29, 33], self.grep(None, None, "2001:db8::10"))
+        self.assertEqual([30], self.grep("192.168.1.1", None, None, "53", "udp"))
+        self.assertEqual([31], self.grep("10.1.3.200", None, "10.9.0.15", "25", "tcp"))
+        self.assertEqual([31], self.grep("10.1.3.200", None, "10.9.0.15", "53", "udp"))
+        self.assertEqual([], self.grep("10.1.3.200", None, "10.9.0.15", "80", "tcp"))
+        self.assertEqual([], self.grep("10.1.1.11", None, "10.9.0.15", "25", "tcp"))
+        self.assertEqual([32, 33], self.grep("10.1.1.10", None, None, "22"))
+
+    def testPortBisect(self):
+        intervals = tuple((p, p + 1) for p in range(0, 1000, 10))
+        for port in range(1005):
+            self.assertEqual(any(low <= port <= high for low, high in intervals), port_in_intervals(port, intervals))
+
+    def testBatchAndIndex(self):
+        flows = [(None, None, "10.1.3.5", "8080", "tcp"), ("10.1.3.200", None, "10.9.0.15", "53", "udp"), ("10.1.1.10", None, None, "22", None)]
+        batch = ACLBatchGrepper(flows, parser = self.parser)
+        matches = [[] for flow in flows]
+        for number, line in enumerate(LINES):
+            for n in batch.grep(line):
+                matches[n].append(number)
+
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            f.write(CONFIG)
+        try:
+            index = ACLIndex()
+            index.update([path])
+            for flow, numbers in zip(flows, matches):
+                grepper = ACLGrepper(*flow, parser = self.parser)
+                expected = [n for n, line in enumerate(LINES) if grepper.grep(line)]
+                self.assertEqual(expected, numbers)
+                self.assertEqual([LINES[n].strip() for n in expected], index.query(grepper.query, [path]))
+        finally:
+            os.remove(path)
+
+    def testPrefilter(self):
+        for criteria in (("10.1.1.10",), (None, None, "10.9.0.15", None, "udp"), ("10.1.1.10", None, None, None, "tcp")):
+            grepper = ACLGrepper(*criteria, parser = self.parser)
+            prefilter = line_prefilter(grepper.query, self.objects)
+            candidates = [line.decode().rstrip("\n") for line in candidate_lines(CONFIG.encode(), prefilter)]
+            for line in LINES:
+                if grepper.grep(line):
+                    self.assertTrue(line in candidates)
+
+    def testStdin(self):
+        stdin, head = sys.stdin, aclgrep.STDIN_HEAD_LINES
+        sys.stdin = io.StringIO(CONFIG + "object network LATE\n host 10.8.8.8\n")
+        aclgrep.STDIN_HEAD_LINES = CONFIG.count("\n")
+        try:
+            name, objects, lines = list(input_files(["-"]))[0]
+            # the definitions are taken from the head only, the lines are streamed
+            self.assertEqual(("<stdin>", ACLObjects.NETWORK, None), (name, objects.kind("WEB"), objects.kind("LATE")))
+            self.assertFalse(isinstance(lines, list))
+            self.assertEqual(CONFIG.count("\n") + 2, len(list(lines)))
+        finally:
+            sys.stdin, aclgrep.STDIN_HEAD_LINES = stdin, head
+
+if __name__ == '__main__':
+    unittest.main()
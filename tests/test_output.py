@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import csv
+import io
+import json
+import sys
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLParser, MatchWriter, MATCH_FIELDS, match_record
+
+
+LINES = [
+    "access-list outside extended permit tcp host 10.1.1.1 eq www 10.2.0.0 255.255.0.0 range 1000 2000",
+    "access-list outside extended deny ip any any",
+    "ip access-list extended INSIDE",
+    " 10 permit udp 10.1.1.0 0.0.0.255 any eq domain",
+]
+
+
+class output(unittest.TestCase):
+
+    def records(self):
+        parser = ACLParser()
+        records = []
+        for number, line in enumerate(LINES, 1):
+            parser.next_line(line)
+            records.append(match_record("fw.cfg", number, parser, line))
+        return records
+
+    def write(self, format, records, size = 1024):
+        stream = io.StringIO()
+        writer = MatchWriter(format, stream, size)
+        for record in records:
+            writer.record(record)
+        writer.flush()
+        return stream.getvalue()
+
+    def testRecord(self):
+        records = self.records()
+        self.assertEqual(("fw.cfg", 1, "outside", "permit", "tcp", "10.1.1.1/32", "eq 80", "10.2.0.0 255.255.0.0", "range 1000 2000", LINES[0]), records[0])
+        # "any" nets allow all ports
+        self.assertEqual(("any", None, "any", None), records[1][5:9])
+        self.assertEqual(("INSIDE", "permit", "udp"), records[3][2:5])
+        self.assertEqual(LINES[3].strip(), records[3][-1])
+
+    def testText(self):
+        self.assertEqual("\n".join(line.strip() for line in LINES) + "\n", self.write("text", self.records()))
+        self.assertEqual("", self.write("text", []))
+
+    def testJSONLines(self):
+        records = self.records()
+        lines = self.write("jsonl", records).splitlines()
+        self.assertEqual(len(records), len(lines))
+        for record, line in zip(records, lines):
+            self.assertEqual(dict(zip(MATCH_FIELDS, record)), json.loads(line))
+
+    def testCSV(self):
+        records = self.records()
+        rows = list(csv.reader(io.StringIO(self.write("csv", records))))
+        self.assertEqual(list(MATCH_FIELDS), rows[0])
+        self.assertEqual(["fw.cfg", "2", "outside", "deny", "ip", "any", "", "any", "", LINES[1]], rows[2])
+        self.assertEqual(len(records) + 1, len(rows))
+
+    def testBuffered(self):
+        stream = io.StringIO()
+        writer = MatchWriter("text", stream, 3)
+        writer.line("a")
+        writer.line("b")
+        self.assertEqual("", stream.getvalue())
+        writer.line("c")
+        self.assertEqual("a\nb\nc\n", stream.getvalue())
+        writer.line("d")
+        writer.flush()
+        self.assertEqual("a\nb\nc\nd\n", stream.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
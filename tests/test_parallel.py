@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLGrepper, file_chunks, line_prefilter, match_record, parallel_grep, read_candidates, read_objects, split_file
+
+
+class parallel(unittest.TestCase):
+
+    def setUp(self):
+        self.files = []
+        for number in range(3):
+            handle, path = tempfile.mkstemp(suffix=".acl")
+            with os.fdopen(handle, "w") as f:
+                for line in range(200):
+                    f.write("access-list acl%d line %d extended permit tcp 10.%d.%d.0 255.255.255.0 any eq %d\n" % (number, line, number, line, 1000 + line % 7))
+            self.files.append(path)
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    def testSplitFile(self):
+        chunks = list(split_file(self.files[0], 1000))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(0, chunks[0][1])
+        self.assertEqual(os.path.getsize(self.files[0]), chunks[-1][2])
+
+        with open(self.files[0], "rb") as f:
+            data = f.read()
+        for path, start, end, acl_name in chunks:
+            self.assertEqual(b"\n", data[end - 1:end])
+
+    def testFileChunks(self):
+        # the definitions of a file are read once for all of its chunks
+        chunks = list(file_chunks(self.files[:2], 1000))
+        self.assertEqual(list(split_file(self.files[0], 1000)) + list(split_file(self.files[1], 1000)), [chunk for chunk, objects in chunks])
+        self.assertEqual(2, len(set(id(objects) for chunk, objects in chunks)))
+
+    def testSameAsSerial(self):
+        criteria = (None, None, None, "1003", "tcp", False)
+        grepper = ACLGrepper(*criteria)
+        expected = []
+        for path in self.files:
+            with open(path) as f:
+                expected.extend(line.strip() for line in f if grepper.grep(line))
+
+        self.assertEqual(expected, list(parallel_grep(self.files, criteria, 2, chunk_size = 1000)))
+
+    def testRecords(self):
+        criteria = (None, None, None, "1003", "tcp", False)
+        grepper = ACLGrepper(*criteria)
+        expected = []
+        # the same file twice starts counting again
+        for path in self.files + self.files[:1]:
+            with open(path) as f:
+                for number, line in enumerate(f, 1):
+                    if grepper.grep(line):
+                        expected.append(match_record(path, number, grepper.parser, line))
+
+        self.assertEqual(expected, list(parallel_grep(self.files + self.files[:1], criteria, 2, chunk_size = 1000, records = True)))
+
+    def testNamedACLs(self):
+        # the name of the ACL is only in the header, chunks start in the middle of the ACLs
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            for name in ("FIRST", "SECOND"):
+                f.write("ip access-list extended %s\n" % name)
+                for line in range(300):
+                    f.write(" %d permit tcp 10.%d.0.0 0.0.255.255 any eq %d\n" % (line * 10, line, 1000 + line % 7))
+        self.files.append(path)
+
+        criteria = (None, None, None, "1003", "tcp", False)
+        grepper = ACLGrepper(*criteria)
+        objects = read_objects(path)
+        grepper.parser.use_objects(objects)
+        expected = [match_record(path, number, grepper.parser, line) for number, line in read_candidates(path, line_prefilter(grepper.query, objects, True), True) if grepper.grep(line)]
+        self.assertEqual(set(["FIRST", "SECOND"]), set(record[2] for record in expected))
+
+        names = [chunk[3] for chunk in split_file(path, 4000)]
+        self.assertEqual((None, ["FIRST", "SECOND"]), (names[0], sorted(set(names[1:]))))
+        self.assertEqual(expected, list(parallel_grep([path], criteria, 2, chunk_size = 4000, records = True)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ import unittest
 
 # import aclgrep code from one directory above
 sys.path.append("..")
-from aclgrep import ACLGrepper
+from aclgrep import ACLGrepper, ACLParser, ANY, ANY6, NEVER, IPV6_BIT, port_string_to_intervals, net_string_to_prefix, net_string_to_range, prefix_length
 
 class patterns(unittest.TestCase):
 
@@ -41,6 +41,29 @@ class patterns(unittest.TestCase):
         # no bits -> host
         self.assertEqual((0x0a010101, 0xffffffff), self.ag.ip_and_mask_to_pair("10.1.1.1/0.0.0.0"))
 
+    def testNonContiguousWildcard(self):
+        # IOS wildcards may have gaps, the bits set in them may have any value
+        self.assertEqual((0x0a010005, 0xffff00ff), self.ag.ip_and_mask_to_pair("10.1.7.5 0.0.255.0"))
+        self.assertTrue(self.ag.ip_in_net(0x0a01c805, self.ag.ip_and_mask_to_pair("10.1.7.5 0.0.255.0")))
+        self.assertFalse(self.ag.ip_in_net(0x0a01c806, self.ag.ip_and_mask_to_pair("10.1.7.5 0.0.255.0")))
+        # the longest prefix containing the net
+        self.assertEqual(97 + 16, prefix_length(*net_string_to_prefix("10.1.7.5 0.0.255.0")))
+        self.assertEqual(97 + 24, prefix_length(*net_string_to_prefix("10.1.7.0/24")))
+
+    def testQueryNets(self):
+        self.assertEqual((0x0a010101, 0x0a010101, ((0x0a010101, IPV6_BIT | 0xffffffff),)), net_string_to_range("10.1.1.1"))
+        self.assertEqual((0x0a140000, 0x0a14ffff, ((0x0a140000, IPV6_BIT | 0xffff0000),)), net_string_to_range("10.20.0.0/16"))
+        self.assertEqual(net_string_to_range("10.20.0.0/16"), net_string_to_range("10.20.0.0 0.0.255.255"))
+        # a range is split into the fewest prefixes
+        low, high, pairs = net_string_to_range("10.0.0.5-10.0.0.20")
+        self.assertEqual((0x0a000005, 0x0a000014), (low, high))
+        self.assertEqual([(5, 32), (6, 31), (8, 29), (16, 30), (20, 32)], [(net & 0xff, bin(mask).count("1") - 1) for net, mask in pairs])
+        self.assertEqual(IPV6_BIT | 0x20010db8 << 96, net_string_to_range("2001:db8::/32")[0])
+
+        self.assertRaises(ValueError, net_string_to_range, "10.0.0.0 0.0.255.0")
+        self.assertRaises(ValueError, net_string_to_range, "10.0.0.9-10.0.0.1")
+        self.assertRaises(ValueError, net_string_to_range, "10.0.0.1-2001:db8::1")
+
     def testIpCidrPair(self):
         # check values
         self.assertEqual((0x0a000000, 0xff000000), self.ag.ip_and_cidr_to_pair("10.0.0.0/8"))
@@ -50,5 +73,47 @@ class patterns(unittest.TestCase):
         self.assertTrue(self.ag.ip_in_net(0x0a010101, (0x0a000000, 0xff000000)))
         self.assertFalse(self.ag.ip_in_net(0x0a010101, (0x0a000000, 0xffffff00)))
 
+    def testPrefix(self):
+        self.assertEqual((0x0a010100, IPV6_BIT | 0xffffff00), net_string_to_prefix("10.1.1.1 0.0.0.255"))
+        self.assertEqual((IPV6_BIT | 0x20010db8 << 96, IPV6_BIT | 0xffffffff << 96), net_string_to_prefix("2001:db8::1/32"))
+        self.assertEqual((IPV6_BIT | 1, IPV6_BIT | (1 << 128) - 1), net_string_to_prefix("::1/128"))
+        self.assertEqual((IPV6_BIT, IPV6_BIT), net_string_to_prefix("::/0"))
+        self.assertEqual(IPV6_BIT | 0x20010db8 << 96 | 1, self.ag.ip_to_bits("2001:db8::1"))
+        self.assertRaises(ValueError, net_string_to_prefix, "2001:db8::/129")
+        self.assertRaises(ValueError, self.ag.ip_to_bits, "2001:db8::g")
+
+    def testPortIntervals(self):
+        self.assertEqual(((22, 22),), port_string_to_intervals("eq 22"))
+        self.assertEqual(((80, 80), (443, 443)), port_string_to_intervals("eq 80 443"))
+        self.assertEqual(((0, 1034), (1036, 65535)), port_string_to_intervals("neq 1035"))
+        self.assertEqual(((1024, 65535),), port_string_to_intervals("gt 1023"))
+        self.assertEqual(((0, 1023),), port_string_to_intervals("lt 1024"))
+        self.assertEqual(((161, 162),), port_string_to_intervals("range 161 162"))
+        # empty intervals are dropped, unknown names never match
+        self.assertEqual((), port_string_to_intervals("range 4711 1045"))
+        self.assertEqual((), port_string_to_intervals("eq foo"))
+
+    def testParseRule(self):
+        parser = ACLParser()
+        rule = parser.parse_rule("access-list acl761 line 3 extended permit tcp any host 10.114.6.135 eq ssh")
+        self.assertEqual(6, rule.protocol)
+        self.assertEqual(ANY, rule.source_net)
+        self.assertEqual(None, rule.source_ports)
+        self.assertEqual((0x0a720687, IPV6_BIT | 0xffffffff), rule.destination_net)
+        self.assertEqual(((22, 22),), rule.destination_ports)
+
+        # nets are stored masked
+        rule = parser.parse_rule("permit udp 10.111.88.66 0.0.0.1 eq 4711 10.111.34.0/14 eq 4711")
+        self.assertEqual((0x0a6f5842, IPV6_BIT | 0xfffffffe), rule.source_net)
+        self.assertEqual((0x0a6c0000, IPV6_BIT | 0xfffc0000), rule.destination_net)
+
+        rule = parser.parse_rule("permit tcp any6 host 2001:db8::1 eq 22")
+        self.assertEqual(ANY6, rule.source_net)
+        self.assertEqual((IPV6_BIT | 0x20010db8 << 96 | 1, IPV6_BIT | (1 << 128) - 1), rule.destination_net)
+
+        # invalid nets never match
+        rule = parser.parse_rule("permit ip 10.1.1.300/32 any")
+        self.assertEqual(NEVER, rule.source_net)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import bz2
+import gzip
+import lzma
+import os
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLGrepper, candidate_lines, compression, decompressed_blocks, line_prefilter, read_candidates, read_lines, read_objects
+
+
+LINES = [
+    "access-list outside line 1 remark web servers",
+    "object-group network DMZ",
+    "access-list outside line 2 extended permit tcp any host 10.1.1.10 eq www (hitcnt=5) 0x1",
+    "access-list outside line 3 extended deny udp any any (hitcnt=1) 0x2",
+    "access-list outside line 4 extended permit ip 10.1.1.0 255.255.255.0 any (hitcnt=1) 0x3",
+    "ip access-list extended INSIDE",
+    " 10 deny icmp host 10.1.1.10 any",
+    "just some random text",
+]
+
+
+class reader(unittest.TestCase):
+
+    def candidates(self, *criteria):
+        prefilter = line_prefilter(ACLGrepper(*criteria).query)
+        data = "\n".join(LINES).encode()
+        return [line.decode().rstrip("\n") for line in candidate_lines(data, prefilter)]
+
+    def testNoPrefilter(self):
+        self.assertEqual(None, line_prefilter(ACLGrepper(None, "80").query))
+        self.assertEqual(LINES, self.candidates(None, "80"))
+
+    def testAddressPrefilter(self):
+        self.assertEqual([LINES[2], LINES[4], LINES[6]], self.candidates("10.1.1.10"))
+        self.assertEqual([LINES[2], LINES[3], LINES[4], LINES[6]], self.candidates("10.1.1.10", None, None, None, None, True))
+
+    def testProtocolPrefilter(self):
+        self.assertEqual([LINES[3], LINES[4], LINES[5]], self.candidates(None, None, None, None, "udp"))
+        self.assertEqual([LINES[4]], self.candidates("10.1.1.10", None, None, None, "udp"))
+
+    def testIPv6Prefilter(self):
+        lines = ["permit ip 2001:db8::/32 any", "permit ip 10.1.1.0/24 any", "permit ip any6 any", "permit ip 10.1.1.0/24 10.2.2.0/24"]
+        prefilter = line_prefilter(ACLGrepper("2001:db8::1").query)
+        self.assertEqual([lines[0]], [line.decode().rstrip("\n") for line in candidate_lines("\n".join(lines).encode(), prefilter)])
+        prefilter = line_prefilter(ACLGrepper("2001:db8::1", None, None, None, None, True).query)
+        self.assertEqual([lines[0], lines[1], lines[2]], [line.decode().rstrip("\n") for line in candidate_lines("\n".join(lines).encode(), prefilter)])
+
+    def testNoMatchIsSkipped(self):
+        for criteria in (("10.1.1.10",), ("10.1.1.10", None, None, None, "icmp", True), (None, None, None, None, "tcp")):
+            grepper = ACLGrepper(*criteria)
+            candidates = self.candidates(*criteria)
+            for line in LINES:
+                if grepper.grep(line):
+                    self.assertTrue(line in candidates)
+
+    def testHeaderPrefilter(self):
+        prefilter = line_prefilter(ACLGrepper("10.1.1.10").query, None, True)
+        data = "\n".join(LINES).encode()
+        self.assertEqual([LINES[2], LINES[4], LINES[5], LINES[6]], [line.decode().rstrip("\n") for line in candidate_lines(data, prefilter)])
+
+    def testNumbered(self):
+        data = "\n".join(LINES).encode()
+        prefilter = line_prefilter(ACLGrepper("10.1.1.10").query)
+        self.assertEqual([3, 5, 7], [number for number, line in candidate_lines(data, prefilter, 1)])
+        self.assertEqual([13, 15, 17], [number for number, line in candidate_lines(data, prefilter, 11)])
+        self.assertEqual(list(range(1, len(LINES) + 1)), [number for number, line in candidate_lines(data, None, 1)])
+
+        for module in (None, gzip):
+            handle, path = tempfile.mkstemp(suffix=".acl")
+            with os.fdopen(handle, "wb") as f:
+                f.write(module.compress(data) if module else data)
+            try:
+                self.assertEqual([(3, LINES[2]), (5, LINES[4]), (7, LINES[6])], [(number, line.rstrip("\n")) for number, line in read_candidates(path, prefilter, True)])
+            finally:
+                os.remove(path)
+
+    def testReadCandidates(self):
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "wb") as f:
+            f.write("\r\n".join(LINES).encode())
+        try:
+            prefilter = line_prefilter(ACLGrepper("10.1.1.10").query)
+            self.assertEqual([LINES[2], LINES[4], LINES[6]], [line.rstrip("\r\n") for line in read_candidates(path, prefilter)])
+            self.assertEqual(len(LINES), len(list(read_candidates(path, None))))
+        finally:
+            os.remove(path)
+
+        # empty files cannot be mapped
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        os.close(handle)
+        try:
+            self.assertEqual([], list(read_candidates(path, None)))
+        finally:
+            os.remove(path)
+
+    def testCompressed(self):
+        data = "\n".join(LINES).encode()
+        prefilter = line_prefilter(ACLGrepper("10.1.1.10").query)
+        for module in (gzip, bz2, lzma):
+            handle, path = tempfile.mkstemp(suffix=".acl")
+            with os.fdopen(handle, "wb") as f:
+                f.write(module.compress(data))
+            try:
+                self.assertEqual(module.__name__, compression(path))
+                self.assertEqual([LINES[2], LINES[4], LINES[6]], [line.rstrip("\n") for line in read_candidates(path, prefilter)])
+                self.assertEqual(LINES, [line.rstrip("\n") for line in read_lines(path)])
+                self.assertEqual(["DMZ"], list(read_objects(path).definitions))
+
+                # blocks end at line boundaries, even if they are much smaller than a line
+                blocks = list(decompressed_blocks(path, module.__name__, 7))
+                self.assertEqual(data, b"".join(blocks))
+                self.assertTrue(all(block.endswith(b"\n") for block in blocks[:-1]))
+
+                # stopping early does not leave the thread hanging
+                for block in decompressed_blocks(path, module.__name__, 1):
+                    break
+            finally:
+                os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLServer
+
+
+ACL = """access-list outside extended permit tcp any host 10.1.1.10 eq www
+access-list outside extended permit udp 10.2.0.0 255.255.0.0 any eq domain
+access-list outside extended deny ip any any
+"""
+
+
+class server(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.acl = os.path.join(self.directory, "outside.acl")
+        with open(self.acl, "w") as f:
+            f.write(ACL)
+        self.server = ACLServer([self.acl])
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def testAnswer(self):
+        hits = self.server.answer({"dip": "10.1.1.10", "dport": "80"})["hits"]
+        self.assertEqual([(self.acl, 1, ACL.splitlines()[0])], [(h["file"], h["line_number"], h["line"]) for h in hits])
+        self.assertEqual(3, len(self.server.answer({"sip": "10.2.3.4", "any": True})["hits"]))
+        self.assertTrue("error" in self.server.answer({"sip": "10.2.3.400"}))
+
+        hits = self.server.answer({"query": "proto udp or dport 80", "dip": "10.1.1.10", "any": True})["hits"]
+        self.assertEqual([1, 2, 3], [h["line_number"] for h in hits])
+        hits = self.server.answer({"query": "not proto udp and dip 10.1.1.10"})["hits"]
+        self.assertEqual([1], [h["line_number"] for h in hits])
+        self.assertTrue("error" in self.server.answer({"query": "dport 80 or"}))
+
+    def testRemoved(self):
+        # a removed file keeps its old rules and is reported once until it is back
+        os.remove(self.acl)
+        errors = io.StringIO()
+        with redirect_stderr(errors):
+            for _ in range(3):
+                asyncio.run(self.server.reload_changed())
+        self.assertEqual(1, len(errors.getvalue().splitlines()))
+        self.assertEqual(3, len(self.server.answer({"sip": "10.2.3.4", "any": True})["hits"]))
+
+        with open(self.acl, "w") as f:
+            f.write(ACL)
+        os.utime(self.acl, (0, 0))
+        with redirect_stderr(errors):
+            asyncio.run(self.server.reload_changed())
+            os.remove(self.acl)
+            asyncio.run(self.server.reload_changed())
+        self.assertEqual(2, len(errors.getvalue().splitlines()))
+
+    def testUnixSocket(self):
+        async def run():
+            path = os.path.join(self.directory, "aclgrep.sock")
+            server = await self.server.start(path)
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+
+                async def ask(request):
+                    writer.write(request + b"\n")
+                    return json.loads(await reader.readline())
+
+                self.assertEqual(1, len((await ask(b'{"sip": "10.2.3.4", "proto": "udp"}'))["hits"]))
+                self.assertEqual({"error": "invalid JSON"}, await ask(b"sip=10.2.3.4"))
+
+                # the changed file replaces the old rules
+                with open(self.acl, "w") as f:
+                    f.write("access-list outside extended permit udp host 10.2.3.4 any\n" + ACL)
+                os.utime(self.acl, (0, 0))
+                await self.server.reload_changed()
+                self.assertEqual([1, 3], [h["line_number"] for h in (await ask(b'{"sip": "10.2.3.4", "proto": "udp"}'))["hits"]])
+
+                # the server closes the connection when the client is done
+                writer.write_eof()
+                self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+                writer.close()
+                await writer.wait_closed()
+            finally:
+                server.close()
+                await server.wait_closed()
+        asyncio.run(run())
+
+    def testHTTP(self):
+        async def run():
+            server = await self.server.start("127.0.0.1:0")
+            port = server.sockets[0].getsockname()[1]
+            try:
+                async def get(request):
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    writer.write(request)
+                    status = await reader.readline()
+                    response = await reader.read()
+                    writer.close()
+                    await writer.wait_closed()
+                    return status.split()[1], json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+                status, response = await get(b"GET /?dip=10.1.1.10&dport=www HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                self.assertEqual((b"200", 1), (status, len(response["hits"])))
+                body = b'{"sip": "10.2.3.4", "any": true}'
+                status, response = await get(b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                self.assertEqual((b"200", 3), (status, len(response["hits"])))
+                status, response = await get(b"GET /?sip=nonsense HTTP/1.1\r\n\r\n")
+                self.assertEqual(b"400", status)
+
+                # a body shorter than its Content-Length is answered and the connection closed
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(b'POST / HTTP/1.1\r\nContent-Length: 50\r\n\r\n{"sip":')
+                writer.write_eof()
+                status = await asyncio.wait_for(reader.readline(), 5)
+                self.assertEqual(b"400", status.split()[1])
+                self.assertTrue(b"invalid request" in await asyncio.wait_for(reader.read(), 5))
+                writer.close()
+                await writer.wait_closed()
+            finally:
+                server.close()
+                await server.wait_closed()
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLParser, ACLObjects, ACLQuery, ACLIndex, PortNames, PORT_NAMES, read_services
+
+
+SERVICES = """# Network services, Internet style
+ssh		22/tcp				# SSH Remote Login Protocol
+exec		512/tcp
+biff		512/udp		comsat
+shell		514/tcp		cmd syslog	# no passwords used
+syslog		514/udp
+game		7000/tcp
+game		7001/udp
+sctp-only	9000/sctp
+kerberos	88/tcp		kerberos5 krb5
+"""
+
+
+class services(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.builtin = ACLParser.services
+
+    def tearDown(self):
+        ACLParser.services = self.builtin
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def testRead(self):
+        tcp, udp = read_services(SERVICES.splitlines())
+        self.assertEqual(("514", "514", "7000"), (tcp["cmd"], tcp["syslog"], tcp["game"]))
+        self.assertEqual(("512", "7001"), (udp["comsat"], udp["game"]))
+        self.assertFalse("exec" in udp or "sctp-only" in tcp or "sctp-only" in udp)
+
+    def testBuiltin(self):
+        names = PortNames.builtin()
+        for name, port in PORT_NAMES.items():
+            self.assertEqual(port, names.get(name), name)
+        # names of the other protocol are still understood
+        self.assertEqual(("512", "512"), (names.get("exec", "udp"), names.get("biff", "tcp")))
+        self.assertEqual(None, names.get("unknown", "tcp"))
+
+    def testProtocols(self):
+        ACLParser.services = PortNames.builtin(*read_services(SERVICES.splitlines()))
+        parser = ACLParser()
+        parser.next_line("access-list a extended permit tcp any host 10.1.1.1 eq game")
+        self.assertEqual("eq 7000", parser.destination_port)
+        parser.next_line("access-list a extended permit udp any host 10.1.1.1 range game 7010")
+        self.assertEqual("range 7001 7010", parser.destination_port)
+        # rules of all protocols take the tcp names first
+        parser.next_line("access-list a extended permit ip any host 10.1.1.1 eq game")
+        self.assertEqual("eq 7000", parser.destination_port)
+
+        parser.use_dialect("asa")
+        parser.next_line("access-list a extended permit udp any host 10.1.1.1 eq game log")
+        self.assertEqual("eq 7001", parser.destination_port)
+
+        self.assertEqual(7001, ACLQuery(dport = "game", protocol = "udp").destination_port)
+        self.assertEqual(7000, ACLQuery(dport = "game").destination_port)
+
+    def testObjects(self):
+        ACLParser.services = PortNames.builtin(*read_services(SERVICES.splitlines()))
+        objects = ACLObjects()
+        objects.read(["object-group service GAMES udp", " port-object eq game",
+                      "object service GAME", " service tcp destination eq game"])
+        self.assertEqual(((7001, 7001),), objects.resolve("GAMES"))
+        self.assertEqual((6, None, ((7000, 7000),)), objects.resolve("GAME"))
+
+    def testLoad(self):
+        path = self.write("services", SERVICES)
+        names = PortNames.load(path)
+        # the names of the file are added to the built-in ones and replace them
+        self.assertEqual(("88", "7001", "80"), (names.get("kerberos"), names.get("game", "udp"), names.get("www")))
+        # nothing is written next to the file
+        self.assertEqual(["services"], os.listdir(self.directory))
+
+        self.write("services", SERVICES + "extra 7100/tcp\n")
+        self.assertEqual("7100", PortNames.load(path).get("extra"))
+
+    def testIndex(self):
+        path = self.write("fw.acl", "access-list a extended permit udp any host 10.1.1.1 eq game\n")
+        index_path = os.path.join(self.directory, "index")
+        index = ACLIndex(index_path)
+        index.update([path])
+        index.save()
+        self.assertEqual([], index.query(ACLQuery(dport = "7001"), [path]))
+
+        # an index built with other port names is built again
+        ACLParser.services = PortNames.builtin(*read_services(SERVICES.splitlines()))
+        index = ACLIndex(index_path)
+        self.assertEqual({}, index.files)
+        index.update([path])
+        self.assertEqual(["access-list a extended permit udp any host 10.1.1.1 eq game"], index.query(ACLQuery(dport = "7001"), [path]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import sys
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLObjects, ACLShadowAnalyzer
+
+
+CONFIG = """object-group network SERVERS
+ network-object host 10.1.3.5
+ network-object 10.1.4.0 255.255.255.0
+access-list outside extended permit tcp any host 10.1.1.1 eq 80
+access-list outside extended permit tcp 10.0.0.0 255.0.0.0 host 10.1.1.1 eq www
+access-list outside extended deny tcp host 10.2.2.2 10.1.1.0 255.255.255.0 range 80 90
+access-list outside extended permit tcp any object-group SERVERS eq 80
+access-list outside extended permit tcp any host 10.1.3.5 eq 80
+access-list outside extended permit tcp any 10.1.4.0 255.255.255.128 range 80 80
+access-list outside extended permit tcp any 10.1.3.0 255.255.255.0 eq 80
+access-list outside extended permit ip any6 any
+access-list outside extended permit tcp 2001:db8::/32 any eq 22
+access-list outside extended permit tcp 10.0.0.0/8 any eq 22
+access-list outside extended deny ip any any
+access-list outside extended permit udp any any eq 53
+access-list icmp extended permit icmp any any echo
+access-list icmp extended permit icmp any any echo-reply
+access-list icmp extended permit icmp any any
+access-list icmp extended deny icmp host 1.1.1.1 any echo
+access-list flags extended permit tcp any any established
+access-list flags extended permit tcp any any eq 22 time-range WORKHOURS
+access-list flags extended permit tcp host 1.1.1.1 any eq 22
+access-list flags extended permit tcp any any range 20 25 log
+access-list flags extended permit tcp host 1.1.1.1 any eq 22
+access-list inside extended permit udp any any eq 53
+"""
+
+
+class shadowed(unittest.TestCase):
+
+    def analyze(self, config):
+        analyzer = ACLShadowAnalyzer()
+        analyzer.new_file("fw.cfg")
+        objects = ACLObjects()
+        lines = config.splitlines()
+        objects.read(lines)
+        analyzer.parser.use_objects(objects)
+        for number, line in enumerate(lines, 1):
+            analyzer.check(line, number)
+        return [(name, kind, rule[0], cover[0]) for source, name, kind, rule, cover in analyzer.results()]
+
+    def testCovered(self):
+        self.assertEqual([
+            ("outside", "redundant", 5, 4),
+            ("outside", "redundant", 8, 7),
+            ("outside", "redundant", 9, 7),
+            ("outside", "redundant", 12, 11),
+            ("outside", "shadowed", 15, 14),
+            ("icmp", "shadowed", 19, 18),
+            ("flags", "redundant", 24, 22),
+        ], self.analyze(CONFIG))
+
+    def testFirstCover(self):
+        config = """access-list a extended permit tcp 10.0.0.0 255.0.0.0 any
+access-list a extended deny tcp 10.1.0.0 255.255.0.0 any
+access-list a extended deny tcp host 10.1.1.1 any eq 22
+"""
+        # the earliest covering rule counts, the second rule is covered itself
+        self.assertEqual([("a", "shadowed", 2, 1), ("a", "shadowed", 3, 1)], self.analyze(config))
+
+    def testStandard(self):
+        config = """access-list 10 permit 10.0.0.0 0.255.255.255
+access-list 10 deny 10.1.0.0 0.0.255.255
+access-list 10 permit 192.168.0.0 0.0.255.255
+"""
+        self.assertEqual([("10", "shadowed", 2, 1)], self.analyze(config))
+
+    def testFiles(self):
+        analyzer = ACLShadowAnalyzer()
+        for source in ("fw1.cfg", "fw2.cfg"):
+            analyzer.new_file(source)
+            analyzer.check("access-list outside extended permit ip any any", 1)
+        self.assertEqual([], analyzer.results())
+
+if __name__ == '__main__':
+    unittest.main()
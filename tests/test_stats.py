@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLGrepper, ACLParser, ACLStats, ACLTracer, RegexACLParser, read_candidates
+
+
+LINES = [
+    "access-list outside line 1 remark web servers",
+    "access-list outside line 2 extended permit tcp any host 10.1.1.10 eq www (hitcnt=5) 0x1",
+    "access-list outside line 3 extended permit tcp host 10.1.1.10 10.1.1.300 255.255.255.0",
+    "access-list outside line 4 extended permit ip 10.1.1.0 255.255.255.0 any (hitcnt=1) 0x3",
+]
+
+
+class stats(unittest.TestCase):
+
+    def testCounters(self):
+        stats = ACLStats()
+        grepper = ACLGrepper(None, None, "10.1.1.10")
+        stats.instrument_grepper(grepper)
+        matched = [line for line in LINES if grepper.grep(line)]
+
+        report = stats.report()
+        self.assertEqual(1, len(matched))
+        self.assertEqual({"lines read": 4, "lines checked": 4, "lines matched": 1, "lines prefiltered out": 0, "invalid nets": 1}, report["counters"])
+        self.assertEqual(4, report["stages"]["grep"]["calls"])
+        self.assertEqual(8, report["stages"]["net_value"]["calls"])
+        self.assertEqual(4, report["stages"]["tokenize"]["calls"])
+        self.assertFalse("match_patterns" in report["stages"])
+
+        out = io.StringIO()
+        stats.dump(out)
+        self.assertEqual(report["counters"], json.loads(out.getvalue())["counters"])
+
+    def testRegexParserStages(self):
+        stats = ACLStats()
+        grepper = ACLGrepper("10.1.1.10", parser = RegexACLParser())
+        stats.instrument_grepper(grepper)
+        for line in LINES:
+            grepper.grep(line)
+        self.assertEqual(4, stats.report()["stages"]["replace_port_names"]["calls"])
+        self.assertEqual(12, stats.report()["stages"]["match_patterns"]["calls"])
+
+    def testTracer(self):
+        stats = ACLStats()
+        tracer = ACLTracer("10.1.1.20", None, "10.1.1.10", "80", "tcp")
+        stats.instrument_grepper(tracer)
+        for number, line in enumerate(LINES):
+            tracer.trace(line, number)
+        self.assertEqual(1, stats.report()["counters"]["lines matched"])
+
+    def testPrefiltered(self):
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            f.write("\n".join(LINES))
+        try:
+            stats = ACLStats()
+            # the lines are counted while they are read
+            candidates = list(read_candidates(path, re.compile(b"10\\.1\\.1\\.10"), False, stats.lines_read))
+            self.assertEqual(len(LINES), stats.report()["counters"]["lines read"])
+            stats.count("lines checked", len(candidates))
+            self.assertEqual(2, stats.report()["counters"]["lines prefiltered out"])
+        finally:
+            os.remove(path)
+
+    def testClassesUntouched(self):
+        ACLStats().instrument_grepper(ACLGrepper("10.1.1.10", parser = ACLParser()))
+        self.assertFalse("tokenize" in vars(ACLParser()))
+        self.assertFalse("grep" in vars(ACLGrepper("10.1.1.10")))
+
+if __name__ == '__main__':
+    unittest.main()
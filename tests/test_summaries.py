@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import json
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLParser, RegexACLParser, ACLQuery, ACLFileSummary, ACLSummaries, cap_intervals, walk_files
+
+
+RULES = """access-list outside extended permit tcp any host 10.1.1.1 eq www
+access-list outside extended permit udp host 192.168.5.5 10.2.0.0 255.255.0.0 range 5000 5100
+access-list outside extended deny icmp 172.16.0.0 255.240.0.0 host 2001:db8::1
+"""
+
+
+class summaries(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def summary(self, text):
+        parser = ACLParser()
+        summary = ACLFileSummary()
+        for line in text.splitlines():
+            summary.add(parser.parse_rule(line))
+        summary.finish()
+        return summary
+
+    def testCapIntervals(self):
+        self.assertEqual(((1, 2), (5, 9)), cap_intervals([(5, 6), (1, 2), (7, 9)], 4))
+        # the smallest gap is closed first
+        self.assertEqual(((1, 6), (20, 30)), cap_intervals([(1, 2), (5, 6), (20, 30)], 2))
+        self.assertEqual(((1, 30),), cap_intervals([(1, 2), (5, 6), (20, 30)], 1))
+
+    def testMayMatch(self):
+        summary = self.summary(RULES)
+        self.assertTrue(summary.may_match(ACLQuery(dip = "10.1.1.1")))
+        self.assertTrue(summary.may_match(ACLQuery(dip = "10.2.3.4", dport = "5050", protocol = "udp")))
+        self.assertTrue(summary.may_match(ACLQuery(sip = "172.20.0.1")))
+        self.assertTrue(summary.may_match(ACLQuery(dip = "2001:db8::1")))
+        self.assertTrue(summary.may_match(ACLQuery(dip = "10.0.0.0/8")))
+        self.assertFalse(summary.may_match(ACLQuery(dip = "10.3.0.1")))
+        self.assertFalse(summary.may_match(ACLQuery(sip = "10.1.1.1")))
+        self.assertFalse(summary.may_match(ACLQuery(dip = "2001:db8::2")))
+        # the icmp rule has no ports
+        self.assertTrue(summary.may_match(ACLQuery(dport = "443")))
+        self.assertFalse(summary.may_match(ACLQuery(protocol = "esp")))
+
+    def testMatchAny(self):
+        summary = self.summary(RULES)
+        # only the rule with "any" has the address as source
+        self.assertFalse(summary.may_match(ACLQuery(sip = "10.9.9.9")))
+        self.assertTrue(summary.may_match(ACLQuery(sip = "10.9.9.9", match_any = True)))
+        # any4 does not cover IPv6 addresses
+        summary = self.summary("access-list a extended permit ip any4 host 10.1.1.1\n")
+        self.assertTrue(summary.may_match(ACLQuery(sip = "10.9.9.9", match_any = True)))
+        self.assertFalse(summary.may_match(ACLQuery(sip = "2001:db8::9", match_any = True)))
+
+    def testAllPorts(self):
+        summary = self.summary("access-list a extended permit ip host 10.1.1.1 any\n")
+        self.assertTrue(summary.may_match(ACLQuery(sport = "12345", protocol = "tcp")))
+        self.assertFalse(self.summary(RULES.splitlines()[1]).may_match(ACLQuery(dport = "443")))
+
+    def testSelect(self):
+        first = self.write("first.acl", RULES)
+        second = self.write("second.acl", "access-list b extended permit tcp any host 10.9.9.9 eq 22\n")
+        summaries = ACLSummaries()
+        summaries.update([first, second])
+        self.assertEqual([second], summaries.select([first, second], ACLQuery(dip = "10.9.9.9")))
+        self.assertEqual([first, second], summaries.select([first, second], ACLQuery(protocol = "tcp")))
+
+    def testCache(self):
+        cache = os.path.join(self.directory, "cache")
+        path = self.write("tree/fw.acl", RULES)
+        summaries = ACLSummaries(cache = cache)
+        summaries.update([path])
+        summaries.save()
+        # nothing is written into the tree, the summaries are plain JSON
+        self.assertEqual(["fw.acl"], os.listdir(os.path.dirname(path)))
+        self.assertEqual(1, len(os.listdir(cache)))
+        with open(os.path.join(cache, os.listdir(cache)[0])) as f:
+            self.assertTrue(json.load(f)["files"]["fw.acl"])
+
+        # the summary is read back
+        summaries = ACLSummaries(cache = cache)
+        self.assertTrue(summaries.get(path).may_match(ACLQuery(dip = "10.1.1.1")))
+        self.assertFalse(summaries.get(path).may_match(ACLQuery(dip = "10.3.0.1")))
+        self.assertTrue(summaries.get(path).may_match(ACLQuery(sip = "10.9.9.9", match_any = True)))
+
+        # and thrown away when the file changed
+        self.write("tree/fw.acl", "access-list b extended permit tcp any host 10.9.9.9 eq 22\n")
+        os.utime(path, ns = (0, 0))
+        self.assertEqual(None, summaries.get(path))
+        summaries.update([path])
+        self.assertEqual([path], summaries.select([path], ACLQuery(dip = "10.9.9.9")))
+
+        # summaries of another parser are not used
+        self.assertEqual(None, ACLSummaries(RegexACLParser, cache = cache).get(path))
+
+        # a broken cache file is ignored
+        with open(os.path.join(cache, os.listdir(cache)[0]), "w") as f:
+            f.write("{broken")
+        self.assertEqual(None, ACLSummaries(cache = cache).get(path))
+
+    def testWalk(self):
+        paths = [self.write(name, "") for name in ("b/y.acl", "a/c/z.acl", "a/x.acl", "top.acl", ".git/config", "a/.hidden")]
+        self.assertEqual([paths[3], paths[2], paths[1], paths[0]], walk_files([self.directory]))
+        # files are taken as they are
+        self.assertEqual([paths[3], paths[0]], walk_files([paths[3], os.path.join(self.directory, "b")]))
+
+if __name__ == '__main__':
+    unittest.main()
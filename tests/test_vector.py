@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2013 Steffen Imhof, licensed under the MIT License (MIT)
+
+import array
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+# import aclgrep code from one directory above
+sys.path.append("..")
+from aclgrep import ACLFileIndex, ACLObjects, ACLParser, ACLQuery, ACLRule, PacketQuery, RuleTable, load_numpy
+from benchmarks.corpus import CorpusGenerator
+
+
+LINES = CorpusGenerator(5).mixed(3000) + [
+    "object-group network SERVERS",
+    " network-object 10.1.3.0 255.255.255.128",
+    " network-object host 2001:db8::10",
+    "object-group service WEBPORTS tcp",
+    " port-object eq www",
+    " port-object range 8000 8080",
+    "access-list outside extended permit tcp any object-group SERVERS object-group WEBPORTS",
+    "access-list outside extended permit udp object-group SERVERS any eq domain",
+    "access-list acl762 line 5 extended permit tcp any6 2001:db8::/32 eq ssh",
+    "access-list acl762 line 6 extended permit ip host 2001:db8::1 any4",
+    "access-list acl762 line 7 extended permit gre any any",
+    "access-list acl762 line 8 extended permit tcp host 10.1.1.300 any",
+]
+
+CRITERIA = [
+    (None, None, None, "443", "tcp"),
+    (None, None, None, None, "udp"),
+    (None, "1024", None, None, None),
+    ("10.1.3.5",),
+    (None, None, "10.1.3.5", "8080", "tcp"),
+    ("10.10.10.10", None, None, None, None, True),
+    ("2001:db8::1", None, None, "22", "tcp", True),
+    (None, None, "2001:db8::10"),
+    ("192.168.1.1", None, None, "53", "udp"),
+    (None, None, None, None, "gre"),
+    (None, None, None, None, "foo", True),
+]
+
+
+class table(unittest.TestCase):
+
+    def setUp(self):
+        objects = ACLObjects()
+        objects.read(LINES)
+        parser = ACLParser()
+        parser.use_objects(objects)
+        self.rules = [parser.parse_rule(line) for line in LINES]
+        self.table = parser.parse_rules(LINES)
+
+    def testRoundTrip(self):
+        self.assertEqual(len(LINES), len(self.table))
+        self.assertEqual(self.rules, list(self.table))
+        self.assertEqual(self.rules[-1], self.table[-1])
+        # the rules with object groups are kept as they are
+        self.assertEqual([3006, 3007], sorted(self.table.others))
+        self.assertEqual([rule.action for rule in self.rules], [self.table.action(n) for n in range(len(LINES))])
+
+    def testImmutable(self):
+        rule = self.table[3]
+        self.assertRaises(AttributeError, setattr, rule, "action", "deny")
+        self.assertEqual(rule, pickle.loads(pickle.dumps(rule)))
+        self.assertEqual(ACLRule(6, None, None, None, None), ACLRule(6, None, None, None, None, None))
+
+    def testPickle(self):
+        # the columns do not need numpy
+        self.assertTrue(all(isinstance(column, array.array) for column in self.table.columns.values()))
+        self.assertEqual(self.rules, list(pickle.loads(pickle.dumps(self.table))))
+
+    @unittest.skipIf(load_numpy() is None, "numpy is not installed")
+    def testSameAsMatches(self):
+        np = load_numpy()
+        for criteria in CRITERIA:
+            for query_class in (ACLQuery, PacketQuery):
+                query = query_class(*criteria)
+                expected = [n for n, rule in enumerate(self.rules) if query.matches(rule)]
+                self.assertEqual(expected, self.table.select(query, np), criteria)
+
+    @unittest.skipIf(load_numpy() is None, "numpy is not installed")
+    def testIndex(self):
+        handle, path = tempfile.mkstemp(suffix=".acl")
+        with os.fdopen(handle, "w") as f:
+            f.write("\n".join(LINES))
+        try:
+            index = ACLFileIndex(path, ACLParser())
+            for criteria in CRITERIA:
+                query = ACLQuery(*criteria)
+                index.vectorize = True
+                vectorized = index.query(query)
+                index.vectorize = False
+                self.assertEqual(index.query(query), vectorized, criteria)
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()